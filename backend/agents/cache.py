@@ -0,0 +1,127 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+# entries kept in process memory, the disk tier is unbounded unless LLM_CACHE_TTL is set
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "512"))
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "0")) or None
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    '''
+    langchain hands the cache the serialized messages (ids stripped) and the serialized
+    model with its call kwargs, so system prompt, history, tools and response format are
+    all part of the key
+    '''
+    return hashlib.blake2b(f"{llm_string}\0{prompt}".encode(), digest_size=16).hexdigest()
+
+
+class TieredLLMCache(BaseCache):
+    '''
+    response cache for the chat models, an lru of recent responses in memory in front of
+    a sqlite table. only worth it because every agent runs at temperature 0. values are
+    kept serialized in both tiers, langchain edits the generations it gets back from a hit.
+    '''
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_DB, max_entries: int = LLM_CACHE_SIZE, ttl: Optional[float] = LLM_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    def _remember(self, key: str, value: str, created_at: float):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _fresh(self, created_at: float) -> bool:
+        return self.ttl is None or time.time() - created_at <= self.ttl
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[1]):
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return loads(entry[0], allowed_objects="core")
+            row = None
+            if self.conn is not None:
+                row = self.conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or not self._fresh(row[1]):
+                self.misses += 1
+                return None
+            self._remember(key, row[0], row[1])
+            self.disk_hits += 1
+        return loads(row[0], allowed_objects="core")
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        # the message id of the original run would otherwise be replayed on every hit
+        value = dumps([self._without_id(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self.conn is not None:
+                self.conn.execute("INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?)", (key, value, now))
+
+    @staticmethod
+    def _without_id(generation: Any) -> Any:
+        message = getattr(generation, "message", None)
+        if message is None or message.id is None:
+            return generation
+        return generation.model_copy(update={"message": message.model_copy(update={"id": None})})
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self.conn is not None:
+                self.conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+
+_cache: Optional[TieredLLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> TieredLLMCache:
+    '''
+    the process-wide response cache, opened on first use
+    '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = TieredLLMCache()
+        return _cache
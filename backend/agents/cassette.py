@@ -0,0 +1,267 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessageChunk, BaseMessage, message_chunk_to_message, message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# file the exchanges are recorded to / replayed from, ".gz" files are gzip compressed
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "llm_cassette.jsonl.gz")
+# replay speed: 1 keeps the recorded latencies and inter-chunk gaps, 10 plays ten times
+# faster, 0 answers without waiting
+LLM_CASSETTE_SPEED = float(os.getenv("LLM_CASSETTE_SPEED", "1"))
+# a request with no exact recording gets the next recording of the same agent, unless strict
+LLM_CASSETTE_STRICT = os.getenv("LLM_CASSETTE_STRICT", "false").lower() == "true"
+
+
+class CassetteMiss(KeyError):
+    '''
+    raised on replay when nothing was recorded for a request
+    '''
+
+
+def exchange_key(model: str, messages: List[BaseMessage]) -> str:
+    # message ids are random per run, everything else of the prompt has to match
+    normalized = dumps([message.model_copy(update={"id": None}) for message in messages])
+    return hashlib.blake2b(f"{model}\0{normalized}".encode(), digest_size=16).hexdigest()
+
+
+def agent_label(messages: List[BaseMessage]) -> Optional[str]:
+    # the factory knows which agent a system prompt belongs to
+    from agents.factory import agent_for_prompt
+
+    if messages and messages[0].type == "system":
+        return agent_for_prompt(str(messages[0].content))
+    return None
+
+
+class Cassette:
+    '''
+    recorded llm exchanges, one json line each: the prompt key, the agent and model, the
+    final message, and for streamed calls every chunk as [ms since the call started,
+    content, tool call chunks, usage]. recording appends; replay serves exact matches in
+    recorded order and falls back to the agent's recordings one after another.
+    '''
+
+    def __init__(self, path: str = LLM_CASSETTE, strict: bool = LLM_CASSETTE_STRICT):
+        self.path = path
+        self.strict = strict
+        self._lock = threading.Lock()
+        self.entries: List[dict] = []
+        self._by_key: Dict[str, List[dict]] = {}
+        self._by_agent: Dict[str, List[dict]] = {}
+        self._cursors: Dict[str, int] = {}
+        self.counts = {"recorded": 0, "replayed": 0, "fallbacks": 0, "misses": 0}
+        if os.path.exists(path):
+            with self._open("rt") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def _open(self, mode: str):
+        return gzip.open(self.path, mode) if self.path.endswith(".gz") else open(self.path, mode)
+
+    def _index(self, entry: dict):
+        self.entries.append(entry)
+        self._by_key.setdefault(entry["key"], []).append(entry)
+        self._by_agent.setdefault(entry["agent"] or entry["model"], []).append(entry)
+
+    def record(self, entry: dict):
+        with self._lock:
+            # every append is its own gzip member, gzip readers join them
+            with self._open("at") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+            self._index(entry)
+            self.counts["recorded"] += 1
+
+    def _next(self, name: str, entries: List[dict]) -> dict:
+        position = self._cursors.get(name, 0)
+        self._cursors[name] = position + 1
+        return entries[position % len(entries)]
+
+    def find(self, key: str, agent: Optional[str], model: str) -> dict:
+        with self._lock:
+            if key in self._by_key:
+                self.counts["replayed"] += 1
+                return self._next(f"key:{key}", self._by_key[key])
+            fallback = self._by_agent.get(agent or model)
+            if fallback and not self.strict:
+                self.counts["fallbacks"] += 1
+                return self._next(f"agent:{agent or model}", fallback)
+            self.counts["misses"] += 1
+        raise CassetteMiss(f"no recorded exchange for {agent or model} ({key})")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "entries": len(self.entries), **self.counts}
+
+
+_cassette: Optional[Cassette] = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette:
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = Cassette()
+        return _cassette
+
+
+def _pack_chunk(offset: float, chunk: AIMessageChunk) -> list:
+    packed = [round(offset * 1000, 1), chunk.content, chunk.tool_call_chunks or None, chunk.usage_metadata or None]
+    # trailing empty fields are dropped, most chunks are just [ms, text]
+    while packed[-1] is None:
+        packed.pop()
+    return packed
+
+
+def _unpack_chunk(packed: list) -> AIMessageChunk:
+    content, tool_call_chunks, usage = (packed[1:] + [None, None])[:3]
+    return AIMessageChunk(content=content, tool_call_chunks=tool_call_chunks or [], usage_metadata=usage)
+
+
+class RecordingChatModel(BaseChatModel):
+    '''
+    passes every call through to the provider model and records the exchange, streamed
+    chunks with their timing included
+    '''
+
+    inner: BaseChatModel
+    model: str
+    cassette: Any = None
+
+    @property
+    def temperature(self):
+        return self.inner.temperature
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # same as CoalescingChatModel.bind_tools, the provider formats the tools
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _entry(self, messages: List[BaseMessage], mode: str, seconds: float, message: BaseMessage, chunks: Optional[list] = None) -> dict:
+        entry = {
+            "key": exchange_key(self.model, messages),
+            "agent": agent_label(messages),
+            "model": self.model,
+            "mode": mode,
+            "ms": round(seconds * 1000, 1),
+            "message": message_to_dict(message),
+        }
+        if chunks is not None:
+            entry["chunks"] = chunks
+        return entry
+
+    def _record_result(self, messages, started: float, result: ChatResult) -> ChatResult:
+        self.cassette.record(self._entry(messages, "invoke", time.monotonic() - started, result.generations[0].message))
+        return result
+
+    def _record_stream(self, messages, started: float, chunks: List[AIMessageChunk], packed: list):
+        if chunks:
+            merged = message_chunk_to_message(sum(chunks[1:], chunks[0]))
+            self.cassette.record(self._entry(messages, "stream", time.monotonic() - started, merged, packed))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.monotonic()
+        return self._record_result(messages, started, self.inner._generate(messages, stop=stop, **kwargs))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        started = time.monotonic()
+        return self._record_result(messages, started, await self.inner._agenerate(messages, stop=stop, **kwargs))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        started, chunks, packed = time.monotonic(), [], []
+        for chunk in self.inner._stream(messages, stop=stop, **kwargs):
+            chunks.append(chunk.message)
+            packed.append(_pack_chunk(time.monotonic() - started, chunk.message))
+            yield chunk
+        self._record_stream(messages, started, chunks, packed)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        started, chunks, packed = time.monotonic(), [], []
+        async for chunk in self.inner._astream(messages, stop=stop, **kwargs):
+            chunks.append(chunk.message)
+            packed.append(_pack_chunk(time.monotonic() - started, chunk.message))
+            yield chunk
+        self._record_stream(messages, started, chunks, packed)
+
+
+class ReplayChatModel(BaseChatModel):
+    '''
+    answers from a cassette without network access. streamed recordings are replayed
+    chunk by chunk at their recorded offsets divided by `speed`, invoke recordings after
+    their recorded latency; a recording made the other way is converted.
+    '''
+
+    model: str
+    temperature: float = 0
+    speed: float = LLM_CASSETTE_SPEED
+    cassette: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-replay"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "temperature": self.temperature}
+
+    def bind_tools(self, tools, **kwargs):
+        # the recorded answers already contain the tool calls
+        return self.bind()
+
+    def _lookup(self, messages: List[BaseMessage]) -> dict:
+        return self.cassette.find(exchange_key(self.model, messages), agent_label(messages), self.model)
+
+    def _delay(self, ms: float) -> float:
+        return ms / 1000 / self.speed if self.speed else 0.0
+
+    def _result(self, entry: dict) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=messages_from_dict([entry["message"]])[0])])
+
+    def _chunks(self, entry: dict) -> List[list]:
+        if "chunks" in entry:
+            return entry["chunks"]
+        message = entry["message"]["data"]
+        calls = [
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+            for i, call in enumerate(message.get("tool_calls", []))
+        ]
+        return [[entry["ms"], message["content"], calls or None, message.get("usage_metadata")]]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        entry = self._lookup(messages)
+        time.sleep(self._delay(entry["ms"]))
+        return self._result(entry)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        entry = self._lookup(messages)
+        await asyncio.sleep(self._delay(entry["ms"]))
+        return self._result(entry)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        started = time.monotonic()
+        for packed in self._chunks(self._lookup(messages)):
+            time.sleep(max(0.0, self._delay(packed[0]) - (time.monotonic() - started)))
+            yield ChatGenerationChunk(message=_unpack_chunk(packed))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        started = time.monotonic()
+        for packed in self._chunks(self._lookup(messages)):
+            await asyncio.sleep(max(0.0, self._delay(packed[0]) - (time.monotonic() - started)))
+            yield ChatGenerationChunk(message=_unpack_chunk(packed))
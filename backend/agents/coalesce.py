@@ -0,0 +1,464 @@
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import contextvars
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agents.scheduler import is_rate_limit_error
+from agents.deadlines import LLM_HEDGE_QUANTILE, DeadlineExceeded, hedged, latencies, remaining, within_deadline
+
+
+class _Flight:
+    '''
+    one provider call in progress: the chunks it streamed so far and, once done, its
+    result or error. waiters can be threads or coroutines on any event loop.
+
+    the call runs on its own (a task, or a thread for sync streams) and every caller, the
+    one that started it included, reads from the flight. callers going away only stop
+    the call once none of them is left.
+    '''
+
+    def __init__(self):
+        self.chunks: List[ChatGenerationChunk] = []
+        self.result: Optional[ChatResult] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        # callers reading from the flight, counted under the module's _lock
+        self.callers = 1
+        self.cancelled = False
+        self._task: Optional[asyncio.Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._cond = threading.Condition()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def run(self, coro):
+        # the task copies the starting caller's context: lane, session and deadline
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.ensure_future(coro)
+
+    def run_in_thread(self, fn, *args):
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(fn, *args), name="llm-flight", daemon=True).start()
+
+    def cancel(self):
+        # a sync producer checks the flag between chunks, a task is cancelled on its own loop
+        self.cancelled = True
+        if self._task is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+            except RuntimeError:  # the loop is gone, and the task with it
+                pass
+
+    def _notify(self):
+        self._cond.notify_all()
+        for loop, event in self._waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # the waiter's loop is gone
+                pass
+        self._waiters = []
+
+    def publish(self, chunk: ChatGenerationChunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._notify()
+
+    def finish(self, result: Optional[ChatResult] = None, error: Optional[BaseException] = None):
+        with self._cond:
+            self.result, self.error, self.done = result, error, True
+            self._notify()
+
+    def _ready(self, seen: int) -> bool:
+        return self.done or len(self.chunks) > seen
+
+    def wait(self, seen: int = -1, timeout: Optional[float] = None):
+        '''
+        blocks until there are more than `seen` chunks or the call is done, seen=-1 waits for the end
+        '''
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._ready(seen) if seen >= 0 else self.done, timeout):
+                raise DeadlineExceeded("the shared llm call did not answer within the deadline")
+
+    async def wait_async(self, seen: int = -1):
+        loop = asyncio.get_running_loop()
+        while True:
+            event = asyncio.Event()
+            with self._cond:
+                if (self._ready(seen) if seen >= 0 else self.done):
+                    return
+                self._waiters.append((loop, event))
+            await event.wait()
+
+    def take(self, seen: int) -> Tuple[List[ChatGenerationChunk], bool]:
+        with self._cond:
+            return self.chunks[seen:], self.done
+
+
+_flights: Dict[str, _Flight] = {}
+_lock = threading.Lock()
+_stats = {"calls": 0, "coalesced": 0}
+
+
+def _join(key: str) -> Tuple[_Flight, bool]:
+    '''
+    returns the flight for a key and whether the caller has to start the call itself
+    '''
+    with _lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            flight.callers += 1
+            _stats["coalesced"] += 1
+            return flight, False
+        flight = _flights[key] = _Flight()
+        _stats["calls"] += 1
+        return flight, True
+
+
+def _leave(key: str, flight: _Flight):
+    '''
+    a caller stops reading from a flight, the last one to go cancels the call if it still runs
+    '''
+    with _lock:
+        flight.callers -= 1
+        if flight.callers > 0 or flight.done:
+            return
+        # requests arriving from now on start a call of their own instead of joining this one
+        if key and _flights.get(key) is flight:
+            del _flights[key]
+    flight.cancel()
+
+
+def _land(key: str, flight: _Flight, result: Optional[ChatResult] = None, error: Optional[BaseException] = None):
+    # unregistered first, a request arriving after this starts a new call (or hits the cache)
+    with _lock:
+        if key and _flights.get(key) is flight:
+            del _flights[key]
+    flight.finish(result, error)
+
+
+def _failure(error: BaseException) -> BaseException:
+    # a call cancelled because its last caller left (or its loop shut down) must not hand
+    # CancelledError to a caller still reading it
+    return error if isinstance(error, Exception) else RuntimeError("the shared llm call was cancelled")
+
+
+def _copy(generation):
+    # every caller gets its own message objects, langchain stamps run ids onto them
+    return type(generation)(message=generation.message.model_copy(), generation_info=generation.generation_info)
+
+
+def _copy_result(result: ChatResult) -> ChatResult:
+    return ChatResult(generations=[_copy(g) for g in result.generations], llm_output=result.llm_output)
+
+
+def stats() -> dict:
+    with _lock:
+        calls, coalesced = _stats["calls"], _stats["coalesced"]
+        return {"calls": calls, "coalesced": coalesced, "in_flight": len(_flights)}
+
+
+def _usage(messages: List[BaseMessage]) -> Optional[int]:
+    totals = [m.usage_metadata["total_tokens"] for m in messages if getattr(m, "usage_metadata", None)]
+    return sum(totals) if totals else None
+
+
+def _settle(ticket, messages: List[BaseMessage], error: Optional[BaseException] = None):
+    # a call the provider turned away for rate limits used nothing, after any other failure
+    # the prompt may have been processed and the estimate stays charged
+    if ticket is not None:
+        ticket.settle(0 if error is not None and is_rate_limit_error(error) else _usage(messages))
+
+
+def _as_chunk(message: AIMessage) -> ChatGenerationChunk:
+    # the whole cached answer as one stream chunk, tool calls included
+    tool_chunks = [
+        tool_call_chunk(name=call["name"], args=json.dumps(call["args"]), id=call.get("id"), index=index)
+        for index, call in enumerate(message.tool_calls)
+    ]
+    return ChatGenerationChunk(message=AIMessageChunk(
+        content=message.content,
+        tool_call_chunks=tool_chunks,
+        response_metadata=message.response_metadata,
+        usage_metadata=message.usage_metadata,
+    ))
+
+
+def _prompt_text(messages: List[BaseMessage]) -> str:
+    return "".join(str(message.content) for message in messages)
+
+
+class CoalescingChatModel(BaseChatModel):
+    '''
+    single-flight wrapper around a chat model. concurrent requests with the same messages,
+    model settings and bound tools share one provider call: the first caller starts it,
+    every caller waits for its result, or replays its chunks as they arrive when streaming.
+    the response cache sits on this wrapper, so a coalesced result is cached once, and
+    with a scheduler (agents/scheduler.py) the call that does go out waits for its turn.
+    every wait and provider call honours the caller's deadline (agents/deadlines.py), and
+    with hedge set a slow invoke gets a duplicate request once it is past the p95.
+    '''
+
+    inner: BaseChatModel
+    scheduler: Optional[Any] = None
+    coalesce: bool = True
+    # only set for deterministic (temperature 0) models, a duplicate request must not change the answer
+    hedge: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return self.inner._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def bind_tools(self, tools, **kwargs):
+        # create_agent's ProviderStrategy asks for json output the openai way, gemini (and the
+        # fake model) take a response schema instead. the answer then streams in as text
+        # rather than as one tool call
+        response_format = kwargs.get("response_format") or {}
+        if response_format.get("type") == "json_schema" and "response_schema" in type(self.inner).model_fields:
+            kwargs = {key: value for key, value in kwargs.items() if key not in ("response_format", "strict")}
+            kwargs.update(response_mime_type="application/json", response_schema=response_format["json_schema"]["schema"])
+        # the provider formats the tools; the binding goes onto the wrapper so calls still pass through it
+        return self.bind(**self.inner.bind_tools(tools, **kwargs).kwargs)
+
+    def _key(self, mode: str, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        llm_string = self.inner._get_llm_string(stop=stop, **kwargs)
+        normalized = dumps([message.model_copy(update={"id": None}) for message in messages])
+        return hashlib.blake2b(f"{mode}\0{llm_string}\0{normalized}".encode(), digest_size=16).hexdigest()
+
+    def _join(self, mode: str, messages, stop, kwargs) -> Tuple[str, _Flight, bool]:
+        if not self.coalesce:
+            return "", _Flight(), True
+        key = self._key(mode, messages, stop, kwargs)
+        return (key, *_join(key))
+
+    def _failed(self, key: str, flight: _Flight, error: BaseException):
+        if self.scheduler is not None and is_rate_limit_error(error):
+            self.scheduler.throttled()
+        _land(key, flight, error=_failure(error))
+
+    def _provider_kwargs(self, kwargs: dict) -> dict:
+        # the provider enforces the deadline too, so a call we gave up on does not run on
+        left = remaining()
+        return kwargs if left is None else {**kwargs, "timeout": left}
+
+    def _latency_key(self, stop, kwargs) -> str:
+        # latencies are kept per model configuration (model, settings, bound tools), that is per agent
+        return hashlib.blake2b(self.inner._get_llm_string(stop=stop, **kwargs).encode(), digest_size=8).hexdigest()
+
+    #------------------------------------------------------------------CACHE HITS------------------------------------------------
+    # langchain answers a cache hit without streaming it, a client reading the stream of
+    # a repeated turn would get nothing. when a streaming callback is attached the cached
+    # answer is sent as one chunk
+    def _replay_v2_events_for_cache_hit(self, generations, *, run_manager=None, **kwargs) -> None:
+        super()._replay_v2_events_for_cache_hit(generations, run_manager=run_manager, **kwargs)
+        if self._should_stream(async_api=False, run_manager=run_manager, **kwargs) and not self._should_use_protocol_streaming(
+            async_api=False, run_manager=run_manager, **kwargs
+        ):
+            for generation in generations:
+                if isinstance(getattr(generation, "message", None), AIMessage):
+                    chunk = _as_chunk(generation.message)
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+
+    async def _areplay_v2_events_for_cache_hit(self, generations, *, run_manager=None, **kwargs) -> None:
+        await super()._areplay_v2_events_for_cache_hit(generations, run_manager=run_manager, **kwargs)
+        if self._should_stream(async_api=True, run_manager=run_manager, **kwargs) and not self._should_use_protocol_streaming(
+            async_api=True, run_manager=run_manager, **kwargs
+        ):
+            for generation in generations:
+                if isinstance(getattr(generation, "message", None), AIMessage):
+                    chunk = _as_chunk(generation.message)
+                    await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+
+    #------------------------------------------------------------------PROVIDER CALLS------------------------------------------------
+    # every ticket the scheduler grants is settled, also when the provider fails or the
+    # call is cancelled half way
+    def _call(self, messages, stop, kwargs) -> ChatResult:
+        ticket = self.scheduler.acquire(_prompt_text(messages)) if self.scheduler is not None else None
+        started = time.monotonic()
+        try:
+            result = self.inner._generate(messages, stop=stop, **self._provider_kwargs(kwargs))
+        except BaseException as error:
+            _settle(ticket, [], error)
+            raise
+        latencies.record(self._latency_key(stop, kwargs), time.monotonic() - started)
+        _settle(ticket, [g.message for g in result.generations])
+        return result
+
+    async def _acall(self, messages, stop, kwargs, ticket=None) -> ChatResult:
+        # one request of a hedged call, charged to its own ticket
+        if self.scheduler is not None and ticket is None:
+            ticket = await self.scheduler.aacquire(_prompt_text(messages))
+        started = time.monotonic()
+        try:
+            result = await self.inner._agenerate(messages, stop=stop, **self._provider_kwargs(kwargs))
+        except asyncio.CancelledError:
+            # the duplicate that lost (or the call given up): only the answer used is charged
+            if ticket is not None:
+                ticket.settle(0)
+            raise
+        except BaseException as error:
+            _settle(ticket, [], error)
+            raise
+        latencies.record(self._latency_key(stop, kwargs), time.monotonic() - started)
+        _settle(ticket, [g.message for g in result.generations])
+        return result
+
+    async def _ahedged(self, messages, stop, kwargs) -> ChatResult:
+        # the hedge timer starts once the first request is admitted, time spent queueing at
+        # the scheduler is not provider latency
+        ticket = await self.scheduler.aacquire(_prompt_text(messages)) if self.scheduler is not None else None
+        after = latencies.quantile(self._latency_key(stop, kwargs), LLM_HEDGE_QUANTILE) if self.hedge else None
+        try:
+            return await hedged(
+                lambda: self._acall(messages, stop, kwargs, ticket=ticket),
+                lambda: self._acall(messages, stop, kwargs),
+                after,
+            )
+        finally:
+            # the first request settles its ticket, unless it was cancelled before it started
+            if ticket is not None:
+                ticket.settle(0)
+
+    #------------------------------------------------------------------FLIGHTS------------------------------------------------
+    async def _afly(self, key: str, flight: _Flight, messages, stop, kwargs, stream: bool):
+        '''
+        makes the provider call of a flight and publishes it, as a task of its own
+        '''
+        try:
+            if stream:
+                await self._astream_call(flight, messages, stop, kwargs)
+                result = None
+            else:
+                result = await within_deadline(self._ahedged(messages, stop, kwargs))
+        except BaseException as error:
+            self._failed(key, flight, error)
+            # the error reached the callers through the flight, only cancellation ends the task with it
+            if not isinstance(error, Exception):
+                raise
+            return
+        _land(key, flight, result=result)
+
+    def _fly(self, key: str, flight: _Flight, messages, stop, kwargs):
+        # sync streams: the same as _afly, in a thread
+        try:
+            self._stream_call(flight, messages, stop, kwargs)
+        except BaseException as error:
+            self._failed(key, flight, error)
+            return
+        _land(key, flight)
+
+    def _stream_call(self, flight: _Flight, messages, stop, kwargs):
+        ticket = self.scheduler.acquire(_prompt_text(messages)) if self.scheduler is not None else None
+        chunks = []
+        try:
+            for chunk in self.inner._stream(messages, stop=stop, **self._provider_kwargs(kwargs)):
+                if flight.cancelled:
+                    raise RuntimeError("the shared llm call was cancelled")
+                chunks.append(chunk.message)
+                flight.publish(chunk)
+        except BaseException as error:
+            _settle(ticket, chunks, error)
+            raise
+        _settle(ticket, chunks)
+
+    async def _astream_call(self, flight: _Flight, messages, stop, kwargs):
+        ticket = None
+        if self.scheduler is not None:
+            ticket = await within_deadline(self.scheduler.aacquire(_prompt_text(messages)))
+        chunks = []
+        try:
+            stream = self.inner._astream(messages, stop=stop, **self._provider_kwargs(kwargs)).__aiter__()
+            while True:
+                try:
+                    chunk = await within_deadline(stream.__anext__())
+                except StopAsyncIteration:
+                    break
+                chunks.append(chunk.message)
+                flight.publish(chunk)
+        except BaseException as error:
+            _settle(ticket, chunks, error)
+            raise
+        _settle(ticket, chunks)
+
+    #------------------------------------------------------------------INVOKE------------------------------------------------
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # a sync caller is blocked in its own call and cannot leave it half way, so the
+        # first one makes the call inline
+        key, flight, leader = self._join("generate", messages, stop, kwargs)
+        try:
+            if not leader:
+                flight.wait(timeout=remaining())
+                if flight.error is not None:
+                    raise flight.error
+                return _copy_result(flight.result)
+            try:
+                result = self._call(messages, stop, kwargs)
+            except BaseException as error:
+                self._failed(key, flight, error)
+                raise
+            _land(key, flight, result=_copy_result(result))
+            return result
+        finally:
+            _leave(key, flight)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key, flight, leader = self._join("generate", messages, stop, kwargs)
+        try:
+            if leader:
+                flight.run(self._afly(key, flight, messages, stop, kwargs, stream=False))
+            await within_deadline(flight.wait_async())
+            if flight.error is not None:
+                raise flight.error
+            return _copy_result(flight.result)
+        finally:
+            _leave(key, flight)
+
+    #------------------------------------------------------------------STREAM------------------------------------------------
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        key, flight, leader = self._join("stream", messages, stop, kwargs)
+        try:
+            if leader:
+                flight.run_in_thread(self._fly, key, flight, messages, stop, kwargs)
+            seen = 0
+            while True:
+                flight.wait(seen, timeout=remaining())
+                chunks, done = flight.take(seen)
+                for chunk in chunks:
+                    yield _copy(chunk)
+                seen += len(chunks)
+                if done and not chunks:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            _leave(key, flight)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        key, flight, leader = self._join("stream", messages, stop, kwargs)
+        try:
+            if leader:
+                flight.run(self._afly(key, flight, messages, stop, kwargs, stream=True))
+            seen = 0
+            while True:
+                await within_deadline(flight.wait_async(seen))
+                chunks, done = flight.take(seen)
+                for chunk in chunks:
+                    yield _copy(chunk)
+                seen += len(chunks)
+                if done and not chunks:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            _leave(key, flight)
@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+# a hedged duplicate goes out once a call has run longer than this quantile of recent calls
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+# hedging waits for this many latency samples of a model before it kicks in
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+T = TypeVar("T")
+
+# absolute time.monotonic() by which the current llm work has to be done
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    '''
+    raised when an llm call (including its wait for the scheduler) runs past its deadline
+    '''
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    '''
+    every llm call inside the block has to finish within `seconds` from now. an enclosing
+    deadline that ends sooner still wins; None or 0 leaves the current deadline alone
+    '''
+    if not seconds:
+        yield
+        return
+    end = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(end if current is None else min(current, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def with_deadline(seconds: Optional[float]):
+    '''
+    decorator form of deadline() for async graph nodes
+    '''
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with deadline(seconds):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def remaining() -> Optional[float]:
+    '''
+    seconds left before the current deadline, None without one
+    '''
+    end = _deadline.get()
+    if end is None:
+        return None
+    left = end - time.monotonic()
+    if left <= 0:
+        count("deadline_exceeded")
+        raise DeadlineExceeded("llm deadline exceeded")
+    return left
+
+
+async def within_deadline(awaitable: Awaitable[T]) -> T:
+    left = remaining()
+    if left is None:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        count("deadline_exceeded")
+        raise DeadlineExceeded("llm call did not finish within its deadline") from None
+
+
+class LatencyTracker:
+    '''
+    rolling window of call latencies per model configuration
+    '''
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW, min_samples: int = LLM_HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+latencies = LatencyTracker()
+_stats = {"hedged": 0, "hedge_wins": 0, "deadline_exceeded": 0}
+_stats_lock = threading.Lock()
+
+
+def count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+async def hedged(primary: Callable[[], Awaitable[T]], backup: Callable[[], Awaitable[T]], after: Optional[float]) -> T:
+    '''
+    runs primary(); if it has not answered after `after` seconds, backup() (an identical
+    request) is started as well and whichever answers first wins, the other is cancelled.
+    a failure of one only counts once the other one failed too. only for idempotent calls.
+    '''
+    first = asyncio.ensure_future(primary())
+    pending = {first}
+    try:
+        if after is not None:
+            done, _ = await asyncio.wait(pending, timeout=after)
+            if not done:
+                count("hedged")
+                pending.add(asyncio.ensure_future(backup()))
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        count("hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
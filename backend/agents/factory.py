@@ -0,0 +1,204 @@
+import os
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from dotenv import load_dotenv
+from agents.cache import get_llm_cache
+from agents.coalesce import CoalescingChatModel
+from agents.scheduler import get_scheduler
+
+load_dotenv()
+
+# every agent runs on this model unless its spec names another one
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "gemini-2.5-flash")
+# "google" calls gemini, "fake" answers offline from agents/fake.py (benchmarks, local runs)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "google")
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# agent responses are cached (agents/cache.py) unless LLM_CACHE is off or the agent is
+# listed in LLM_CACHE_SKIP, e.g. LLM_CACHE_SKIP=planner,coder
+LLM_CACHE = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_SKIP = {name.strip() for name in os.getenv("LLM_CACHE_SKIP", "").split(",") if name.strip()}
+# identical requests in flight at the same time share one provider call (agents/coalesce.py)
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() == "true"
+# provider calls wait for rate-limit budget and their lane (agents/scheduler.py)
+LLM_SCHEDULER = os.getenv("LLM_SCHEDULER", "true").lower() == "true"
+# slow invokes of deterministic models get a duplicate request once past their p95 (agents/deadlines.py)
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() == "true"
+# "record" saves every provider exchange to the LLM_CASSETTE file, "replay" answers from
+# it without network access (agents/cassette.py); record with LLM_CACHE=false, cache hits
+# never reach the provider
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")
+
+_lock = threading.RLock()
+# (model, sorted params) -> chat model
+_models: Dict[Tuple, Any] = {}
+# (model, cached, sorted params) -> the model wrapped for the cache, coalescing and the scheduler
+_managed: Dict[Tuple, Any] = {}
+# (name, model) -> built agent, name -> kwargs it is built from, name -> agent swapped in by set_agent
+_agents: Dict[Tuple[str, str], Any] = {}
+_specs: Dict[str, dict] = {}
+_overrides: Dict[str, Any] = {}
+# system prompt -> name of the built agent using it, cassettes label exchanges with it
+_prompts: Dict[str, str] = {}
+
+
+def _build_model(model: str, params: dict):
+    if LLM_CASSETTE_MODE == "replay":
+        from agents.cassette import ReplayChatModel, get_cassette
+
+        return ReplayChatModel(model=model, temperature=params.get("temperature", 0), cassette=get_cassette())
+    if LLM_CASSETTE_MODE == "record":
+        from agents.cassette import RecordingChatModel, get_cassette
+
+        return RecordingChatModel(inner=_build_provider_model(model, params), model=model, cassette=get_cassette())
+    return _build_provider_model(model, params)
+
+
+def _build_provider_model(model: str, params: dict):
+    if LLM_PROVIDER == "fake":
+        from agents.fake import FakeChatModel
+
+        return FakeChatModel.from_env(model, **{"temperature": 0, "max_retries": LLM_MAX_RETRIES, **params})
+
+    # langchain_google_genai pulls in the grpc stack, so it is only imported on first use
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    if "GOOGLE_API_KEY" not in os.environ and os.getenv("GEMINI_API_KEY"):
+        os.environ["GOOGLE_API_KEY"] = os.environ["GEMINI_API_KEY"]
+    params = {"temperature": 0, "max_tokens": None, "timeout": None, "max_retries": LLM_MAX_RETRIES, **params}
+    base = next(iter(_models.values()), None)
+    # a recording model wraps the provider's
+    base = getattr(base, "inner", base)
+    if base is not None:
+        # every ChatGoogleGenerativeAI opens its own grpc channels; model_copy skips the
+        # validator that builds the sync client, so all configurations share the first
+        # model's. the async client is built lazily, on first use and only inside a running
+        # event loop, into a plain field that model_copy copies: it is built on the base
+        # before copying, or every copy would open a channel of its own. models copied
+        # outside an event loop (sync callers) still build their own async client
+        if base.async_client_running is None and _event_loop_running():
+            base.async_client
+        return base.model_copy(update={"model": f"models/{model}", **params})
+    return ChatGoogleGenerativeAI(model=model, **params)
+
+
+def _event_loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def get_llm(model: str = DEFAULT_MODEL, **params):
+    '''
+    returns the chat model for this configuration, built on first use and shared afterwards
+    '''
+    key = (model, tuple(sorted(params.items())))
+    with _lock:
+        if key not in _models:
+            _models[key] = _build_model(model, params)
+        return _models[key]
+
+
+def get_managed_llm(model: str = DEFAULT_MODEL, cache: bool = True, **params):
+    '''
+    the chat model agents run on: responses cached (cache=False opts out), identical
+    in-flight calls coalesced, provider calls admitted by the scheduler, deadlines enforced
+    and slow calls hedged
+    '''
+    key = (model, cache, tuple(sorted(params.items())))
+    with _lock:
+        if key not in _managed:
+            llm_cache = get_llm_cache() if LLM_CACHE and cache else False
+            inner = get_llm(model, **params)
+            # the cache goes on the wrapper, so a cache hit never joins a flight or waits its turn
+            _managed[key] = CoalescingChatModel(
+                inner=inner,
+                cache=llm_cache,
+                scheduler=get_scheduler() if LLM_SCHEDULER else None,
+                coalesce=LLM_COALESCE,
+                hedge=LLM_HEDGE and inner.temperature == 0,
+            )
+        return _managed[key]
+
+
+def register_agent(
+    name: str,
+    system_prompt: Callable[[], str],
+    tools: Sequence = (),
+    response_format: Optional[type] = None,
+    model: str = DEFAULT_MODEL,
+    cache: bool = True,
+    **params,
+):
+    '''
+    declares an agent without building it, get_agent(name) builds it the first time it is needed.
+    registering a name again drops the agent built from the old spec. cache=False opts the
+    agent out of the response cache, for agents whose output should vary between calls.
+    '''
+    with _lock:
+        _specs[name] = {
+            "system_prompt": system_prompt,
+            "tools": list(tools),
+            "response_format": response_format,
+            "model": model,
+            "cache": cache,
+            "params": params,
+        }
+        for key in [key for key in _agents if key[0] == name]:
+            del _agents[key]
+
+
+def get_agent(name: str, model: Optional[str] = None):
+    '''
+    the agent registered under name, on its spec's model unless `model` names another one
+    (agents/router.py picks it per call); each (agent, model) pair is built once
+    '''
+    with _lock:
+        if name in _overrides:
+            return _overrides[name]
+        spec = _specs[name]
+        key = (name, model or spec["model"])
+        if key not in _agents:
+            # create_agent compiles a langgraph graph, which is the slow part of importing the app
+            from langchain.agents import create_agent
+
+            cached = spec["cache"] and name not in LLM_CACHE_SKIP
+            system_prompt = spec["system_prompt"]()
+            _prompts[system_prompt] = name
+            _agents[key] = create_agent(
+                model=get_managed_llm(key[1], cache=cached, **spec["params"]),
+                system_prompt=system_prompt,
+                tools=spec["tools"],
+                response_format=spec["response_format"],
+                checkpointer=False,
+            # an agent call is one step of a node. run as a subgraph it would inherit the
+            # graph's checkpointer and store its whole message list under a new namespace on
+            # every call, which retention never prunes. a configurable of its own replaces
+            # the graph's (checkpointer, namespace, durability) so it runs standalone;
+            # callbacks and tags still reach the graph's event stream
+            ).with_config(configurable={"agent": name})
+        return _agents[key]
+
+
+def set_agent(name: str, agent):
+    '''
+    swaps in a ready-made agent under a name, e.g. a fake one for local runs
+    '''
+    with _lock:
+        _overrides[name] = agent
+
+
+def agent_for_prompt(system_prompt: str) -> Optional[str]:
+    '''
+    name of the built agent running on this system prompt, None for direct model calls
+    '''
+    with _lock:
+        return _prompts.get(system_prompt)
+
+
+def stats() -> dict:
+    with _lock:
+        return {"models": len(_models), "managed_models": len(_managed), "agents": sorted(f"{name}@{model}" for name, model in _agents), "registered": sorted(_specs)}
@@ -0,0 +1,255 @@
+import os
+import json
+import math
+import time
+import random
+import asyncio
+from typing import Any, Dict, Iterator, AsyncIterator, List, Optional, Tuple
+
+from pydantic import PrivateAttr
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+# stand-in provider settings, read when LLM_PROVIDER=fake (see agents/factory.py)
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0"))
+# a FAKE_LLM_SPIKE_RATE share of the calls waits FAKE_LLM_SPIKE times as long, a heavy tail
+FAKE_LLM_SPIKE_RATE = float(os.getenv("FAKE_LLM_SPIKE_RATE", "0"))
+FAKE_LLM_SPIKE = float(os.getenv("FAKE_LLM_SPIKE", "10"))
+FAKE_LLM_TPS = float(os.getenv("FAKE_LLM_TPS", "0"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "200"))
+FAKE_LLM_ERROR_RATE = float(os.getenv("FAKE_LLM_ERROR_RATE", "0"))
+FAKE_LLM_RATE_LIMIT_RATE = float(os.getenv("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+# a json list (or jsonl) of scripted responses, served in order and then from the top again
+FAKE_LLM_RESPONSES = os.getenv("FAKE_LLM_RESPONSES", "")
+FAKE_LLM_SEED = os.getenv("FAKE_LLM_SEED", "")
+
+DEFAULT_TEMPLATE = "Answer {n} from {model} to: {query}\n"
+# streamed chunks are grouped so one sleep covers at least this long, asyncio timers are
+# not precise enough for a chunk per token at high rates
+MIN_CHUNK_SECONDS = 0.005
+
+
+class FakeProviderError(RuntimeError):
+    '''
+    an injected provider failure
+    '''
+
+
+class ResourceExhausted(FakeProviderError):
+    '''
+    an injected rate limit, named like google.api_core's so the scheduler backs off on it
+    '''
+
+
+def load_responses(path: str) -> List[str]:
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def fill_schema(schema: dict, label: str, query: str) -> Any:
+    '''
+    a value of the json schema's shape, strings say which field they are and what was asked
+    '''
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: fill_schema(field, name, query) for name, field in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [fill_schema(schema.get("items", {}), f"{label} {i}", query) for i in range(1, 4)]
+    if kind == "integer":
+        return 1
+    if kind == "number":
+        return 1.0
+    if kind == "boolean":
+        return True
+    if "enum" in schema:
+        return schema["enum"][0]
+    return f"{label} for: {query[:80]}"
+
+
+class FakeChatModel(BaseChatModel):
+    '''
+    offline stand-in for ChatGoogleGenerativeAI. it answers from a script or a template,
+    fills the schema of the first bound tool for structured output, or writes the json of
+    `response_schema` as its text in json mode the way gemini does, streams at `tokens_per_second` after
+    `latency` seconds, and fails a share of the calls on purpose. tokens are words of the
+    answer, usage is reported the way the provider does.
+    '''
+
+    model: str = "fake"
+    temperature: float = 0
+    max_tokens: Optional[int] = None
+    timeout: Optional[float] = None
+    max_retries: int = 0
+    # gemini's json mode, usually bound per call
+    response_mime_type: Optional[str] = None
+    response_schema: Optional[Dict[str, Any]] = None
+    responses: List[str] = []
+    template: str = DEFAULT_TEMPLATE
+    # templated answers are padded to this many tokens
+    response_tokens: int = 200
+    latency: float = 0.0
+    # latency is scaled by a random factor in [1 - jitter, 1 + jitter]
+    jitter: float = 0.0
+    spike_rate: float = 0.0
+    spike: float = 10.0
+    # 0 streams the whole answer at once
+    tokens_per_second: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: Optional[int] = None
+
+    _calls: int = PrivateAttr(default=0)
+    _random: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, __context):
+        self._random = random.Random(self.seed)
+
+    @classmethod
+    def from_env(cls, model: str, **params) -> "FakeChatModel":
+        settings = {
+            "latency": FAKE_LLM_LATENCY,
+            "jitter": FAKE_LLM_JITTER,
+            "spike_rate": FAKE_LLM_SPIKE_RATE,
+            "spike": FAKE_LLM_SPIKE,
+            "tokens_per_second": FAKE_LLM_TPS,
+            "response_tokens": FAKE_LLM_TOKENS,
+            "error_rate": FAKE_LLM_ERROR_RATE,
+            "rate_limit_rate": FAKE_LLM_RATE_LIMIT_RATE,
+            "responses": load_responses(FAKE_LLM_RESPONSES) if FAKE_LLM_RESPONSES else [],
+            "seed": int(FAKE_LLM_SEED) if FAKE_LLM_SEED else None,
+        }
+        return cls(model=model, **{**settings, **params})
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "temperature": self.temperature}
+
+    def bind_tools(self, tools, *, tool_choice=None, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], tool_choice=tool_choice, **kwargs)
+
+    #------------------------------------------------------------------ANSWER------------------------------------------------
+    def _answer(self, messages: List[BaseMessage], tools: Optional[list], response_schema: Optional[dict] = None) -> Tuple[str, Optional[dict], int]:
+        '''
+        (text, tool call, completion tokens) of the next answer
+        '''
+        self._calls += 1
+        query = next((str(m.content) for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        response_schema = response_schema or self.response_schema
+        if response_schema:
+            text = json.dumps(fill_schema(response_schema, response_schema.get("title", "response"), query))
+            return text, None, len(text.split())
+        if tools:
+            function = tools[0]["function"]
+            args = fill_schema(function.get("parameters", {}), function["name"], query)
+            call = {"name": function["name"], "args": args, "id": f"call_{self._calls}"}
+            return "", call, len(json.dumps(args).split())
+        if self.responses:
+            text = self.responses[(self._calls - 1) % len(self.responses)]
+        else:
+            text = self.template.format(n=self._calls, model=self.model, query=query[:200])
+            words = len(text.split())
+            if words < self.response_tokens:
+                text += " ".join(f"token{i}" for i in range(words, self.response_tokens)) + "\n"
+        return text, None, len(text.split())
+
+    def _first_token_delay(self) -> float:
+        if self.rate_limit_rate and self._random.random() < self.rate_limit_rate:
+            raise ResourceExhausted("429 fake rate limit")
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise FakeProviderError("fake provider error")
+        delay = self.latency * (1 + self.jitter * (2 * self._random.random() - 1))
+        if self.spike_rate and self._random.random() < self.spike_rate:
+            delay *= self.spike
+        return delay
+
+    def _usage(self, messages: List[BaseMessage], completion: int) -> dict:
+        prompt = sum(len(str(m.content).split()) for m in messages)
+        return {"input_tokens": prompt, "output_tokens": completion, "total_tokens": prompt + completion}
+
+    def _message(self, messages, text: str, call: Optional[dict], completion: int) -> AIMessage:
+        return AIMessage(content=text, tool_calls=[call] if call else [], usage_metadata=self._usage(messages, completion))
+
+    def _pieces(self, text: str, call: Optional[dict]) -> Iterator[Tuple[str, float]]:
+        '''
+        (piece, seconds before it) of a streamed answer, tool call args stream as their json
+        '''
+        body = json.dumps(call["args"]) if call else text
+        tokens = body.split(" ")
+        tokens = [token + " " for token in tokens[:-1]] + tokens[-1:]
+        if not self.tokens_per_second:
+            yield "".join(tokens), 0.0
+            return
+        size = max(1, math.ceil(self.tokens_per_second * MIN_CHUNK_SECONDS))
+        for start in range(0, len(tokens), size):
+            piece = tokens[start:start + size]
+            yield "".join(piece), len(piece) / self.tokens_per_second
+
+    def _chunk(self, piece: str, call: Optional[dict], first: bool) -> AIMessageChunk:
+        if call is None:
+            return AIMessageChunk(content=piece)
+        return AIMessageChunk(content="", tool_call_chunks=[{
+            "name": call["name"] if first else None,
+            "args": piece,
+            "id": call["id"] if first else None,
+            "index": 0,
+        }])
+
+    def _check_timeout(self, started: float, timeout: Optional[float]):
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError("fake provider timed out")
+
+    #------------------------------------------------------------------SYNC------------------------------------------------
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, timeout=None, response_schema=None, **kwargs) -> ChatResult:
+        text, call, completion = self._answer(messages, tools, response_schema)
+        duration = self._first_token_delay() + sum(seconds for _, seconds in self._pieces(text, call))
+        if timeout is not None and duration > timeout:
+            time.sleep(timeout)
+            raise TimeoutError("fake provider timed out")
+        time.sleep(duration)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text, call, completion))])
+
+    def _stream(self, messages, stop=None, run_manager=None, tools=None, timeout=None, response_schema=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        started = time.monotonic()
+        text, call, completion = self._answer(messages, tools, response_schema)
+        time.sleep(self._first_token_delay())
+        for i, (piece, seconds) in enumerate(self._pieces(text, call)):
+            time.sleep(seconds)
+            self._check_timeout(started, timeout)
+            chunk = ChatGenerationChunk(message=self._chunk(piece, call, i == 0))
+            if run_manager:
+                run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, completion)))
+
+    #------------------------------------------------------------------ASYNC------------------------------------------------
+    async def _agenerate(self, messages, stop=None, run_manager=None, tools=None, timeout=None, response_schema=None, **kwargs) -> ChatResult:
+        text, call, completion = self._answer(messages, tools, response_schema)
+        duration = self._first_token_delay() + sum(seconds for _, seconds in self._pieces(text, call))
+        if timeout is not None and duration > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError("fake provider timed out")
+        await asyncio.sleep(duration)
+        return ChatResult(generations=[ChatGeneration(message=self._message(messages, text, call, completion))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, tools=None, timeout=None, response_schema=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        started = time.monotonic()
+        text, call, completion = self._answer(messages, tools, response_schema)
+        await asyncio.sleep(self._first_token_delay())
+        for i, (piece, seconds) in enumerate(self._pieces(text, call)):
+            await asyncio.sleep(seconds)
+            self._check_timeout(started, timeout)
+            chunk = ChatGenerationChunk(message=self._chunk(piece, call, i == 0))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece, chunk=chunk)
+            yield chunk
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, completion)))
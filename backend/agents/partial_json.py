@@ -0,0 +1,74 @@
+import json
+from typing import List, Optional, Tuple
+
+
+class ListItemParser:
+    '''
+    incremental parser for a json object whose fields are lists of strings, like the
+    architect's structured output. feed() takes the next piece of the json as the model
+    writes it and returns every list item the piece completed as (field, index, value), so
+    items can be shown long before the object is closed. text before the opening brace
+    (a ```json fence) is skipped, nested values and non-string items are ignored.
+    '''
+
+    def __init__(self):
+        self.started = False
+        # stack of open containers, "{" or "["
+        self.stack: List[str] = []
+        self.in_string = False
+        self.escape = False
+        self.literal: List[str] = []
+        # top-level key being read or last read, and whether the next string is a key
+        self.field: Optional[str] = None
+        self.expect_key = False
+        self.counts = {}
+
+    def _close_string(self) -> Optional[Tuple[str, int, str]]:
+        value = json.loads("".join(self.literal))
+        self.literal = []
+        if self.stack == ["{"]:
+            if self.expect_key:
+                self.field = value
+                self.expect_key = False
+            return None
+        if self.stack == ["{", "["] and self.field is not None:
+            index = self.counts.get(self.field, 0)
+            self.counts[self.field] = index + 1
+            return self.field, index, value
+        return None
+
+    def feed(self, text: str) -> List[Tuple[str, int, str]]:
+        items = []
+        for char in text:
+            if not self.started:
+                if char != "{":
+                    continue
+                self.started = True
+            if self.in_string:
+                self.literal.append(char)
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    item = self._close_string()
+                    if item is not None:
+                        items.append(item)
+            elif char == '"':
+                self.in_string = True
+                self.literal.append(char)
+            elif char in "{[":
+                self.stack.append(char)
+                if self.stack == ["{"]:
+                    self.expect_key = True
+            elif char in "}]":
+                if self.stack:
+                    self.stack.pop()
+            elif char == "," and self.stack == ["{"]:
+                self.expect_key = True
+        return items
+
+    @property
+    def done(self) -> bool:
+        return self.started and not self.stack
@@ -0,0 +1,215 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+from agents.cache import LLM_CACHE_DB
+
+logger = logging.getLogger(__name__)
+
+# a first-turn query at least this similar (cosine of tf-idf vectors) to an earlier one
+# reuses that query's goals instead of calling the architect
+QUERY_CACHE_THRESHOLD = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.85"))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2000"))
+# lookups slower than this are counted (and logged) as over budget
+QUERY_CACHE_BUDGET_MS = float(os.getenv("QUERY_CACHE_BUDGET_MS", "5"))
+# features are hashed into this many buckets, so the index needs no vocabulary
+QUERY_CACHE_DIM = int(os.getenv("QUERY_CACHE_DIM", "2048"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+# filler that every request shares, left in it drowns out the words that tell requests apart
+_STOPWORDS = frozenset(
+    "a an the with in on for of to and or i we want need please make build create using use me my some that".split()
+)
+# "with offline sync" / "without offline sync" share almost every feature, so two queries
+# only match when they hold as many negations
+_NEGATIONS = frozenset(
+    "no not without never none nor non dont doesnt cannot cant except excluding exclude skip".split()
+)
+
+
+def features(text: str) -> List[str]:
+    '''
+    content words (counted twice) and their character trigrams. hyphens are dropped first
+    and the trigrams let "todo" / "todos" and "react" / "reactjs" overlap
+    '''
+    words = [word for word in _WORD.findall(text.lower().replace("-", "")) if word not in _STOPWORDS]
+    grams = words * 2
+    for word in words:
+        padded = f" {word} "
+        grams += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    return grams
+
+
+def negations(text: str) -> int:
+    return sum(word in _NEGATIONS for word in _WORD.findall(text.lower().replace("'", "")))
+
+
+class QueryIndex:
+    '''
+    similarity index over earlier first-turn queries and the architect output they got.
+    queries become hashed tf-idf vectors, a lookup is one matrix-vector product against
+    all stored queries. entries live in memory and, given a path, in a sqlite table so
+    restarts and other workers start warm. the oldest entries go once max_entries is hit.
+    a match above the threshold still misses when one query negates more than the other.
+    '''
+
+    def __init__(
+        self,
+        path: Optional[str] = LLM_CACHE_DB,
+        threshold: float = QUERY_CACHE_THRESHOLD,
+        max_entries: int = QUERY_CACHE_SIZE,
+        dim: int = QUERY_CACHE_DIM,
+        budget_ms: float = QUERY_CACHE_BUDGET_MS,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self.budget_ms = budget_ms
+        self._lock = threading.Lock()
+        self._queries: List[str] = []
+        self._values: List[Any] = []
+        self._negations: List[int] = []
+        # raw term counts per query, document frequencies per bucket
+        self._counts = np.zeros((0, dim), dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.float32)
+        self._oldest = 0
+        # l2-normalized tf-idf rows, rebuilt lazily after inserts since the idf moves
+        self._matrix: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self.lookups = 0
+        self.hits = 0
+        self.over_budget = 0
+        self._latencies: List[float] = []
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_cache (query TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            rows = self.conn.execute(
+                "SELECT query, value FROM query_cache ORDER BY created_at DESC LIMIT ?", (max_entries,)
+            ).fetchall()
+            for query, value in reversed(rows):
+                self._append(query, json.loads(value))
+            self._weighted()
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        buckets = [zlib.crc32(gram.encode()) % self.dim for gram in features(text)]
+        np.add.at(vector, buckets, 1.0)
+        # sublinear tf, a query that repeats a word is not about that word twice as much
+        return np.log1p(vector)
+
+    def _append(self, query: str, value: Any):
+        counts = self._vector(query)
+        if len(self._queries) < self.max_entries:
+            slot = len(self._queries)
+            if slot == len(self._counts):
+                # grow by doubling, appending row by row would copy the matrix every insert
+                grown = np.zeros((min(max(2 * slot, 64), self.max_entries), self.dim), dtype=np.float32)
+                grown[:slot] = self._counts
+                self._counts = grown
+            self._queries.append(query)
+            self._values.append(value)
+            self._negations.append(negations(query))
+        else:
+            # full, the new query takes the slot of the oldest one
+            slot = self._oldest
+            self._oldest = (slot + 1) % self.max_entries
+            self._df -= self._counts[slot] > 0
+            self._queries[slot], self._values[slot] = query, value
+            self._negations[slot] = negations(query)
+        self._counts[slot] = counts
+        self._df += counts > 0
+        self._matrix = None
+
+    def _weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._matrix is None:
+            n = len(self._queries)
+            self._idf = np.log((1 + n) / (1 + self._df)) + 1
+            matrix = self._counts[:n] * self._idf
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.maximum(norms, 1e-12)
+        return self._matrix, self._idf
+
+    def lookup(self, query: str) -> Optional[Any]:
+        '''
+        returns the value stored for the most similar earlier query, or None when nothing
+        clears the threshold
+        '''
+        started = time.perf_counter()
+        score, value = 0.0, None
+        with self._lock:
+            if self._queries:
+                matrix, idf = self._weighted()
+                vector = self._vector(query) * idf
+                vector /= max(float(np.linalg.norm(vector)), 1e-12)
+                scores = matrix @ vector
+                score = float(scores.max())
+                negated = negations(query)
+                # best first among the queries over the threshold
+                for candidate in sorted(np.flatnonzero(scores >= self.threshold), key=lambda i: -scores[i]):
+                    if self._negations[candidate] == negated:
+                        value = self._values[candidate]
+                        score = float(scores[candidate])
+                        break
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.lookups += 1
+            self.hits += value is not None
+            self.over_budget += elapsed_ms > self.budget_ms
+            self._latencies = (self._latencies + [elapsed_ms])[-1000:]
+        log = logger.warning if elapsed_ms > self.budget_ms else logger.debug
+        log("query cache %s, score %.3f, %.2f ms over %d queries", "hit" if value is not None else "miss", score, elapsed_ms, len(self._queries))
+        return value
+
+    def add(self, query: str, value: Any):
+        '''
+        value has to be json serializable when the index is persisted
+        '''
+        with self._lock:
+            self._append(query, value)
+            # rebuilt here, after the llm call, rather than on the next request's lookup
+            self._weighted()
+            if self.conn is not None:
+                self.conn.execute("INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?)", (query, json.dumps(value), time.time()))
+                self.conn.execute(
+                    "DELETE FROM query_cache WHERE query NOT IN (SELECT query FROM query_cache ORDER BY created_at DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+
+    def stats(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "entries": len(self._queries),
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "over_budget": self.over_budget,
+                "p50_ms": latencies[len(latencies) // 2] if latencies else 0.0,
+                "p95_ms": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+            }
+
+
+_index: Optional[QueryIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_query_index() -> QueryIndex:
+    '''
+    the process-wide first-turn query index, loaded on first use
+    '''
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = QueryIndex()
+        return _index
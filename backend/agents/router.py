@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from agents.deadlines import remaining
+from agents.factory import DEFAULT_MODEL
+
+
+def _pairs(value: str) -> List[Tuple[str, str]]:
+    return [tuple(item.strip().split("=", 1)) for item in value.split(",") if "=" in item]
+
+
+# tier -> model, listed fastest first
+MODEL_TIERS = dict(_pairs(os.getenv("MODEL_TIERS", f"fast=gemini-2.5-flash-lite,standard={DEFAULT_MODEL},large=gemini-2.5-pro")))
+# route -> tier it starts from. architect turns are short clarifications, the planner's
+# first answer is the full blueprint, its revisions and the history summaries are smaller;
+# the sectioned planner writes a short outline and then one section per call
+MODEL_ROUTES = dict(_pairs(os.getenv("MODEL_ROUTES", "architect=fast,planner=large,planner_revision=standard,planner_outline=fast,planner_section=standard,summary=fast")))
+# prompts (estimated tokens) over a tier's limit go to the next bigger tier
+ROUTE_MAX_PROMPT_TOKENS = {tier: int(limit) for tier, limit in _pairs(os.getenv("ROUTE_MAX_PROMPT_TOKENS", "fast=16000"))}
+# a tier whose p95 for a route would use more than this share of the remaining deadline
+# is skipped for the next faster one
+ROUTE_DEADLINE_SHARE = float(os.getenv("ROUTE_DEADLINE_SHARE", "0.8"))
+ROUTE_MIN_SAMPLES = int(os.getenv("ROUTE_MIN_SAMPLES", "10"))
+ROUTE_WINDOW = int(os.getenv("ROUTE_WINDOW", "200"))
+# latencies older than this are forgotten. a tier skipped for being slow gets no new
+# samples, once its old ones age out it is tried again and can win its traffic back
+ROUTE_SAMPLE_TTL = float(os.getenv("ROUTE_SAMPLE_TTL", "300"))
+
+
+class ModelRouter:
+    '''
+    picks a model tier per llm call. a route starts on its configured tier, moves up while
+    the prompt is too big for the tier and down while the tier's recent p95 for that route
+    does not fit the call's deadline. latencies expire after sample_ttl, so a tier skipped
+    as too slow is tried again once its samples aged out. every decision and the latency
+    it got are kept for the metrics.
+    '''
+
+    def __init__(
+        self,
+        tiers: Dict[str, str] = MODEL_TIERS,
+        routes: Dict[str, str] = MODEL_ROUTES,
+        max_prompt_tokens: Dict[str, int] = ROUTE_MAX_PROMPT_TOKENS,
+        deadline_share: float = ROUTE_DEADLINE_SHARE,
+        min_samples: int = ROUTE_MIN_SAMPLES,
+        sample_ttl: float = ROUTE_SAMPLE_TTL,
+    ):
+        self.tiers = dict(tiers)
+        self.order = list(self.tiers)
+        self.routes = dict(routes)
+        self.max_prompt_tokens = dict(max_prompt_tokens)
+        self.deadline_share = deadline_share
+        self.min_samples = min_samples
+        self.sample_ttl = sample_ttl
+        self._lock = threading.Lock()
+        # (route, tier) -> recent (time.monotonic(), latency), calls, failures; route -> reason -> count
+        self._latencies: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = {}
+        self._calls: Dict[Tuple[str, str], int] = {}
+        self._failures: Dict[Tuple[str, str], int] = {}
+        self._reasons: Dict[str, Dict[str, int]] = {}
+
+    def _samples(self, route: str, tier: str) -> List[float]:
+        # callers hold the lock
+        window = self._latencies.get((route, tier))
+        if not window:
+            return []
+        cutoff = time.monotonic() - self.sample_ttl
+        while window and window[0][0] < cutoff:
+            window.popleft()
+        return sorted(seconds for _, seconds in window)
+
+    def _p95(self, route: str, tier: str) -> Optional[float]:
+        samples = self._samples(route, tier)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[int(len(samples) * 0.95)] if len(samples) > 1 else samples[0]
+
+    def pick(self, route: str, prompt_tokens: int = 0) -> str:
+        '''
+        returns the tier for one call on `route`
+        '''
+        start = self.routes.get(route, self.order[len(self.order) // 2])
+        index = self.order.index(start)
+        reason = "configured"
+        while index < len(self.order) - 1 and prompt_tokens > self.max_prompt_tokens.get(self.order[index], float("inf")):
+            index += 1
+            reason = "prompt_size"
+        left = remaining()
+        with self._lock:
+            if left is not None:
+                while index > 0:
+                    p95 = self._p95(route, self.order[index])
+                    if p95 is None or p95 <= left * self.deadline_share:
+                        break
+                    index -= 1
+                    reason = "latency"
+            counts = self._reasons.setdefault(route, {})
+            counts[reason] = counts.get(reason, 0) + 1
+        return self.order[index]
+
+    def model(self, tier: str) -> str:
+        return self.tiers[tier]
+
+    def observe(self, route: str, tier: str, seconds: float, ok: bool = True):
+        with self._lock:
+            key = (route, tier)
+            self._calls[key] = self._calls.get(key, 0) + 1
+            if ok:
+                self._latencies.setdefault(key, deque(maxlen=ROUTE_WINDOW)).append((time.monotonic(), seconds))
+            else:
+                self._failures[key] = self._failures.get(key, 0) + 1
+
+    @asynccontextmanager
+    async def track(self, route: str, tier: str):
+        '''
+        times the block as one call of `route` on `tier`
+        '''
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.observe(route, tier, time.monotonic() - started, ok)
+
+    def stats(self) -> dict:
+        with self._lock:
+            routes: Dict[str, dict] = {}
+            for (route, tier), calls in self._calls.items():
+                samples = self._samples(route, tier)
+                routes.setdefault(route, {"decisions": dict(self._reasons.get(route, {})), "tiers": {}})
+                routes[route]["tiers"][tier] = {
+                    "model": self.tiers[tier],
+                    "calls": calls,
+                    "failures": self._failures.get((route, tier), 0),
+                    "p50_ms": 1000 * samples[len(samples) // 2] if samples else 0.0,
+                    "p95_ms": 1000 * samples[int(len(samples) * 0.95)] if samples else 0.0,
+                }
+            return routes
+
+
+model_router = ModelRouter()
@@ -0,0 +1,256 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+# provider quotas the scheduler keeps under, per process
+LLM_RPM = float(os.getenv("LLM_RPM", "1000"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+# after the provider answers with a rate limit error every lane waits this long
+LLM_THROTTLE_PAUSE = float(os.getenv("LLM_THROTTLE_PAUSE", "10"))
+
+# served first to last, a background call only goes out when no interactive call is waiting
+LANES = ("interactive", "background")
+
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("llm_lane", default="interactive")
+_session: contextvars.ContextVar[str] = contextvars.ContextVar("llm_session", default="")
+
+
+@contextmanager
+def scheduling(lane: Optional[str] = None, session: Optional[str] = None):
+    '''
+    tags the llm calls made inside the block (including graph nodes and agents run from
+    it) with a lane and the session they are made for
+    '''
+    if lane is not None and lane not in LANES:
+        raise ValueError(f"unknown lane {lane!r}, expected one of {LANES}")
+    tokens = [(var, var.set(value)) for var, value in ((_lane, lane), (_session, session)) if value is not None]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, only used until the provider reports real usage
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    '''
+    refills at `per_minute` / 60 per second up to one minute's worth. take() may drive the
+    level below zero, later callers then wait until the debt is paid back
+    '''
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        self.refill(now)
+        # a request larger than the whole bucket waits for a full bucket, not forever
+        missing = min(amount, self.capacity) - self.level
+        return max(missing, 0) / self.rate
+
+    def take(self, amount: float, now: float):
+        self.refill(now)
+        self.level -= amount
+
+
+class _Ticket:
+    def __init__(self, scheduler: "LLMScheduler", lane: str, session: str, tokens: int, loop=None):
+        self.scheduler = scheduler
+        self.lane = lane
+        self.session = session
+        self.tokens = tokens
+        self.queued_at = time.monotonic()
+        self.granted = False
+        self.settled = False
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+
+    def grant(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            try:
+                self.loop.call_soon_threadsafe(self.event.set)
+            except RuntimeError:  # the waiter's loop is gone
+                pass
+
+    def settle(self, used: Optional[int]):
+        '''
+        ends the call: charges the tokens it really used instead of the estimate, None
+        keeps the estimate. every granted ticket is settled once, later calls do nothing
+        '''
+        if self.settled:
+            return
+        self.settled = True
+        self.scheduler.release(None if used is None else used - self.tokens)
+
+
+class LLMScheduler:
+    '''
+    process-wide admission control for provider calls. a call waits for a request from the
+    requests-per-minute bucket and its estimated tokens from the tokens-per-minute bucket.
+    waiting calls are served by lane priority, and within a lane round-robin across
+    sessions, so one session firing many calls cannot starve the others.
+    '''
+
+    def __init__(self, rpm: float = LLM_RPM, tpm: float = LLM_TPM, throttle_pause: float = LLM_THROTTLE_PAUSE):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.throttle_pause = throttle_pause
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        # lane -> session -> queued tickets, sessions rotate to the back after each grant
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Ticket]]"] = {lane: OrderedDict() for lane in LANES}
+        self._waits: Dict[str, List[float]] = {lane: [] for lane in LANES}
+        self.granted = {lane: 0 for lane in LANES}
+        # granted tickets not settled yet, a count that only grows means a call path leaks them
+        self.in_flight = 0
+        self.throttles = 0
+
+    #------------------------------------------------------------------QUEUE------------------------------------------------
+    def _enqueue(self, ticket: _Ticket):
+        with self._lock:
+            self._queues[ticket.lane].setdefault(ticket.session, deque()).append(ticket)
+
+    def _drop(self, ticket: _Ticket):
+        # a waiter that gave up (cancelled, timed out) leaves the queue. granted just as it
+        # gave up, its call never goes out and the ticket is settled right away
+        with self._lock:
+            if not ticket.granted:
+                queue = self._queues[ticket.lane].get(ticket.session)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        del self._queues[ticket.lane][ticket.session]
+                return
+        ticket.settle(0)
+
+    def _dispatch(self) -> Optional[float]:
+        '''
+        grants as many queued tickets as the buckets allow, returns how long until the next
+        one can go (None when the queue is empty). callers hold the lock.
+        '''
+        while True:
+            lane = next((lane for lane in LANES if self._queues[lane]), None)
+            if lane is None:
+                return None
+            sessions = self._queues[lane]
+            session, queue = next(iter(sessions.items()))
+            ticket = queue[0]
+            now = time.monotonic()
+            wait = max(self.paused_until - now, self.requests.wait_time(1, now), self.tokens.wait_time(ticket.tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1, now)
+            self.tokens.take(ticket.tokens, now)
+            queue.popleft()
+            del sessions[session]
+            if queue:
+                sessions[session] = queue
+            self.granted[lane] += 1
+            self.in_flight += 1
+            self._waits[lane] = (self._waits[lane] + [now - ticket.queued_at])[-1000:]
+            ticket.grant()
+
+    def acquire(self, text: str) -> _Ticket:
+        ticket = _Ticket(self, _lane.get(), _session.get(), estimate_tokens(text))
+        self._enqueue(ticket)
+        try:
+            while not ticket.granted:
+                with self._lock:
+                    wait = self._dispatch()
+                if not ticket.granted:
+                    ticket.event.wait(wait)
+        except BaseException:
+            self._drop(ticket)
+            raise
+        return ticket
+
+    async def aacquire(self, text: str) -> _Ticket:
+        ticket = _Ticket(self, _lane.get(), _session.get(), estimate_tokens(text), loop=asyncio.get_running_loop())
+        self._enqueue(ticket)
+        try:
+            while not ticket.granted:
+                with self._lock:
+                    wait = self._dispatch()
+                if not ticket.granted:
+                    try:
+                        await asyncio.wait_for(ticket.event.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+        except BaseException:
+            self._drop(ticket)
+            raise
+        return ticket
+
+    def release(self, tokens: Optional[int]):
+        # a settled ticket: the call is over, its tokens are corrected by the difference
+        with self._lock:
+            self.in_flight -= 1
+            if tokens:
+                self.tokens.take(tokens, time.monotonic())
+
+    def throttled(self):
+        '''
+        the provider rejected a call for rate limits, hold every lane back for a while
+        '''
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + self.throttle_pause)
+            self.throttles += 1
+
+    #------------------------------------------------------------------METRICS------------------------------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            lanes = {}
+            for lane in LANES:
+                waits = sorted(self._waits[lane])
+                lanes[lane] = {
+                    "queued": sum(len(queue) for queue in self._queues[lane].values()),
+                    "sessions_waiting": len(self._queues[lane]),
+                    "granted": self.granted[lane],
+                    "wait_p50_ms": 1000 * waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p95_ms": 1000 * waits[int(len(waits) * 0.95)] if waits else 0.0,
+                }
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            return {
+                "lanes": lanes,
+                "requests_available": self.requests.level,
+                "tokens_available": self.tokens.level,
+                "in_flight": self.in_flight,
+                "throttles": self.throttles,
+            }
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    # google.api_core raises ResourceExhausted (http 429), without importing it here
+    return type(error).__name__ in ("ResourceExhausted", "TooManyRequests") or "429" in str(error)[:200]
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> LLMScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import asyncio
+import argparse
+import threading
+import multiprocessing
+from typing import Iterator, List, Optional
+
+# LLM_RPM / LLM_TPM are per process, run() splits them across the workers before they start
+from agents.scheduler import LLM_RPM, LLM_TPM
+
+# a review loop that is still asking after this many rounds is given up on
+BATCH_MAX_ROUNDS = int(os.getenv("BATCH_MAX_ROUNDS", "10"))
+
+
+def read_jobs(path: str, skip: set) -> Iterator[dict]:
+    '''
+    one job per line: {"id": ..., "query": ..., "architect_feedback": [...], "planner_feedback": [...]}.
+    a plain string line is taken as the query, a missing id is the line number
+    '''
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if isinstance(job, str):
+                job = {"query": job}
+            job.setdefault("id", str(number))
+            if str(job["id"]) not in skip:
+                yield job
+
+
+def finished_ids(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {str(json.loads(line)["id"]) for line in f if line.strip()}
+
+
+def feedback(job: dict, reviewer: str, round_: int, policy: str) -> str:
+    '''
+    the reply to the `round_`th review of `reviewer` ("architect" or "planner"): scripted
+    feedback in order, approval once the script runs out or with the auto policy
+    '''
+    script = job.get(f"{reviewer}_feedback", []) if policy == "scripted" else []
+    return script[round_] if round_ < len(script) else "approve"
+
+
+async def run_session(graph, job: dict, policy: str) -> dict:
+    '''
+    drives one query through both review loops, the result line for the output file
+    '''
+    from langgraph.types import Command
+    from agents.scheduler import scheduling
+
+    thread_id = uuid.uuid4().hex
+    config = {"configurable": {"thread_id": thread_id}}
+    rounds = {"architect": 0, "planner": 0}
+    result = {"id": job["id"], "query": job["query"]}
+    started = time.monotonic()
+    try:
+        # nightly runs must never hold up interactive traffic sharing the quota
+        with scheduling(lane="background", session=thread_id):
+            state = await graph.ainvoke({"user_response": job["query"]}, config)
+            while "__interrupt__" in state:
+                reviewer = state["agent_node"]
+                if rounds[reviewer] >= BATCH_MAX_ROUNDS:
+                    raise RuntimeError(f"{reviewer} review did not finish within {BATCH_MAX_ROUNDS} rounds")
+                reply = feedback(job, reviewer, rounds[reviewer], policy)
+                rounds[reviewer] += 1
+                state = await graph.ainvoke(Command(resume=reply), config)
+        result["architect_response"] = state.get("architect_response")
+        result["planner_response"] = state.get("planner_response")
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        await graph.checkpointer.adelete_thread(thread_id)
+    result["rounds"] = rounds
+    result["seconds"] = round(time.monotonic() - started, 3)
+    return result
+
+
+async def drain(jobs, results, concurrency: int):
+    '''
+    runs jobs from the `jobs` queue (None ends it) `concurrency` sessions at a time,
+    putting every result on `results`
+    '''
+    from langgraph.checkpoint.memory import InMemorySaver
+    from graphs.orchestrator import graph_invoker
+
+    # batch sessions are thrown away when they finish, there is nothing to persist
+    graph = graph_invoker(checkpointer=InMemorySaver())
+
+    loop = asyncio.get_running_loop()
+    pending: asyncio.Queue = asyncio.Queue()
+    # a job is only pulled off the shared queue once a session slot is free, so an idle
+    # worker process gets the next job instead of this one hoarding them
+    slots = threading.Semaphore(concurrency)
+
+    def pump():
+        while True:
+            slots.acquire()
+            job = jobs.get()
+            loop.call_soon_threadsafe(pending.put_nowait, job)
+            if job is None:
+                jobs.put(None)
+                return
+
+    threading.Thread(target=pump, name="batch-pump", daemon=True).start()
+
+    async def consume():
+        while True:
+            job = await pending.get()
+            if job is None:
+                pending.put_nowait(None)
+                return
+            try:
+                results.put(await run_session(graph, job["job"], job["policy"]))
+            finally:
+                slots.release()
+
+    await asyncio.gather(*(consume() for _ in range(concurrency)))
+
+
+def worker(jobs, results, concurrency: int):
+    try:
+        asyncio.run(drain(jobs, results, concurrency))
+    finally:
+        # the writer counts these to know when every worker is done
+        results.put(None)
+
+
+def summarize(seconds: List[float], errors: int, elapsed: float) -> dict:
+    seconds = sorted(seconds)
+
+    def quantile(q: float) -> float:
+        return seconds[min(int(len(seconds) * q), len(seconds) - 1)] if seconds else 0.0
+
+    return {
+        "sessions": len(seconds),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(seconds) / elapsed, 3) if elapsed else 0.0,
+        "p50_seconds": quantile(0.5),
+        "p95_seconds": quantile(0.95),
+    }
+
+
+def run(
+    input_path: str,
+    output_path: str,
+    policy: str = "auto",
+    concurrency: int = 16,
+    processes: int = 1,
+    resume: bool = False,
+    limit: Optional[int] = None,
+) -> dict:
+    '''
+    runs every job of `input_path` and appends the results to `output_path` as they finish
+    '''
+    skip = finished_ids(output_path) if resume else set()
+    started = time.monotonic()
+    if processes > 1:
+        os.environ["LLM_RPM"] = str(LLM_RPM / processes)
+        os.environ["LLM_TPM"] = str(LLM_TPM / processes)
+        context = multiprocessing.get_context("spawn")
+        jobs, results = context.Queue(maxsize=processes * concurrency * 2), context.Queue()
+        workers = [context.Process(target=worker, args=(jobs, results, concurrency), daemon=True) for _ in range(processes)]
+    else:
+        # one process: the worker loop runs on a thread next to the writer
+        jobs, results = queue.Queue(maxsize=concurrency * 2), queue.Queue()
+        workers = [threading.Thread(target=worker, args=(jobs, results, concurrency), daemon=True)]
+    for process in workers:
+        process.start()
+
+    def feed():
+        for number, job in enumerate(read_jobs(input_path, skip)):
+            if limit is not None and number >= limit:
+                break
+            jobs.put({"job": job, "policy": policy})
+        jobs.put(None)
+
+    threading.Thread(target=feed, name="batch-feeder", daemon=True).start()
+
+    seconds, errors, running = [], 0, len(workers)
+    with open(output_path, "a" if resume else "w") as out:
+        while running:
+            result = results.get()
+            if result is None:
+                running -= 1
+                continue
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            seconds.append(result["seconds"])
+            errors += "error" in result
+    for process in workers:
+        process.join()
+    return summarize(seconds, errors, time.monotonic() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="runs architect -> planner sessions for a jsonl file of queries without a reviewer")
+    parser.add_argument("input", help="jsonl file, one query (or job object) per line")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl", help="jsonl file the results are streamed to")
+    parser.add_argument("--policy", choices=("auto", "scripted"), default="auto",
+                        help="auto approves every review, scripted replays the job's *_feedback lists first")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="sessions in flight per process")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="worker processes, the llm quota is split between them")
+    parser.add_argument("--resume", action="store_true", help="skip ids already in the output file and append to it")
+    parser.add_argument("--limit", type=int, default=None, help="only run the first n jobs")
+    args = parser.parse_args(argv)
+    summary = run(args.input, args.output, args.policy, args.concurrency, args.processes, args.resume, args.limit)
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import uuid
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from typing import Dict, List, Optional
+
+# bytes of stored payload per table, the file size would also count free pages and the WAL
+STORED_BYTES = {
+    "checkpoints": "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints",
+    "blobs": "SELECT COALESCE(SUM(LENGTH(blob)), 0) FROM blobs",
+    "writes": "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes",
+    "messages": "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM messages",
+}
+
+
+def stored_bytes(path: str) -> Dict[str, int]:
+    conn = sqlite3.connect(path)
+    try:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        return {table: conn.execute(query).fetchone()[0] for table, query in STORED_BYTES.items() if table in tables}
+    finally:
+        conn.close()
+
+
+async def run_session(loops: int, path: str, keep_last: Optional[int]) -> List[dict]:
+    '''
+    one architect review loop per round, the stored bytes after each of them. with
+    keep_last the retention policy is applied after every round, as the compactor would
+    '''
+    from langgraph.types import Command
+    from graphs.orchestrator import build_checkpointer, graph_invoker, GRAPH_DURABILITY
+    from persistence.retention import RetentionPolicy, prune
+
+    checkpointer = build_checkpointer("sqlite", path)
+    graph = graph_invoker(checkpointer=checkpointer)
+    policy = RetentionPolicy(keep_last=keep_last) if keep_last else None
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    rounds = []
+    await graph.ainvoke({"user_response": "a task tracker with offline sync"}, config, durability=GRAPH_DURABILITY)
+    for round_ in range(1, loops + 1):
+        await graph.ainvoke(Command(resume=f"revision {round_}: also cover case {round_}"), config, durability=GRAPH_DURABILITY)
+        if policy is not None:
+            prune(checkpointer, policy)
+        sizes = stored_bytes(path)
+        rounds.append({"round": round_, "bytes": sum(sizes.values()), **sizes})
+    return rounds
+
+
+def growth(rounds: List[dict], window: int = 10) -> dict:
+    '''
+    bytes added per round early and late in the session: about equal when the checkpoints
+    grow linearly, the late rate is a multiple of the early one when they grow quadratically
+    '''
+    window = min(window, len(rounds) // 2)
+    early = (rounds[window]["bytes"] - rounds[0]["bytes"]) / window
+    late = (rounds[-1]["bytes"] - rounds[-1 - window]["bytes"]) / window
+    return {"early_bytes_per_round": round(early), "late_bytes_per_round": round(late), "late_to_early": round(late / early, 2) if early else None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="stored checkpoint bytes over a long architect review loop, with and without retention")
+    parser.add_argument("-n", "--loops", type=int, default=50, help="review loops in the session")
+    parser.add_argument("--keep-last", type=int, default=20, help="checkpoints kept per thread in the retention run")
+    parser.add_argument("--keep-turns", type=int, default=1000, help="HISTORY_KEEP_TURNS, the default never folds so only the reducer is measured")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per fake answer")
+    parser.add_argument(
+        "--max-ratio", type=float, default=1.5,
+        help="fail when the session without retention adds more than this many times the bytes per round late than early",
+    )
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_TOKENS": str(args.tokens),
+        "HISTORY_KEEP_TURNS": str(args.keep_turns),
+        "HISTORY_MAX_TOKENS": str(10 ** 9),
+        "LLM_CACHE": "false",
+        "QUERY_CACHE": "false",
+        "SPECULATIVE_PLANNER": "false",
+        "CHECKPOINT_DURABILITY": "sync",
+    })
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, keep_last in (("no_retention", None), (f"keep_last_{args.keep_last}", args.keep_last)):
+            rounds = asyncio.run(run_session(args.loops, os.path.join(directory, f"{name}.db"), keep_last))
+            results[name] = {"growth": growth(rounds), "rounds": rounds}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"{name}: {result['growth']}")
+            print(f"    {'round':>5s} {'total':>10s} " + " ".join(f"{table:>11s}" for table in STORED_BYTES))
+            for row in result["rounds"]:
+                if row["round"] == 1 or row["round"] % 10 == 0:
+                    print(f"    {row['round']:5d} {row['bytes']:10d} " + " ".join(f"{row.get(table, 0):11d}" for table in STORED_BYTES))
+    # a checkpoint must cost what its round added: without retention the bytes per round stay flat
+    ratio = results["no_retention"]["growth"]["late_to_early"]
+    if ratio is not None and ratio > args.max_ratio:
+        print(f"checkpoint growth is superlinear: late/early bytes per round {ratio} > {args.max_ratio}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+from benchmarks.graph_bench import SESSION_TURNS, Samples, time_checkpointer, print_table
+
+# mode -> (background writer in front of sqlite, langgraph durability), as CHECKPOINT_DURABILITY sets them up
+MODES = {
+    "sync": (False, "sync"),
+    "async": (True, "sync"),
+    "exit": (False, "exit"),
+}
+
+
+async def run_mode(mode: str, sessions: int, concurrency: int, path: str) -> dict:
+    '''
+    streams every turn the way /workflow/chat does and times it: first token, the tail
+    between the last token and the end of the run (checkpoint writes of the finishing
+    steps), and the whole turn
+    '''
+    from langgraph.types import Command
+    from graphs.orchestrator import build_checkpointer, graph_invoker
+    from persistence.background_writer import BackgroundWriter
+
+    background, durability = MODES[mode]
+    checkpoints = Samples()
+    saver = build_checkpointer("sqlite", path)
+    if background:
+        saver = BackgroundWriter(saver)
+    graph = graph_invoker(checkpointer=time_checkpointer(saver, checkpoints))
+    first_token, tail, turns = Samples(), Samples(), Samples()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(index: int):
+        async with limit:
+            config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+            for name, reply in SESSION_TURNS:
+                payload = {"user_response": f"build service {index}: a task tracker with sync"} if reply is None else Command(resume=reply)
+                started = time.perf_counter()
+                first = last = None
+                async for event in graph.astream_events(payload, config, version="v2", durability=durability):
+                    if event["event"] == "on_chat_model_stream":
+                        last = time.perf_counter()
+                        first = first or last
+                ended = time.perf_counter()
+                turns.add(name, ended - started)
+                if first is not None:
+                    first_token.add(name, first - started)
+                    tail.add(name, ended - last)
+
+    await session(-1)
+    for samples in (checkpoints, first_token, tail, turns):
+        samples.values.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    if background:
+        saver.flush()
+    return {
+        "turns_per_second": round(sessions * len(SESSION_TURNS) / elapsed, 2),
+        "turn_latency": turns.report(),
+        "first_token": first_token.report(),
+        "after_last_token": tail.report(),
+        "checkpoint": checkpoints.report(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="compares checkpoint durability: sync writes, the background writer and exit-only")
+    parser.add_argument("-n", "--sessions", type=int, default=20, help="sessions per mode")
+    parser.add_argument("-c", "--concurrency", type=int, default=8, help="sessions in flight at once")
+    parser.add_argument("--modes", default=",".join(MODES), help="modes to compare")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model seconds to first token")
+    parser.add_argument("--tps", type=float, default=2000.0, help="fake model tokens per second")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of tables")
+    args = parser.parse_args(argv)
+
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TPS": str(args.tps),
+        "LLM_CACHE": "false",
+        "QUERY_CACHE": "false",
+        "SPECULATIVE_PLANNER": "false",
+    })
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for mode in args.modes.split(","):
+            results[mode] = asyncio.run(run_mode(mode, args.sessions, args.concurrency, os.path.join(directory, f"{mode}.db")))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    for mode, result in results.items():
+        print(f"{mode}: {result['turns_per_second']} turns/s")
+        print_table("turn latency", result["turn_latency"])
+        print_table("after the last token (checkpoint writes of the finishing steps)", result["after_last_token"])
+        print_table("checkpointer calls", result["checkpoint"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
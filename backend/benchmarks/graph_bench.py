@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import functools
+import contextlib
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# the turns of one benchmark session: (name, what the reviewer sends), None starts the session
+SESSION_TURNS = [
+    ("architect_first", None),
+    ("architect_revision", "also support offline mode"),
+    ("planner_first", "approve"),
+    ("planner_revision", "split the rollout into two phases"),
+    ("finish", "approve"),
+]
+# the async graph only calls these, the savers' sync methods run underneath them
+CHECKPOINT_METHODS = ("aget_tuple", "aput", "aput_writes")
+
+
+class Samples:
+    '''
+    latencies by name, reported as count / p50 / p95 / max / total in milliseconds
+    '''
+
+    def __init__(self):
+        self.values: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, name: str, seconds: float):
+        self.values[name].append(seconds)
+
+    def report(self) -> Dict[str, dict]:
+        out = {}
+        for name, values in sorted(self.values.items()):
+            ordered = sorted(values)
+            out[name] = {
+                "count": len(ordered),
+                "p50_ms": round(1000 * ordered[len(ordered) // 2], 3),
+                "p95_ms": round(1000 * ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)], 3),
+                "max_ms": round(1000 * ordered[-1], 3),
+                "total_ms": round(1000 * sum(ordered), 3),
+            }
+        return out
+
+
+class NodeTimer(BaseCallbackHandler):
+    '''
+    times every node of the outer graph and the model calls made inside it. a node's
+    overhead is its wall time minus its model time: prompt building, the agent graph,
+    history compaction, state handling.
+    '''
+
+    run_inline = True
+
+    def __init__(self):
+        self.roots = set()
+        # run id -> (outer node name, node run id) for node runs and everything below them
+        self.owner: Dict = {}
+        self.started: Dict = {}
+        self.model_time: Dict = defaultdict(float)
+        self.nodes = Samples()
+        self.models = Samples()
+        self.overhead = Samples()
+
+    def _start(self, run_id, parent_run_id, name: Optional[str]):
+        if parent_run_id is None:
+            self.roots.add(run_id)
+        elif parent_run_id in self.roots and name:
+            self.owner[run_id] = (name, run_id)
+        elif parent_run_id in self.owner:
+            self.owner[run_id] = self.owner[parent_run_id]
+        self.started[run_id] = time.perf_counter()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, kwargs.get("name"))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, None)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        seconds = time.perf_counter() - self.started.pop(run_id, time.perf_counter())
+        if run_id in self.owner:
+            name, node_run = self.owner.pop(run_id)
+            self.model_time[node_run] += seconds
+            self.models.add(name, seconds)
+
+    def _end(self, run_id):
+        seconds = time.perf_counter() - self.started.pop(run_id, time.perf_counter())
+        self.roots.discard(run_id)
+        owner = self.owner.pop(run_id, None)
+        if owner is not None and owner[1] == run_id:
+            self.nodes.add(owner[0], seconds)
+            self.overhead.add(owner[0], seconds - self.model_time.pop(run_id, 0.0))
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # interrupts surface as errors of the review nodes, they still count as a node run
+        self._end(run_id)
+
+    on_llm_error = on_llm_end
+
+
+def time_checkpointer(checkpointer, samples: Samples):
+    '''
+    wraps the checkpointer's read and write methods in place so every call is timed
+    '''
+    for name in CHECKPOINT_METHODS:
+        method = getattr(checkpointer, name)
+
+        async def timed(*args, __method=method, __name=name, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await __method(*args, **kwargs)
+            finally:
+                samples.add(__name, time.perf_counter() - started)
+
+        setattr(checkpointer, name, functools.wraps(method)(timed))
+    return checkpointer
+
+
+async def run_backend(backend: str, sessions: int, concurrency: int, path: str) -> dict:
+    from langgraph.types import Command
+    from graphs.orchestrator import build_checkpointer, graph_invoker, GRAPH_DURABILITY
+
+    checkpoints = Samples()
+    checkpointer = time_checkpointer(build_checkpointer(backend, path), checkpoints)
+    graph = graph_invoker(checkpointer=checkpointer)
+    nodes = NodeTimer()
+    turns = Samples()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(index: int):
+        async with limit:
+            config = {"configurable": {"thread_id": uuid.uuid4().hex}, "callbacks": [nodes]}
+            for name, reply in SESSION_TURNS:
+                payload = {"user_response": f"build service {index}: a task tracker with sync"} if reply is None else Command(resume=reply)
+                started = time.perf_counter()
+                await graph.ainvoke(payload, config, durability=GRAPH_DURABILITY)
+                turns.add(name, time.perf_counter() - started)
+
+    # one untimed session first, so imports and agent construction are not measured
+    await session(-1)
+    for samples in (checkpoints, nodes.nodes, nodes.models, nodes.overhead, turns):
+        samples.values.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    if hasattr(checkpointer, "flush"):
+        checkpointer.flush()
+    return {
+        "sessions": sessions,
+        "turns_per_second": round(sessions * len(SESSION_TURNS) / elapsed, 2),
+        "turn_latency": turns.report(),
+        "node_time": nodes.nodes.report(),
+        "node_model_time": nodes.models.report(),
+        "node_overhead": nodes.overhead.report(),
+        "checkpoint": checkpoints.report(),
+    }
+
+
+def print_table(title: str, report: Dict[str, dict]):
+    print(f"  {title}")
+    print(f"    {'':22s} {'count':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'max ms':>9s}")
+    for name, row in report.items():
+        print(f"    {name:22s} {row['count']:7d} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['max_ms']:9.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmarks the compiled graph offline on the fake chat model")
+    parser.add_argument("-n", "--sessions", type=int, default=50, help="sessions per backend, each runs every turn of SESSION_TURNS")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="sessions in flight at once")
+    parser.add_argument("--backends", default="memory,sqlite", help="checkpoint backends to compare (memory, sqlite, tiered)")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model seconds to first token, 0 measures pure overhead")
+    parser.add_argument("--tps", type=float, default=0.0, help="fake model tokens per second, 0 answers at once")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per fake answer")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of tables")
+    args = parser.parse_args(argv)
+
+    # settings are read on import, so they are in place before the backend is imported;
+    # the caches would turn every repeated turn into a lookup
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TPS": str(args.tps),
+        "FAKE_LLM_TOKENS": str(args.tokens),
+        "LLM_CACHE": "false",
+        "QUERY_CACHE": "false",
+    })
+    results = {}
+    # the nodes print their progress, which would bury the report
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for backend in args.backends.split(","):
+            path = os.path.join(directory, f"{backend}.db")
+            results[backend] = asyncio.run(run_backend(backend, args.sessions, args.concurrency, path))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    for backend, result in results.items():
+        print(f"{backend}: {result['sessions']} sessions, {result['turns_per_second']} turns/s")
+        print_table("turn latency", result["turn_latency"])
+        print_table("node overhead (wall time minus model time)", result["node_overhead"])
+        print_table("model time per node", result["node_model_time"])
+        print_table("checkpointer calls", result["checkpoint"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import contextlib
+import subprocess
+from typing import List
+
+from benchmarks.graph_bench import SESSION_TURNS, Samples
+
+# mode -> LLM_HEDGE; the managed models read it when they are built, so every mode runs
+# in a process of its own
+MODES = {"hedge_off": "false", "hedge_on": "true"}
+
+
+def quantiles(values: List[float]) -> dict:
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(1000 * ordered[min(int(len(ordered) * q), len(ordered) - 1)], 1)
+
+    return {"count": len(ordered), "p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99), "max_ms": round(1000 * ordered[-1], 1)}
+
+
+async def run_mode(sessions: int, concurrency: int, warmup: int) -> dict:
+    '''
+    review sessions against the fake model with latency spikes, every turn timed. the
+    warm-up sessions fill the latency window hedging needs before it fires
+    '''
+    from langgraph.types import Command
+    from langgraph.checkpoint.memory import InMemorySaver
+    from graphs.orchestrator import graph_invoker
+    from agents import deadlines
+
+    graph = graph_invoker(checkpointer=InMemorySaver())
+    turns = Samples()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(index: int):
+        async with limit:
+            config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+            for name, reply in SESSION_TURNS:
+                payload = {"user_response": f"build service {index}: a task tracker with sync"} if reply is None else Command(resume=reply)
+                started = time.perf_counter()
+                await graph.ainvoke(payload, config)
+                turns.add(name, time.perf_counter() - started)
+
+    await asyncio.gather(*(session(-1 - i) for i in range(warmup)))
+    turns.values.clear()
+    before = deadlines.stats()
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    after = deadlines.stats()
+    return {
+        "seconds": round(elapsed, 2),
+        "turn_latency": quantiles([value for values in turns.values.values() for value in values]),
+        "by_turn": turns.report(),
+        **{name: after[name] - before[name] for name in ("hedged", "hedge_wins")},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="turn latency tail with hedged llm requests on and off, against a fake model with latency spikes")
+    parser.add_argument("-n", "--sessions", type=int, default=100, help="measured sessions per mode")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="sessions in flight at once")
+    parser.add_argument("--warmup", type=int, default=10, help="sessions run first to fill the latency window")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake model seconds to first token")
+    parser.add_argument("--jitter", type=float, default=0.2, help="FAKE_LLM_JITTER")
+    parser.add_argument("--spike-rate", type=float, default=0.03, help="share of the calls hit by a latency spike")
+    parser.add_argument("--spike", type=float, default=10.0, help="latency multiplier of a spike")
+    parser.add_argument("--seed", type=int, default=7, help="FAKE_LLM_SEED")
+    parser.add_argument("--modes", default=",".join(MODES), help="modes to compare")
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        os.environ.update({
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_LATENCY": str(args.latency),
+            "FAKE_LLM_JITTER": str(args.jitter),
+            "FAKE_LLM_SPIKE_RATE": str(args.spike_rate),
+            "FAKE_LLM_SPIKE": str(args.spike),
+            "FAKE_LLM_SEED": str(args.seed),
+            "LLM_HEDGE": MODES[args.mode],
+            "LLM_CACHE": "false",
+            "QUERY_CACHE": "false",
+            "SPECULATIVE_PLANNER": "false",
+        })
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(run_mode(args.sessions, args.concurrency, args.warmup))
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    forwarded = [arg for arg in (argv if argv is not None else sys.argv[1:]) if arg != "--json"]
+    for mode in args.modes.split(","):
+        done = subprocess.run(
+            [sys.executable, "-m", "benchmarks.hedge_bench", *forwarded, "--mode", mode],
+            stdout=subprocess.PIPE, check=True, text=True,
+        )
+        results[mode] = json.loads(done.stdout.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"  {'':10s} {'turns':>6s} {'p50 ms':>8s} {'p95 ms':>8s} {'p99 ms':>8s} {'max ms':>8s} {'hedged':>7s} {'wins':>5s}")
+    for mode, result in results.items():
+        latency = result["turn_latency"]
+        print(
+            f"  {mode:10s} {latency['count']:6d} {latency['p50_ms']:8.1f} {latency['p95_ms']:8.1f} {latency['p99_ms']:8.1f}"
+            f" {latency['max_ms']:8.1f} {result['hedged']:7d} {result['hedge_wins']:5d}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
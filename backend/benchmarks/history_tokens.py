@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import contextlib
+from typing import Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+class TokenCounter(BaseCallbackHandler):
+    '''
+    input tokens of every model call as the provider reports them, split into the agents'
+    calls and the history summary calls
+    '''
+
+    run_inline = True
+
+    def __init__(self, summary_tag: str):
+        self.summary_tag = summary_tag
+        self.tags: Dict = {}
+        self.calls: List[tuple] = []
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        self.tags[run_id] = tags or []
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        message = getattr(response.generations[0][0], "message", None)
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.calls.append((self.summary_tag in self.tags.pop(run_id, []), usage.get("input_tokens", 0)))
+
+    def take(self) -> Dict[str, int]:
+        '''
+        (agent input tokens, summary input tokens) since the last take
+        '''
+        calls, self.calls = self.calls, []
+        return {
+            "agent": sum(tokens for summary, tokens in calls if not summary),
+            "summary": sum(tokens for summary, tokens in calls if summary),
+        }
+
+
+async def run_session(turns: int, keep_turns: int) -> List[dict]:
+    from langgraph.types import Command
+    from langgraph.checkpoint.memory import InMemorySaver
+    from graphs import orchestrator
+    from graphs.history import SUMMARY_TAG
+
+    # the nodes share this instance, its limits are set per run instead of through the env
+    orchestrator.history_manager.keep_turns = keep_turns
+    orchestrator.history_manager.max_tokens = 10 ** 9
+    graph = orchestrator.graph_invoker(checkpointer=InMemorySaver())
+    counter = TokenCounter(SUMMARY_TAG)
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}, "callbacks": [counter]}
+    rows = []
+    await graph.ainvoke({"user_response": "a task tracker with offline sync"}, config)
+    rows.append({"turn": 1, **counter.take()})
+    for turn in range(2, turns + 1):
+        await graph.ainvoke(Command(resume=f"revision {turn}: also cover case {turn} and explain the trade-offs"), config)
+        rows.append({"turn": turn, **counter.take()})
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="per-turn input tokens of a long architect review loop, with and without history compaction")
+    parser.add_argument("-n", "--turns", type=int, default=30, help="architect turns in the session")
+    parser.add_argument("--keep-turns", type=int, default=4, help="turns kept verbatim in the compacted run")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per fake answer")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_TOKENS": str(args.tokens),
+        "LLM_CACHE": "false",
+        "QUERY_CACHE": "false",
+        "SPECULATIVE_PLANNER": "false",
+    })
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, keep_turns in (("full_history", 10 ** 6), (f"keep_{args.keep_turns}_turns", args.keep_turns)):
+            results[name] = asyncio.run(run_session(args.turns, keep_turns))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    names = list(results)
+    print(f"  {'turn':>5s} " + " ".join(f"{name:>20s} {'summary':>8s}" for name in names))
+    for i in range(args.turns):
+        if i == 0 or (i + 1) % 5 == 0:
+            print(f"  {i + 1:5d} " + " ".join(f"{results[name][i]['agent']:20d} {results[name][i]['summary']:8d}" for name in names))
+    for name in names:
+        rows = results[name]
+        total = sum(row["agent"] + row["summary"] for row in rows)
+        print(f"{name}: {rows[-1]['agent']} agent input tokens on the last turn, {total} input tokens over the session (summaries included)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+import contextlib
+
+from benchmarks.graph_bench import Samples
+
+
+async def review_session(http, index: int, latencies: Samples):
+    '''
+    one reviewer through the async endpoints: start the session, answer the architect once
+    '''
+    started = time.perf_counter()
+    response = await http.post("/workflow/start", json={"initial_query": f"service {index}: a task tracker with sync"})
+    response.raise_for_status()
+    latencies.add("start", time.perf_counter() - started)
+    started = time.perf_counter()
+    response = await http.post("/workflow/architect_review", json={"run_id": response.json()["thread_id"], "query": "also support offline mode"})
+    response.raise_for_status()
+    latencies.add("architect_review", time.perf_counter() - started)
+
+
+async def run_level(sessions: int) -> dict:
+    '''
+    all sessions at once against one app, the way uvicorn would serve them from one
+    process. the thread count is sampled while they wait on the model: the async nodes
+    and endpoints must not pin a worker thread per waiting call
+    '''
+    import httpx
+    import main
+    from agents.scheduler import get_scheduler
+
+    latencies = Samples()
+    granted = get_scheduler().stats()["lanes"]["interactive"]["granted"]
+    peak_threads = threading.active_count()
+    done = asyncio.Event()
+
+    async def sample_threads():
+        nonlocal peak_threads
+        while not done.is_set():
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.05)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+        sampler = asyncio.ensure_future(sample_threads())
+        started = time.perf_counter()
+        await asyncio.gather(*(review_session(http, i, latencies) for i in range(sessions)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await sampler
+    scheduler = get_scheduler().stats()
+    return {
+        "sessions": sessions,
+        "seconds": round(elapsed, 3),
+        "sessions_per_second": round(sessions / elapsed, 2),
+        "peak_threads": peak_threads,
+        "latency": latencies.report(),
+        "scheduler_wait_p95_ms": round(scheduler["lanes"]["interactive"]["wait_p95_ms"], 3),
+        "llm_calls": scheduler["lanes"]["interactive"]["granted"] - granted,
+    }
+
+
+async def run(levels) -> list:
+    import main
+    from graphs.orchestrator import graph_invoker
+
+    # the startup hook also renders the graph png, which needs the network
+    main.graph = graph_invoker()
+    # warms up imports and the compiled graph so the first level is not charged for them
+    await run_level(1)
+    return [await run_level(sessions) for sessions in levels]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="concurrent review sessions served by one process while they wait on the model")
+    parser.add_argument("-c", "--sessions", default="1,50,100,200,400", help="comma separated numbers of concurrent sessions")
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model seconds to first token")
+    # keep the quotas above the load to measure the server, lower them to watch the scheduler queue
+    parser.add_argument("--rpm", type=float, default=10 ** 5, help="LLM_RPM")
+    parser.add_argument("--tpm", type=float, default=10 ** 8, help="LLM_TPM")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "LLM_RPM": str(args.rpm),
+        "LLM_TPM": str(args.tpm),
+        "CHECKPOINT_BACKEND": "memory",
+        "SESSION_BACKEND": "memory",
+        "LLM_CACHE": "false",
+        "QUERY_CACHE": "false",
+        "SPECULATIVE_PLANNER": "false",
+    })
+    levels = [int(level) for level in args.sessions.split(",")]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results = asyncio.run(run(levels))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"  {'sessions':>8s} {'seconds':>8s} {'sessions/s':>10s} {'threads':>8s} {'start p95 ms':>12s} {'review p95 ms':>13s} {'queue p95 ms':>12s} {'llm calls':>9s}")
+    for row in results:
+        latency = row["latency"]
+        print(
+            f"  {row['sessions']:8d} {row['seconds']:8.2f} {row['sessions_per_second']:10.2f} {row['peak_threads']:8d}"
+            f" {latency['start']['p95_ms']:12.1f} {latency['architect_review']['p95_ms']:13.1f} {row['scheduler_wait_p95_ms']:12.1f} {row['llm_calls']:9d}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from typing import List, Tuple
+
+from benchmarks.graph_bench import SESSION_TURNS
+from benchmarks.serializer_bench import sample_responses
+from benchmarks.checkpoint_growth import stored_bytes
+
+MODES = {"store_off": False, "store_on": True}
+BACKENDS = ("memory", "sqlite")
+
+
+def held_bytes(checkpointer) -> int:
+    '''
+    serialized bytes an in-memory saver holds: checkpoints, blobs and writes, plus the
+    bodies in its message store
+    '''
+    from persistence.tiered_saver import _thread_bytes
+
+    size = _thread_bytes(checkpointer)
+    store = getattr(checkpointer.serde, "store", None)
+    if store is not None:
+        size += sum(len(data) for _, data, _ in store._items.values())
+    return size
+
+
+async def run_mode(backend: str, store: bool, sessions: int, openings: int, path: str) -> Tuple[List[int], dict]:
+    '''
+    full review sessions one after the other, the bytes stored after each. sessions
+    cycle through `openings` requests and the scripted answers, so later sessions mostly
+    repeat content an earlier one stored already. also returns the sqlite bytes per table
+    '''
+    from langgraph.types import Command
+    from graphs import orchestrator
+
+    orchestrator.MESSAGE_STORE = store
+    checkpointer = orchestrator.build_checkpointer(backend, path)
+    graph = orchestrator.graph_invoker(checkpointer=checkpointer)
+    sizes = []
+    for index in range(sessions):
+        config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+        for _, reply in SESSION_TURNS:
+            payload = {"user_response": f"build service {index % openings}: a task tracker with sync"} if reply is None else Command(resume=reply)
+            await graph.ainvoke(payload, config, durability=orchestrator.GRAPH_DURABILITY)
+        sizes.append(held_bytes(checkpointer) if backend == "memory" else sum(stored_bytes(path).values()))
+    return sizes, ({} if backend == "memory" else stored_bytes(path))
+
+
+def summary(sizes: List[int], tables: dict) -> dict:
+    half = len(sizes) // 2
+    return {
+        "sessions": len(sizes),
+        "bytes": sizes[-1],
+        "first_session_bytes": sizes[0],
+        # what one more session costs once the shared content is stored
+        "late_bytes_per_session": round((sizes[-1] - sizes[half]) / (len(sizes) - 1 - half)) if len(sizes) > 1 else None,
+        **({"tables": tables} if tables else {}),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="checkpoint bytes held in memory and on disk over many sessions, with the message store on and off")
+    parser.add_argument("-n", "--sessions", type=int, default=40, help="review sessions per run")
+    parser.add_argument("--openings", type=int, default=4, help="distinct opening requests the sessions cycle through")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="backends to compare")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        responses = os.path.join(directory, "responses.json")
+        os.environ.update({
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_RESPONSES": responses,
+            "LLM_CACHE": "false",
+            "QUERY_CACHE": "false",
+            "SPECULATIVE_PLANNER": "false",
+            "CHECKPOINT_DURABILITY": "sync",
+        })
+        sample_responses(responses)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for backend in args.backends.split(","):
+                for mode, store in MODES.items():
+                    sizes, tables = asyncio.run(run_mode(backend, store, args.sessions, args.openings, os.path.join(directory, f"{backend}_{mode}.db")))
+                    results[f"{backend}/{mode}"] = summary(sizes, tables)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"  {'':18s} {'sessions':>8s} {'bytes':>11s} {'1st session':>11s} {'late/session':>12s}")
+    for name, row in results.items():
+        tables = " ".join(f"{table}={size}" for table, size in row.get("tables", {}).items())
+        print(f"  {name:18s} {row['sessions']:8d} {row['bytes']:11d} {row['first_session_bytes']:11d} {row['late_bytes_per_session']:12d}  {tables}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
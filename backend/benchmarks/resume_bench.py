@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+from benchmarks.graph_bench import Samples, time_checkpointer
+
+BACKENDS = ("memory", "sqlite", "tiered")
+
+
+def seed_threads(checkpointer, template: str, count: int) -> list:
+    '''
+    copies the stored rows of the `template` thread to `count` new threads, so a store
+    holds thousands of paused reviews without running thousands of sessions. the copies
+    share the template's message store entries, as sessions with the same history would
+    '''
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    thread_ids = [uuid.uuid4().hex for _ in range(count)]
+    # the tiered saver's template thread is hot, the copies start out spilled to disk
+    if hasattr(checkpointer, "flush"):
+        checkpointer.flush()
+    saver = getattr(checkpointer, "cold", checkpointer)
+    if isinstance(saver, InMemorySaver):
+        with saver.lock:
+            blobs = [(key, value) for key, value in saver.blobs.items() if key[0] == template]
+            writes = [(key, value) for key, value in saver.writes.items() if key[0] == template]
+            for thread_id in thread_ids:
+                for ns, checkpoints in saver.storage[template].items():
+                    saver.storage[thread_id][ns] = dict(checkpoints)
+                for (_, ns, channel, version), value in blobs:
+                    saver.blobs[(thread_id, ns, channel, version)] = value
+                for (_, ns, cid), value in writes:
+                    saver.writes[(thread_id, ns, cid)] = dict(value)
+        return thread_ids
+    rows = saver.export_thread(template)
+    # one commit for the lot, every table has thread_id as its first column
+    with saver.transaction():
+        for thread_id in thread_ids:
+            saver.replace_thread(thread_id, {table: [(thread_id, *row[1:]) for row in values] for table, values in rows.items()})
+    return thread_ids
+
+
+async def run_backend(backend: str, threads: int, resumes: int, path: str, seed: int) -> dict:
+    '''
+    one review paused at the architect's interrupt, copied to `threads` threads, then
+    `resumes` of them picked at random are approved. every resume is timed end to end,
+    and so is the checkpoint read it starts with
+    '''
+    from langgraph.types import Command
+    from graphs.orchestrator import build_checkpointer, graph_invoker, GRAPH_DURABILITY
+
+    checkpoints = Samples()
+    checkpointer = time_checkpointer(build_checkpointer(backend, path), checkpoints)
+    graph = graph_invoker(checkpointer=checkpointer)
+    template = uuid.uuid4().hex
+    await graph.ainvoke({"user_response": "a task tracker with offline sync"}, {"configurable": {"thread_id": template}}, durability=GRAPH_DURABILITY)
+
+    started = time.perf_counter()
+    thread_ids = seed_threads(checkpointer, template, threads)
+    seeded = time.perf_counter() - started
+
+    checkpoints.values.clear()
+    turns = Samples()
+    for thread_id in random.Random(seed).sample(thread_ids, min(resumes, len(thread_ids))):
+        started = time.perf_counter()
+        await graph.ainvoke(Command(resume="approve"), {"configurable": {"thread_id": thread_id}}, durability=GRAPH_DURABILITY)
+        turns.add("resume", time.perf_counter() - started)
+    result = {"threads": threads + 1, "seed_seconds": round(seeded, 2), **turns.report(), **checkpoints.report()}
+    if hasattr(checkpointer, "stats"):
+        result["tier"] = checkpointer.stats()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="resume latency of a paused review with thousands of threads stored, per checkpointer backend")
+    parser.add_argument("-t", "--threads", type=int, default=10000, help="paused threads stored before the resumes")
+    parser.add_argument("-n", "--resumes", type=int, default=300, help="threads resumed and timed")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="backends to compare")
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model seconds to first token, 0 leaves only the graph's own work")
+    parser.add_argument("--seed", type=int, default=7, help="picks the resumed threads")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "LLM_CACHE": "false",
+        "QUERY_CACHE": "false",
+        "SPECULATIVE_PLANNER": "false",
+        "CHECKPOINT_DURABILITY": "sync",
+    })
+    results = {}
+    with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for backend in args.backends.split(","):
+            results[backend] = asyncio.run(run_backend(backend, args.threads, args.resumes, os.path.join(directory, f"{backend}.db"), args.seed))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"  {'':8s} {'threads':>8s} {'resumes':>8s} {'p50 ms':>8s} {'p95 ms':>8s} {'load p50':>9s} {'load p95':>9s}")
+    for backend, result in results.items():
+        resume, load = result["resume"], result["aget_tuple"]
+        print(
+            f"  {backend:8s} {result['threads']:8d} {resume['count']:8d} {resume['p50_ms']:8.2f} {resume['p95_ms']:8.2f}"
+            f" {load['p50_ms']:9.2f} {load['p95_ms']:9.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
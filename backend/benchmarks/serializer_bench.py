@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from typing import Any, List
+
+# the turns of the recorded session, None starts it
+SESSION_TURNS = [None, "also support offline mode", "approve", "split the rollout into two phases", "add a migration section", "approve"]
+
+
+class RecordingSerializer:
+    '''
+    passes through to langgraph's serializer and keeps every value the checkpointer
+    serialized, so each codec is measured on exactly what a session writes
+    '''
+
+    def __init__(self):
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+        self.serde = JsonPlusSerializer()
+        self.values: List[Any] = []
+
+    def dumps_typed(self, obj: Any):
+        self.values.append(obj)
+        return self.serde.dumps_typed(obj)
+
+    def loads_typed(self, data):
+        return self.serde.loads_typed(data)
+
+
+def sample_responses(path: str):
+    '''
+    scripted answers with the length and shape of real blueprints: the planner's own
+    instructions are long markdown, unlike the fake model's padded template answers
+    '''
+    from prompts.planner import planner_backstory
+    from prompts.architect import architect_backstory
+
+    with open(path, "w") as f:
+        json.dump([planner_backstory(), architect_backstory(), planner_backstory()[::-1]], f)
+
+
+async def record_session() -> List[Any]:
+    from langgraph.types import Command
+    from langgraph.checkpoint.memory import InMemorySaver
+    from graphs.orchestrator import graph_invoker
+
+    serde = RecordingSerializer()
+    graph = graph_invoker(checkpointer=InMemorySaver(serde=serde))
+    config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+    for reply in SESSION_TURNS:
+        payload = {"user_response": "a task tracker with offline sync"} if reply is None else Command(resume=reply)
+        await graph.ainvoke(payload, config)
+    return serde.values
+
+
+def measure(serde, values: List[Any], repeat: int) -> dict:
+    encoded = [serde.dumps_typed(value) for value in values]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            serde.dumps_typed(value)
+    encode = (time.perf_counter() - started) / repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            serde.loads_typed(data)
+    decode = (time.perf_counter() - started) / repeat
+    turns = len(SESSION_TURNS)
+    return {
+        "bytes_per_turn": round(sum(len(data) for _, data in encoded) / turns),
+        "encode_ms_per_turn": round(1000 * encode / turns, 3),
+        "decode_ms_per_turn": round(1000 * decode / turns, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="bytes written and encode / decode time per turn for every checkpoint codec")
+    parser.add_argument("-r", "--repeat", type=int, default=20, help="times every value is encoded and decoded")
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        responses = os.path.join(directory, "responses.json")
+        os.environ.update({
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_RESPONSES": responses,
+            "LLM_CACHE": "false",
+            "QUERY_CACHE": "false",
+            "SPECULATIVE_PLANNER": "false",
+        })
+        sample_responses(responses)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            values = asyncio.run(record_session())
+
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    from persistence.serializer import CODECS, CompressedSerializer
+
+    results["msgpack (langgraph default)"] = measure(JsonPlusSerializer(), values, args.repeat)
+    for codec, (_, _, module) in CODECS.items():
+        if module is None:
+            results[codec] = {"skipped": f"{codec} is not installed"}
+            continue
+        results[codec] = measure(CompressedSerializer(codec), values, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{len(values)} values serialized over {len(SESSION_TURNS)} turns")
+    print(f"  {'':28s} {'bytes/turn':>11s} {'encode ms':>10s} {'decode ms':>10s}")
+    for name, row in results.items():
+        if "skipped" in row:
+            print(f"  {name:28s} {row['skipped']}")
+            continue
+        print(f"  {name:28s} {row['bytes_per_turn']:11d} {row['encode_ms_per_turn']:10.3f} {row['decode_ms_per_turn']:10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
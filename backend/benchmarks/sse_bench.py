@@ -0,0 +1,160 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import subprocess
+
+from benchmarks.graph_bench import Samples
+
+# mode -> SSE_FLUSH_MS; sse.py reads it when it is imported, so every mode runs in a
+# process of its own
+MODES = {"per_token": "0", "coalesced": "50"}
+
+
+async def chat_session(http, index: int, turns: Samples) -> int:
+    '''
+    starts a review, then approves the architect's answer through /workflow/chat and reads
+    the planner's streamed answer to the end. returns the bytes received
+    '''
+    response = await http.post("/workflow/start", json={"initial_query": f"service {index}: a task tracker with sync"})
+    response.raise_for_status()
+    thread_id = response.json()["thread_id"]
+    received = 0
+    started = time.perf_counter()
+    async with http.stream("POST", "/workflow/chat", json={"run_id": thread_id, "query": "approve"}) as response:
+        response.raise_for_status()
+        async for text in response.aiter_text():
+            received += len(text)
+    turns.add("chat", time.perf_counter() - started)
+    return received
+
+
+async def token_source(tokens: int):
+    # one token per event, ten of them per millisecond: a provider streaming every token
+    # as its own chunk
+    for index in range(tokens):
+        yield "token", {"token": f"word{index} "}
+        if index % 10 == 9:
+            await asyncio.sleep(0.001)
+    yield "done", {}
+
+
+async def run_framing(streams: int, tokens: int) -> dict:
+    '''
+    sse_stream alone over synthetic token streams, without the graph whose cpu dwarfs the
+    framing in the end to end run
+    '''
+    import sse
+
+    async def read() -> int:
+        return sum([1 async for _ in sse.sse_stream(token_source(tokens))])
+
+    cpu = time.process_time()
+    frames = await asyncio.gather(*(read() for _ in range(streams)))
+    cpu = time.process_time() - cpu
+    return {"streams": streams, "frames_per_stream": round(sum(frames) / streams, 1), "cpu_ms_per_stream": round(1000 * cpu / streams, 2)}
+
+
+async def run_mode(sessions: int) -> dict:
+    '''
+    all sessions at once against one app. cpu is the process time of the whole run,
+    graph and in-process client included; the framing is a small share of it, which
+    run_framing measures on its own
+    '''
+    import httpx
+    import main
+    import sse
+    from graphs.orchestrator import graph_invoker
+
+    # the startup hook also renders the graph png, which needs the network
+    main.graph = graph_invoker()
+    turns = Samples()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as http:
+        # warms up imports and the compiled graph
+        await chat_session(http, -1, Samples())
+        before = sse.stats()
+        cpu = time.process_time()
+        started = time.perf_counter()
+        received = await asyncio.gather(*(chat_session(http, i, turns) for i in range(sessions)))
+        elapsed = time.perf_counter() - started
+        cpu = time.process_time() - cpu
+    after = sse.stats()
+    frames = after["frames"] - before["frames"]
+    return {
+        "sessions": sessions,
+        "seconds": round(elapsed, 3),
+        "events": after["events"] - before["events"],
+        "frames": frames,
+        "frames_per_second": round(frames / elapsed, 1),
+        "frames_per_session": round(frames / sessions, 1),
+        "bytes_per_session": round(sum(received) / sessions),
+        "cpu_ms_per_session": round(1000 * cpu / sessions, 2),
+        "chat": turns.report()["chat"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sse frames and process cpu per streamed planner turn and per synthetic token stream, every token framed vs coalesced")
+    parser.add_argument("-n", "--sessions", type=int, default=50, help="concurrent chat sessions per mode")
+    parser.add_argument("--tokens", type=int, default=2000, help="tokens per fake answer")
+    parser.add_argument("--tps", type=float, default=2000.0, help="fake model tokens per second")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake model seconds to first token")
+    parser.add_argument("--modes", default=",".join(MODES), help="modes to compare")
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        os.environ.update({
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_LATENCY": str(args.latency),
+            "FAKE_LLM_TPS": str(args.tps),
+            "FAKE_LLM_TOKENS": str(args.tokens),
+            "SSE_FLUSH_MS": MODES[args.mode],
+            "LLM_RPM": str(10 ** 5),
+            "LLM_TPM": str(10 ** 9),
+            "CHECKPOINT_BACKEND": "memory",
+            "SESSION_BACKEND": "memory",
+            "LLM_CACHE": "false",
+            "QUERY_CACHE": "false",
+            "SPECULATIVE_PLANNER": "false",
+        })
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(run_mode(args.sessions))
+            result["framing"] = asyncio.run(run_framing(args.sessions, args.tokens))
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    forwarded = [arg for arg in (argv if argv is not None else sys.argv[1:]) if arg != "--json"]
+    for mode in args.modes.split(","):
+        done = subprocess.run(
+            [sys.executable, "-m", "benchmarks.sse_bench", *forwarded, "--mode", mode],
+            stdout=subprocess.PIPE, check=True, text=True,
+        )
+        results[mode] = json.loads(done.stdout.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"  {'':10s} {'events':>7s} {'frames':>7s} {'frames/s':>9s} {'frames/sess':>11s} {'cpu ms/sess':>11s} {'chat p50 ms':>11s} {'chat p95 ms':>11s}")
+    for mode, result in results.items():
+        chat = result["chat"]
+        print(
+            f"  {mode:10s} {result['events']:7d} {result['frames']:7d} {result['frames_per_second']:9.1f} {result['frames_per_session']:11.1f}"
+            f" {result['cpu_ms_per_session']:11.2f} {chat['p50_ms']:11.1f} {chat['p95_ms']:11.1f}"
+        )
+    print(f"framing only, {args.tokens} tokens per stream")
+    print(f"  {'':10s} {'streams':>7s} {'frames/stream':>13s} {'cpu ms/stream':>13s}")
+    for mode, result in results.items():
+        framing = result["framing"]
+        print(f"  {mode:10s} {framing['streams']:7d} {framing['frames_per_stream']:13.1f} {framing['cpu_ms_per_stream']:13.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+
+from benchmarks.graph_bench import SESSION_TURNS
+from benchmarks.message_store_bench import held_bytes
+
+# the unbounded in-memory saver against the capped tier in front of sqlite. the tier reads
+# SESSION_CACHE_BYTES / SESSION_CACHE_TTL when it is imported and peak RSS is per process,
+# so every run gets a process of its own
+BACKENDS = ("memory", "tiered")
+
+
+async def run_backend(backend: str, sessions: int, concurrency: int, path: str) -> dict:
+    '''
+    review sessions interleaved `concurrency` at a time, so every turn comes back to a
+    thread that other sessions' turns may have pushed out of the tier. the bytes of state
+    held in memory are sampled after every turn
+    '''
+    from langgraph.types import Command
+    from graphs.orchestrator import build_checkpointer, graph_invoker, GRAPH_DURABILITY
+
+    checkpointer = build_checkpointer(backend, path)
+    graph = graph_invoker(checkpointer=checkpointer)
+    limit = asyncio.Semaphore(concurrency)
+    peak = 0
+
+    def held() -> int:
+        # the tier counts its hot bytes itself, the plain saver holds every thread
+        return checkpointer.stats()["hot_bytes"] if backend == "tiered" else held_bytes(checkpointer)
+
+    async def session(index: int):
+        nonlocal peak
+        async with limit:
+            config = {"configurable": {"thread_id": uuid.uuid4().hex}}
+            for _, reply in SESSION_TURNS:
+                payload = {"user_response": f"build service {index}: a task tracker with sync"} if reply is None else Command(resume=reply)
+                await graph.ainvoke(payload, config, durability=GRAPH_DURABILITY)
+                peak = max(peak, held())
+
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    result = {"held_bytes": held(), "peak_held_bytes": peak, "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+    if backend == "tiered":
+        stats = checkpointer.stats()
+        result.update({name: stats[name] for name in ("max_bytes", "hot_threads", "hits", "misses", "hit_rate", "evictions", "spills")})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="state held in memory, peak rss and tier hit rate / evictions for the memory and tiered checkpointers")
+    parser.add_argument("-n", "--sessions", type=int, default=300, help="review sessions per backend")
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="sessions in flight at once")
+    parser.add_argument("--caps", default=f"{1024 * 1024},{128 * 1024}", help="SESSION_CACHE_BYTES of the tier, one run per cap")
+    parser.add_argument("--ttl", type=float, default=900.0, help="SESSION_CACHE_TTL of the tier")
+    parser.add_argument("--tokens", type=int, default=400, help="tokens per fake answer")
+    parser.add_argument("--latency", type=float, default=0.01, help="fake model seconds to first token")
+    parser.add_argument("--backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--cap", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="print one json document instead of a table")
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        os.environ.update({
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_LATENCY": str(args.latency),
+            "FAKE_LLM_TOKENS": str(args.tokens),
+            "SESSION_CACHE_BYTES": str(args.cap),
+            "SESSION_CACHE_TTL": str(args.ttl),
+            "LLM_CACHE": "false",
+            "QUERY_CACHE": "false",
+            "SPECULATIVE_PLANNER": "false",
+            "CHECKPOINT_DURABILITY": "sync",
+        })
+        with tempfile.TemporaryDirectory() as directory, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = asyncio.run(run_backend(args.backend, args.sessions, args.concurrency, os.path.join(directory, "sessions.db")))
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    forwarded = [arg for arg in (argv if argv is not None else sys.argv[1:]) if arg != "--json"]
+    runs = [("memory", "memory", 0)] + [(f"tiered {int(cap) // 1024}k", "tiered", int(cap)) for cap in args.caps.split(",")]
+    for name, backend, cap in runs:
+        done = subprocess.run(
+            [sys.executable, "-m", "benchmarks.tiered_bench", *forwarded, "--backend", backend, "--cap", str(cap)],
+            stdout=subprocess.PIPE, check=True, text=True,
+        )
+        results[name] = json.loads(done.stdout.strip().splitlines()[-1])
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"  {'':12s} {'held bytes':>11s} {'peak held':>11s} {'rss MB':>7s} {'hit rate':>9s} {'evictions':>10s} {'spills':>7s}")
+    for name, result in results.items():
+        hit_rate = f"{result['hit_rate']:.3f}" if result.get("hit_rate") is not None else "-"
+        print(
+            f"  {name:12s} {result['held_bytes']:11d} {result['peak_held_bytes']:11d} {result['max_rss_mb']:7.1f}"
+            f" {hit_rate:>9s} {result.get('evictions', '-'):>10} {result.get('spills', '-'):>7}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import os
+from typing import List, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from prompts.summary import summary_backstory
+from agents.factory import get_managed_llm
+from agents.router import model_router
+
+# the last HISTORY_KEEP_TURNS review turns are resent verbatim, older ones are folded into a summary
+HISTORY_KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "4"))
+# verbatim turns are also folded once they exceed this many (estimated) tokens
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "8000"))
+# tag of the summary calls, they run inside the nodes so the streaming api has to skip them
+SUMMARY_TAG = "history_summary"
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    '''
+    cheap token estimate (~4 characters per token), counting tokens through the provider
+    would cost a network round trip per turn
+    '''
+    return sum(len(str(message.content)) // 4 + 4 for message in messages)
+
+
+def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+    '''
+    groups a message history into turns, every turn starts at a human message so tool
+    calls and their results always stay together
+    '''
+    turns = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def render_turns(turns: List[List[BaseMessage]]) -> str:
+    lines = []
+    for turn in turns:
+        for message in turn:
+            if message.content:
+                lines.append(f"{message.type}: {message.content}")
+    return "\n".join(lines)
+
+
+class RollingHistory:
+    '''
+    keeps the prompt of a review loop bounded. the last `keep_turns` turns stay verbatim,
+    older turns are folded into a running summary. folding is incremental: only the turns
+    being evicted are sent to the model together with the previous summary. without a
+    model the shared default llm is used (cached and scheduled like the agents).
+    '''
+
+    def __init__(self, model=None, keep_turns: int = HISTORY_KEEP_TURNS, max_tokens: int = HISTORY_MAX_TOKENS):
+        self.model = model
+        self.keep_turns = keep_turns
+        self.max_tokens = max_tokens
+
+    def _cut(self, messages: List[BaseMessage]) -> Tuple[List[List[BaseMessage]], List[List[BaseMessage]]]:
+        '''
+        splits the history into (turns to fold, turns to keep verbatim)
+        '''
+        turns = split_turns(messages)
+        cut = max(len(turns) - self.keep_turns, 0)
+        # the newest turn always stays verbatim, even when it alone is over budget
+        while cut < len(turns) - 1 and estimate_tokens([m for turn in turns[cut:] for m in turn]) > self.max_tokens:
+            cut += 1
+        return turns[:cut], turns[cut:]
+
+    def compact(self, summary: str, messages: List[BaseMessage]) -> Tuple[str, List[BaseMessage], List[BaseMessage]]:
+        '''
+        returns (summary, kept messages, folded messages). the caller removes the folded
+        messages from the state so they are not checkpointed again.
+        '''
+        folded_turns, kept_turns = self._cut(messages)
+        if not folded_turns:
+            return summary, messages, []
+        summary = self.summarize(summary, folded_turns)
+        return summary, [m for turn in kept_turns for m in turn], [m for turn in folded_turns for m in turn]
+
+    async def acompact(self, summary: str, messages: List[BaseMessage]) -> Tuple[str, List[BaseMessage], List[BaseMessage]]:
+        folded_turns, kept_turns = self._cut(messages)
+        if not folded_turns:
+            return summary, messages, []
+        summary = await self.asummarize(summary, folded_turns)
+        return summary, [m for turn in kept_turns for m in turn], [m for turn in folded_turns for m in turn]
+
+    def _summary_request(self, summary: str, turns: List[List[BaseMessage]]) -> List[BaseMessage]:
+        request = f"Current summary:\n{summary or '(empty)'}\n\nTurns to fold in:\n{render_turns(turns)}"
+        return [SystemMessage(content=summary_backstory()), HumanMessage(content=request)]
+
+    def summarize(self, summary: str, turns: List[List[BaseMessage]]) -> str:
+        request = self._summary_request(summary, turns)
+        model = self.model or get_managed_llm(model_router.model(model_router.pick("summary", estimate_tokens(request))))
+        return str(model.with_config(tags=[SUMMARY_TAG]).invoke(request).content).strip()
+
+    async def asummarize(self, summary: str, turns: List[List[BaseMessage]]) -> str:
+        request = self._summary_request(summary, turns)
+        if self.model is not None:
+            return str((await self.model.with_config(tags=[SUMMARY_TAG]).ainvoke(request)).content).strip()
+        tier = model_router.pick("summary", estimate_tokens(request))
+        async with model_router.track("summary", tier):
+            response = await get_managed_llm(model_router.model(tier)).with_config(tags=[SUMMARY_TAG]).ainvoke(request)
+        return str(response.content).strip()
+
+    @staticmethod
+    def with_summary(summary: str, messages: List[BaseMessage]) -> List[BaseMessage]:
+        '''
+        prepends the running summary to the verbatim turns
+        '''
+        if not summary:
+            return list(messages)
+        return [HumanMessage(content=f"Summary of the earlier conversation:\n{summary}")] + list(messages)
@@ -1,22 +1,51 @@
 from typing import TypedDict, Annotated, List
 import os
-import operator
 from dotenv import load_dotenv
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
-from langchain.agents import create_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langgraph.graph.message import add_messages
 from prompts.architect import architect_backstory
 from pydantic import BaseModel, Field
 from prompts.planner import planner_backstory
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
 from langgraph.types import Command, interrupt
-from deepagents import create_deep_agent
+from langchain_core.runnables import RunnableConfig
+from langchain_core.callbacks import adispatch_custom_event
+from langchain.agents.structured_output import ProviderStrategy
+from persistence.sqlite_saver import SqliteSaver, CHECKPOINT_DB
+from persistence.message_store import ContentAddressedSerializer, MemoryMessageStore, SqliteMessageStore
+from persistence.serializer import CompressedSerializer
+from persistence.tiered_saver import TieredSaver
+from persistence.memory_saver import LockedMemorySaver
+from persistence.background_writer import BackgroundWriter
+from graphs.history import RollingHistory, estimate_tokens
+from graphs.speculation import SpeculativePlanner, SPECULATIVE_PLANNER
+from graphs.sectioned_planner import PLANNER_MODE, generate_blueprint
+from agents.factory import register_agent, get_agent
+from agents.query_index import get_query_index
+from agents.deadlines import with_deadline
+from agents.router import model_router
+from agents.partial_json import ListItemParser
 
 load_dotenv()
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-os.environ["GOOGLE_API_KEY"] = GEMINI_API_KEY
+# "sqlite" keeps interrupted reviews across restarts, "tiered" adds a bounded in-memory tier
+# of hot sessions on top of it, "memory" is handy for local debugging
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "sqlite")
+# store each message body once and keep only references in the checkpoints
+MESSAGE_STORE = os.getenv("MESSAGE_STORE", "true").lower() == "true"
+# "sync" commits every checkpoint before the graph moves on, "async" hands checkpoints to a
+# background writer that batches them per thread, "exit" only persists when the run stops
+# at an interrupt or ends (a crash mid-run loses the run, not the session before it)
+CHECKPOINT_DURABILITY = os.getenv("CHECKPOINT_DURABILITY", "sync")
+# langgraph's own durability setting, passed to every invoke / stream call. with the
+# background writer the puts return at once, so langgraph can wait on them as in sync mode
+GRAPH_DURABILITY = "exit" if CHECKPOINT_DURABILITY == "exit" else "sync"
+# first-turn queries close enough to an earlier one reuse its goals (agents/query_index.py)
+QUERY_CACHE = os.getenv("QUERY_CACHE", "true").lower() == "true"
+# seconds a node's llm work may take (queueing, summarizing and the agent call), the
+# architect asks short clarifying questions, the planner writes whole blueprints
+ARCHITECT_DEADLINE = float(os.getenv("ARCHITECT_DEADLINE", "60"))
+PLANNER_DEADLINE = float(os.getenv("PLANNER_DEADLINE", "180"))
 
 class GraphState(TypedDict):
     '''
@@ -29,16 +58,17 @@ class GraphState(TypedDict):
     planner_response: str
     final_architect_response: str
     final_planner_response: str
-    architect_messages: Annotated[list, operator.add]
-    planner_messages: Annotated[list, operator.add]
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", # Using 1.5-flash as 2.5 is not yet public
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
+    # add_messages merges by message id, so nodes only hand back the messages of their own turn
+    architect_messages: Annotated[list, add_messages]
+    planner_messages: Annotated[list, add_messages]
+    # running summaries of the review turns that were folded out of the message lists
+    architect_summary: str
+    planner_summary: str
+
+# bounds the prompt of the architect and planner review loops, summaries use the shared llm
+history_manager = RollingHistory()
+# background planner runs started while the architect's goals are under review
+speculative_planner = SpeculativePlanner(PLANNER_DEADLINE)
 #------------------------------------------------------------------ARCHITECT AGENT------------------------------------------------
 class ArchitectOutput(BaseModel):
     """Structured output for the architect agent."""
@@ -49,62 +79,135 @@ class ArchitectOutput(BaseModel):
         description="A list of questions to ask the user to clarify any ambiguities or gather more information."
     )
 
-architect_agent = create_agent(
-    model=llm,
-    system_prompt=architect_backstory(),
-    tools=[],
-    response_format=ArchitectOutput
-)
+# agents are built by the factory on their first request, all on one shared model client.
+# the architect answers in the provider's json mode: gemini sends a function call's args
+# in one piece, json mode text streams, so goals and questions reach the client one by one
+register_agent("architect", architect_backstory, response_format=ProviderStrategy(ArchitectOutput))
+
+# field -> (section header, line shown when the field is empty), in the order they are rendered
+ARCHITECT_SECTIONS = {
+    "project_goals": ("## Project Goals\n", "project goals are not properly defined. Answer the below follow-up questions\n"),
+    "follow_up_questions": ("\n## Follow-up Questions\n", "No follow-up questions.\n"),
+}
+
+def format_architect_output(structured_output: ArchitectOutput) -> str:
+    '''
+    renders the architect's structured output as the markdown shown for review
+    '''
+    formatted_response = ""
+    for field, (header, empty) in ARCHITECT_SECTIONS.items():
+        formatted_response += header
+        items = getattr(structured_output, field)
+        if items:
+            for i, item in enumerate(items, 1):
+                formatted_response += f"{i}. {item}\n"
+        else:
+            formatted_response += empty
+    return formatted_response
 
-def architect_node(state: GraphState):  # <-- Remove 'checkpointer'
+class ArchitectOutputStream:
+    '''
+    renders the architect's structured output while its json is still streaming in. every
+    goal and question is handed out as soon as the model closes it, with the markdown it
+    adds; when the fields arrive in schema order (they do) the pieces add up to
+    format_architect_output() of the finished object.
+    '''
+
+    def __init__(self):
+        self.parser = ListItemParser()
+        self.sections = list(ARCHITECT_SECTIONS)
+        self.position = -1
+        self.filled = set()
+
+    def _move_to(self, position: int) -> str:
+        markdown = ""
+        while self.position < position:
+            if self.position >= 0 and self.sections[self.position] not in self.filled:
+                markdown += ARCHITECT_SECTIONS[self.sections[self.position]][1]
+            self.position += 1
+            if self.position < len(self.sections):
+                markdown += ARCHITECT_SECTIONS[self.sections[self.position]][0]
+        return markdown
+
+    def feed(self, text: str) -> List[dict]:
+        events = []
+        for field, index, value in self.parser.feed(text):
+            if field not in ARCHITECT_SECTIONS:
+                continue
+            position = self.sections.index(field)
+            # an item of a section that was already closed is still reported, it just
+            # cannot be placed in the markdown any more
+            markdown = ""
+            if position >= self.position:
+                markdown = self._move_to(position) + f"{index + 1}. {value}\n"
+                self.filled.add(field)
+            events.append({"field": field, "index": index, "value": value, "token": markdown})
+        return events
+
+    def finish(self) -> str:
+        '''
+        the markdown of the sections that got no items, once the output is complete
+        '''
+        return self._move_to(len(self.sections))
+
+@with_deadline(ARCHITECT_DEADLINE)
+async def architect_node(state: GraphState, config: RunnableConfig):  # <-- Remove 'checkpointer'
     '''
     this node will pass user response to the agent
     '''
     user_response = state['user_response']
+    thread_id = config["configurable"]["thread_id"]
+    # the user sent feedback instead of approving, a plan for the old goals is of no use
+    if SPECULATIVE_PLANNER:
+        speculative_planner.cancel(thread_id)
 
     # === REMOVE ALL MANUAL LOADING ===
     # Get messages directly from state. Default to empty list if it's the first run.
-    messages = state.get('architect_messages', [])
+    history = state.get('architect_messages', [])
+    # near-duplicates of an earlier opening request get that request's goals back. decided
+    # on the stored history, compaction may leave none of it verbatim on a later turn
+    first_turn = QUERY_CACHE and not history and not state.get('architect_summary')
+    # fold old review turns into the running summary so the prompt stays flat
+    summary, history, folded = await history_manager.acompact(state.get('architect_summary', ''), history)
 
     # Add the new user message
-    messages.append(HumanMessage(content=user_response))
+    messages = history_manager.with_summary(summary, history) + [HumanMessage(content=user_response)]
 
-    response = architect_agent.invoke(
-        {
-            "messages": messages
-        }
-    )
+    cached = get_query_index().lookup(user_response) if first_turn else None
+    if cached is not None:
+        structured_output = ArchitectOutput(**cached)
+        new_messages = [HumanMessage(content=user_response), AIMessage(content=structured_output.model_dump_json())]
+    else:
+        tier = model_router.pick("architect", estimate_tokens(messages))
+        async with model_router.track("architect", tier):
+            response = await get_agent("architect", model_router.model(tier)).ainvoke(
+                {
+                    "messages": messages
+                }
+            )
 
-    # Get the full, updated history from the agent's response
-    new_messages = response['messages'] 
-    # architect_response = response['messages'][-1].content
-    structured_output: ArchitectOutput = response.get('structured_response')
+        # the agent echoes the history back, only the messages of this turn go into the state
+        new_messages = response['messages'][len(messages) - 1:]
+        # architect_response = response['messages'][-1].content
+        structured_output: ArchitectOutput = response.get('structured_response')
+        if first_turn and structured_output:
+            get_query_index().add(user_response, structured_output.model_dump())
 
     if structured_output:
-        # (Your existing formatting logic is fine)
-        formatted_response = "## Project Goals\n"
-        if structured_output.project_goals:
-            for i, goal in enumerate(structured_output.project_goals, 1):
-                formatted_response += f"{i}. {goal}\n"
-        else:
-            formatted_response += "project goals are not properly defined. Answer the below follow-up questions\n"
-        
-        formatted_response += "\n## Follow-up Questions\n"
-        if structured_output.follow_up_questions:
-            for i, question in enumerate(structured_output.follow_up_questions, 1):
-                formatted_response += f"{i}. {question}\n"
-        else:
-            formatted_response += "No follow-up questions.\n"
-        
-        architect_response = formatted_response
+        architect_response = format_architect_output(structured_output)
     else:
         architect_response = response['messages'][-1].content
     
+    # goals are often approved unchanged, so the planner starts on them during the review
+    if SPECULATIVE_PLANNER and structured_output and structured_output.project_goals:
+        speculative_planner.start(thread_id, blueprint_request(architect_response))
+
     # Return the new state. The checkpointer will automatically save this.
     print("--- [Architect Node] ---")
     return {
         'architect_response': architect_response,
-        'architect_messages': new_messages,  # <-- This saves the memory
+        'architect_messages': [RemoveMessage(id=m.id) for m in folded] + new_messages,  # <-- This saves the memory
+        'architect_summary': summary,
         'agent_node': 'architect'
     }
 
@@ -125,45 +228,82 @@ def architect_response_review_node(state: GraphState):
 #     else:
 #         return "agent"
 #----------------------------------------------------------------PLANNER AGENT----------------------------------------------------
-planner_agent = create_agent(
-    model=llm,
-    system_prompt=planner_backstory(),
-    tools=[]
-)
+register_agent("planner", planner_backstory)
+
+async def stream_planner_token(token: str):
+    # planner output that does not come from a single streamed model call reaches the
+    # streaming api as custom events
+    await adispatch_custom_event("planner_token", {"token": token})
 
-def planner_node(state: GraphState):  # <-- Remove 'checkpointer'
+def blueprint_request(architect_response: str) -> str:
+    '''
+    the planner's opening request, built from the goals section of the architect's response
+    '''
+    l=architect_response.split("##")
+    input_msg = "Higher Level Objectives: \n\n"
+    input_msg+= l[1]
+    input_msg += "\n\n the above are the user goals to be achieved, generate an end-to end plan to make the goals to reality."
+    return input_msg
+
+@with_deadline(PLANNER_DEADLINE)
+async def planner_node(state: GraphState, config: RunnableConfig):  # <-- Remove 'checkpointer'
     '''
     this node will pass user response to the agent, using conversational memory from state
     '''
     # === REMOVE ALL MANUAL LOADING ===
     # Get messages directly from state.
-    messages = state.get('planner_messages', [])
+    history = state.get('planner_messages', [])
+    summary, folded = state.get('planner_summary', ''), []
 
     # Add the new user message
+    # the first answer is the whole blueprint, revisions only rework parts of it
+    route = 'planner'
+    response = None
     if state["agent_node"] == 'architect':
-        l=state["architect_response"].split("##")
-        input_msg = "Higher Level Objectives: \n\n"
-        input_msg+= l[1]
-        input_msg += "\n\n the above are the user goals to be achieved, generate an end-to end plan to make the goals to reality."
+        input_msg = blueprint_request(state["architect_response"])
         messages = [HumanMessage(content=input_msg)]
+        summary = ''
+        speculation = None
+        if SPECULATIVE_PLANNER:
+            speculation = speculative_planner.take(config["configurable"]["thread_id"], input_msg)
+        if speculation is not None:
+            # replay what the background run streamed so far, then follow it live
+            replayed = 0
+            async for chunk in speculation.follow():
+                await stream_planner_token(chunk)
+                replayed += len(chunk)
+            response = await speculative_planner.result(speculation)
+            if response is None and replayed:
+                # the run failed after part of it was sent, the planner's own answer replaces it
+                await adispatch_custom_event("planner_reset", {"discard": replayed})
+        if response is None and PLANNER_MODE == "sections":
+            # sections are written concurrently and streamed in document order
+            blueprint = await generate_blueprint(input_msg, stream_planner_token)
+            response = {"messages": messages + [AIMessage(content=blueprint)]}
     else:
+        route = 'planner_revision'
         input_msg = state["user_response"]
-        messages.append(HumanMessage(content=input_msg))
+        summary, history, folded = await history_manager.acompact(summary, history)
+        messages = history_manager.with_summary(summary, history) + [HumanMessage(content=input_msg)]
     
-    response = planner_agent.invoke(
-        {
-            "messages": messages
-        }
-    )
+    if response is None:
+        tier = model_router.pick(route, estimate_tokens(messages))
+        async with model_router.track(route, tier):
+            response = await get_agent("planner", model_router.model(tier)).ainvoke(
+                {
+                    "messages": messages
+                }
+            )
     print("\n--- [Planner Node] ---")
     # === REMOVE ALL MANUAL SAVING ===
-    new_messages = response['messages']
+    new_messages = response['messages'][len(messages) - 1:]
     planner_response = response['messages'][-1].content
     
     # Return the new state. The checkpointer will automatically save this.
     return {
         'planner_response': planner_response,
-        'planner_messages': new_messages,  # <-- This saves the memory
+        'planner_messages': [RemoveMessage(id=m.id) for m in folded] + new_messages,  # <-- This saves the memory
+        'planner_summary': summary,
         'agent_node': 'planner'
     }
 
@@ -187,11 +327,7 @@ def decision_node(state: GraphState):
         return "agent"
 
 #----------------------------------------------------------------CODER AGENT----------------------------------------------------    
-coder_agent = create_agent(
-    model=llm,
-    system_prompt=planner_backstory(),
-    tools=[]
-)
+register_agent("coder", planner_backstory)
 
 def coder_node(state: GraphState):
     '''
@@ -207,12 +343,36 @@ def coder_node(state: GraphState):
     }
 
 #----------------------------------------------------------------GRAPH INVOKER----------------------------------------------------
-def graph_invoker():
+def build_checkpointer(backend: str = CHECKPOINT_BACKEND, path: str = CHECKPOINT_DB):
+    '''
+    returns the checkpointer for `backend` (CHECKPOINT_BACKEND unless given), sqlite based
+    ones store at `path`
+    '''
+    # compression is picked by CHECKPOINT_COMPRESSION, the message store compresses its bodies too
+    serde = CompressedSerializer()
+    if backend == "memory":
+        if MESSAGE_STORE:
+            serde = ContentAddressedSerializer(MemoryMessageStore(), serde=serde)
+        # the compactor prunes it from its own thread, under the saver's lock
+        return LockedMemorySaver(serde=serde)
+    saver = SqliteSaver(path, serde=serde)
+    if MESSAGE_STORE:
+        # the background writer serializes inside the saver's transaction, the store has
+        # to write through the same connection
+        saver.serde = ContentAddressedSerializer(SqliteMessageStore(path, conn=saver.conn, lock=saver.lock), serde=serde)
+    if backend == "tiered":
+        saver = TieredSaver(saver)
+    if CHECKPOINT_DURABILITY == "async":
+        saver = BackgroundWriter(saver)
+    return saver
+
+def graph_invoker(checkpointer=None):
     '''
     this module will invoke the entire graph network
     '''
     builder = StateGraph(GraphState)
-    checkpointer = MemorySaver()
+    if checkpointer is None:
+        checkpointer = build_checkpointer()
 
     builder.add_node("architect_agent", architect_node)
     builder.add_node("architect_review", architect_response_review_node)
@@ -0,0 +1,101 @@
+import os
+import asyncio
+from typing import Awaitable, Callable, List, Optional
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from prompts.planner import planner_sections, planner_outline_backstory, planner_section_backstory
+from agents.factory import get_managed_llm
+from agents.router import model_router
+from graphs.history import estimate_tokens
+
+# "single" writes the blueprint in one generation, "sections" writes a short outline and
+# then every section of planner_backstory() as its own concurrent call
+PLANNER_MODE = os.getenv("PLANNER_MODE", "single")
+# tag of the section calls, their raw tokens interleave so the streaming api skips them
+SECTION_TAG = "planner_section"
+
+Emit = Callable[[str], Awaitable[None]]
+
+
+async def _generate(route: str, messages: list, emit: Optional[Emit] = None) -> str:
+    tier = model_router.pick(route, estimate_tokens(messages))
+    model = get_managed_llm(model_router.model(tier)).with_config(tags=[SECTION_TAG])
+    text = ""
+    async with model_router.track(route, tier):
+        async for chunk in model.astream(messages):
+            if chunk.content:
+                text += chunk.content
+                if emit is not None:
+                    await emit(chunk.content)
+    return text
+
+
+class OrderedEmitter:
+    '''
+    forwards the chunks of concurrently written sections in document order. the first
+    unfinished section streams live, later ones are held until every section before them
+    is done and then flushed at once.
+    '''
+
+    def __init__(self, count: int, emit: Optional[Emit]):
+        self.emit = emit
+        self.buffers: List[List[str]] = [[] for _ in range(count)]
+        self.done = [False] * count
+        self.current = 0
+        self._lock = asyncio.Lock()
+
+    async def _send(self, text: str):
+        if self.emit is not None:
+            await self.emit(text)
+
+    def writer(self, index: int) -> Emit:
+        async def write(text: str):
+            async with self._lock:
+                if index == self.current:
+                    await self._send(text)
+                else:
+                    self.buffers[index].append(text)
+        return write
+
+    async def finish(self, index: int):
+        async with self._lock:
+            self.done[index] = True
+            while self.current < len(self.done) and self.done[self.current]:
+                self.current += 1
+                if self.current < len(self.done):
+                    for text in self.buffers[self.current]:
+                        await self._send(text)
+                    self.buffers[self.current] = []
+
+
+async def generate_blueprint(request: str, emit: Optional[Emit] = None) -> str:
+    '''
+    map-reduce version of the planner's first answer: one short outline call, then all
+    sections at once against the goals and that outline, merged in section order. the
+    merge is plain concatenation, a reduce call would be one long generation again.
+    '''
+    outline = await _generate("planner_outline", [SystemMessage(content=planner_outline_backstory()), HumanMessage(content=request)])
+    shared = f"{request}\n\nOutline (binding for every section):\n{outline}"
+    sections = planner_sections()
+    emitter = OrderedEmitter(len(sections), emit)
+
+    async def write_section(index: int, title: str, instructions: str) -> str:
+        number = index + 1
+        write = emitter.writer(index)
+        heading = f"## {number}. {title}\n\n"
+        await write(heading)
+        messages = [SystemMessage(content=planner_section_backstory(number, title, instructions)), HumanMessage(content=shared)]
+        text = heading + await _generate("planner_section", messages, write) + "\n\n"
+        await write("\n\n")
+        await emitter.finish(index)
+        return text
+
+    tasks = [asyncio.ensure_future(write_section(i, title, body)) for i, (title, body) in enumerate(sections)]
+    try:
+        parts = await asyncio.gather(*tasks)
+    except BaseException:
+        # one failed section fails the blueprint, the others would only burn tokens
+        for task in tasks:
+            task.cancel()
+        raise
+    return "".join(parts)
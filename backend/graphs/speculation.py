@@ -0,0 +1,278 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+import threading
+import contextvars
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from agents.factory import get_agent
+from agents.router import model_router
+from agents.scheduler import scheduling
+from agents.deadlines import deadline
+from graphs.history import estimate_tokens
+from graphs.sectioned_planner import PLANNER_MODE, generate_blueprint
+
+logger = logging.getLogger(__name__)
+
+# start the planner on the architect's goals while the user is still reviewing them
+SPECULATIVE_PLANNER = os.getenv("SPECULATIVE_PLANNER", "false").lower() == "true"
+# a run nobody took is dropped after this long, finished or not
+SPECULATIVE_PLANNER_TTL = float(os.getenv("SPECULATIVE_PLANNER_TTL", "900"))
+
+
+class Speculation:
+    '''
+    one background planner run for a thread. the chunks it streamed so far are kept so a
+    request that takes it over can replay them and then follow the rest live.
+    '''
+
+    def __init__(self, request: str):
+        self.request = request
+        self.messages = [HumanMessage(content=request)]
+        self.started = time.monotonic()
+        self.chunks: List[str] = []
+        self.result: Optional[dict] = None
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _chunk(self, text: str):
+        self.chunks.append(text)
+        await self._notify()
+
+    async def run(self, seconds: Optional[float], session: str):
+        # runs in a fresh context: the architect's deadline, lane and callbacks stay behind
+        try:
+            with deadline(seconds), scheduling(lane="background", session=session):
+                if PLANNER_MODE == "sections":
+                    text = await generate_blueprint(self.request, self._chunk)
+                    self.result = {"messages": self.messages + [AIMessage(content=text)]}
+                    return
+                tier = model_router.pick("planner", estimate_tokens(self.messages))
+                async with model_router.track("planner", tier):
+                    agent = get_agent("planner", model_router.model(tier))
+                    async for mode, data in agent.astream({"messages": self.messages}, stream_mode=["messages", "values"]):
+                        if mode == "values":
+                            self.result = data
+                        elif isinstance(data[0], AIMessageChunk) and data[0].content:
+                            await self._chunk(data[0].content)
+        except BaseException as e:
+            self.error = e
+            if not isinstance(e, asyncio.CancelledError):
+                logger.warning("speculative planner run failed: %s", e)
+            raise
+        finally:
+            self.finished = True
+            self.finished_at = time.monotonic()
+            await self._notify()
+
+    async def follow(self) -> AsyncIterator[str]:
+        '''
+        yields every chunk of the run, the ones already streamed first
+        '''
+        position = 0
+        while True:
+            async with self._changed:
+                while position == len(self.chunks) and not self.finished:
+                    await self._changed.wait()
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.finished:
+                return
+
+    def tokens(self) -> int:
+        '''
+        tokens the run has cost so far, the provider's count once it is done
+        '''
+        usage = None
+        if self.result is not None:
+            usage = getattr(self.result["messages"][-1], "usage_metadata", None)
+        if usage:
+            return usage.get("total_tokens", 0)
+        return estimate_tokens(self.messages) + sum(len(str(chunk)) // 4 for chunk in self.chunks)
+
+
+class RunLedger:
+    '''
+    which process owns the speculative run of a thread. a run lives in the memory of the
+    process that started it, so with sessions kept in this process every run is its own
+    '''
+
+    def claim(self, thread_id: str, owner: str):
+        pass
+
+    def release(self, thread_id: str):
+        pass
+
+    def owned(self, owner: str, thread_ids: List[str]) -> Set[str]:
+        return set(thread_ids)
+
+
+class SqliteRunLedger:
+    '''
+    the owner of every thread's run in a sqlite table, for uvicorn workers sharing sessions
+    (SESSION_BACKEND=sqlite). the next request of a session may reach another worker: an
+    approval there runs the planner itself, feedback there starts the next run there.
+    either way the row is released or taken over, and the worker holding the old run
+    cancels it as orphaned the next time it reaps.
+    '''
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS speculative_runs (thread_id TEXT PRIMARY KEY, owner TEXT NOT NULL, started_at REAL NOT NULL)"
+        )
+
+    def _execute(self, query: str, params: tuple = ()):
+        with self._lock:
+            return self.conn.execute(query, params)
+
+    def claim(self, thread_id: str, owner: str):
+        self._execute("INSERT OR REPLACE INTO speculative_runs VALUES (?, ?, ?)", (thread_id, owner, time.time()))
+
+    def release(self, thread_id: str):
+        self._execute("DELETE FROM speculative_runs WHERE thread_id = ?", (thread_id,))
+
+    def owned(self, owner: str, thread_ids: List[str]) -> Set[str]:
+        rows = self._execute("SELECT thread_id FROM speculative_runs WHERE owner = ?", (owner,)).fetchall()
+        return {row[0] for row in rows} & set(thread_ids)
+
+
+class SpeculativePlanner:
+    '''
+    pre-generates the blueprint while the architect's goals are under review. start() is
+    called when the architect interrupts; an approval finds the run through take() and
+    gets its result, even half-way through; feedback to the architect cancels it through
+    cancel(). hits, misses and the tokens spent on cancelled runs are counted.
+
+    runs are owned by this process, the ledger records that for workers sharing sessions.
+    reap() cancels the runs another worker took over or released, and those older than ttl.
+    '''
+
+    def __init__(self, seconds: Optional[float] = None, ttl: float = SPECULATIVE_PLANNER_TTL, ledger=None):
+        self.seconds = seconds
+        self.ttl = ttl
+        self.ledger = ledger or RunLedger()
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._runs: Dict[str, Speculation] = {}
+        self._lock = threading.Lock()
+        self.counts = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "orphaned": 0, "failed": 0, "wasted_tokens": 0}
+        self.saved_seconds = 0.0
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counts[name] += amount
+
+    def start(self, thread_id: str, request: str) -> Speculation:
+        self.cancel(thread_id)
+        self.reap()
+        speculation = Speculation(request)
+        speculation.task = asyncio.get_running_loop().create_task(
+            speculation.run(self.seconds, thread_id), context=contextvars.Context()
+        )
+        # a failed run is reported when it is taken, this only keeps asyncio from logging it
+        speculation.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        with self._lock:
+            self._runs[thread_id] = speculation
+        self.ledger.claim(thread_id, self.owner)
+        self._count("started")
+        return speculation
+
+    def _drop(self, speculation: Speculation, reason: str):
+        speculation.task.cancel()
+        self._count(reason)
+        self._count("wasted_tokens", speculation.tokens())
+
+    def cancel(self, thread_id: str) -> bool:
+        '''
+        drops the run of a thread whose goals changed, returns whether this process had one.
+        a run another worker holds is released, that worker reaps it
+        '''
+        with self._lock:
+            speculation = self._runs.pop(thread_id, None)
+        self.ledger.release(thread_id)
+        if speculation is None:
+            return False
+        self._drop(speculation, "cancelled")
+        return True
+
+    def reap(self) -> int:
+        '''
+        cancels the runs of this process no request will take: released or taken over by
+        another worker, or older than ttl. returns how many
+        '''
+        with self._lock:
+            runs = dict(self._runs)
+        if not runs:
+            return 0
+        owned = self.ledger.owned(self.owner, list(runs))
+        now = time.monotonic()
+        reaped = 0
+        for thread_id, speculation in runs.items():
+            if thread_id in owned and now - speculation.started < self.ttl:
+                continue
+            with self._lock:
+                if self._runs.get(thread_id) is not speculation:
+                    continue
+                del self._runs[thread_id]
+            self._drop(speculation, "orphaned")
+            reaped += 1
+        return reaped
+
+    def take(self, thread_id: str, request: str) -> Optional[Speculation]:
+        '''
+        hands over the run started for exactly this request, None on a miss
+        '''
+        with self._lock:
+            speculation = self._runs.pop(thread_id, None)
+        self.ledger.release(thread_id)
+        if speculation is not None and speculation.request == request and speculation.error is None:
+            self._count("hits")
+            with self._lock:
+                # the head start the run got, the part of it the user does not wait for
+                self.saved_seconds += (speculation.finished_at or time.monotonic()) - speculation.started
+            return speculation
+        self._count("misses")
+        if speculation is not None:
+            speculation.task.cancel()
+            self._count("wasted_tokens", speculation.tokens())
+        return None
+
+    async def result(self, speculation: Speculation) -> Optional[dict]:
+        '''
+        waits for a taken run, None if it failed and the planner has to run after all
+        '''
+        try:
+            await asyncio.shield(speculation.task)
+        except asyncio.CancelledError:
+            if not speculation.task.cancelled():
+                raise
+        except Exception:
+            pass
+        if speculation.error is not None or speculation.result is None:
+            self._count("failed")
+            return None
+        return speculation.result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counts,
+                "running": len(self._runs),
+                "hit_rate": self.counts["hits"] / self.counts["started"] if self.counts["started"] else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
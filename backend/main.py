@@ -1,13 +1,37 @@
-import json
+import os
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
-from graphs.orchestrator import graph_invoker
+from graphs.orchestrator import graph_invoker, GRAPH_DURABILITY, ArchitectOutputStream, speculative_planner
 from langgraph.types import Command
 from fastapi.responses import StreamingResponse
 from IPython.display import Image, display
+from sessions.registry import SessionRegistry, SqliteSessionRegistry, SessionNotFound, SessionBusy
+from persistence.sqlite_saver import CHECKPOINT_DB, CheckpointConflict
+from persistence.retention import CheckpointCompactor
+import metrics
+from agents import factory as llm_factory
+from agents.cache import get_llm_cache
+from agents.query_index import get_query_index
+from agents import coalesce
+from agents.scheduler import get_scheduler, scheduling
+from agents.deadlines import DeadlineExceeded
+from agents import deadlines
+from agents.router import model_router
+from graphs.sectioned_planner import SECTION_TAG
+from graphs.history import SUMMARY_TAG
+from graphs.speculation import SqliteRunLedger, SPECULATIVE_PLANNER
+import sse
 
 app = FastAPI()
+# model calls with these tags are not streamed to the client
+HIDDEN_TAGS = {SECTION_TAG, SUMMARY_TAG}
+# "sqlite" shares sessions between uvicorn workers, "memory" keeps them in this process
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+sessions = SqliteSessionRegistry(CHECKPOINT_DB) if SESSION_BACKEND == "sqlite" else SessionRegistry()
+if SPECULATIVE_PLANNER and SESSION_BACKEND == "sqlite":
+    # a session's next request may reach another worker, runs are owned in the shared db
+    speculative_planner.ledger = SqliteRunLedger(CHECKPOINT_DB)
 
 # Allow CORS for Streamlit (adjust origins as needed)
 app.add_middleware(
@@ -27,25 +51,73 @@ class UserRequest(BaseModel):
 
 @app.on_event("startup")
 def startup_event():
-    global graph 
+    global graph, compactor
     graph = graph_invoker()
+    compactor = CheckpointCompactor(graph.checkpointer)
+    compactor.start()
+    if hasattr(graph.checkpointer, "stats"):
+        metrics.register("checkpointer", graph.checkpointer.stats)
+    metrics.register("llm", llm_factory.stats)
+    metrics.register("llm_cache", lambda: get_llm_cache().stats())
+    metrics.register("query_cache", lambda: get_query_index().stats())
+    metrics.register("llm_coalescing", coalesce.stats)
+    metrics.register("llm_scheduler", lambda: get_scheduler().stats())
+    metrics.register("llm_deadlines", deadlines.stats)
+    metrics.register("model_router", model_router.stats)
+    metrics.register("speculative_planner", speculative_planner.stats)
+    metrics.register("sse", sse.stats)
+    if llm_factory.LLM_CASSETTE_MODE != "off":
+        from agents.cassette import get_cassette
+
+        metrics.register("llm_cassette", lambda: get_cassette().stats())
     img_bytes = graph.get_graph().draw_mermaid_png()
     with open("graph.png", "wb") as f:
         f.write(img_bytes)
 
+@app.on_event("shutdown")
+def shutdown_event():
+    compactor.stop()
+    # the tiered checkpointer keeps hot sessions in memory only, the background writer may
+    # still hold queued checkpoints
+    if hasattr(graph.checkpointer, "flush"):
+        graph.checkpointer.flush()
+
+async def expire_idle_sessions():
+    '''
+    drops idle sessions from the registry along with their checkpoints, and speculative
+    runs no request will take
+    '''
+    for thread_id in sessions.expire_idle():
+        speculative_planner.cancel(thread_id)
+        await graph.checkpointer.adelete_thread(thread_id)
+    speculative_planner.reap()
+
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
+@app.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
+
+@app.get("/workflow/sessions")
+def list_sessions():
+    return {"active_sessions": len(sessions)}
+
 @app.post("/workflow/start")
-def start_workflow_endpoint(payload: InitRequest):
-    thread_id = "main-workflow"
-    config = {"configurable": {"thread_id": thread_id}}
+async def start_workflow_endpoint(payload: InitRequest):
+    await expire_idle_sessions()
+    session = sessions.create()
+    thread_id = session.thread_id
     init_state = {
         "user_response": payload.initial_query,
     }
-    intermediate_state = graph.invoke(init_state, config)
+    try:
+        with sessions.claim(thread_id), scheduling(lane="interactive", session=thread_id):
+            intermediate_state = await graph.ainvoke(init_state, session.config(), durability=GRAPH_DURABILITY)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
 
     if '__interrupt__' in intermediate_state:
         interrupt_data = intermediate_state['__interrupt__']
@@ -60,13 +132,14 @@ def start_workflow_endpoint(payload: InitRequest):
 
 
 @app.post("/workflow/architect_review")
-def architect_conversation(user_response: UserRequest):
+async def architect_conversation(user_response: UserRequest):
     try:
-        config = {"configurable": {"thread_id": user_response.run_id}}
-        state = graph.invoke(
-            Command(resume=user_response.query),
-            config
-        )
+        with sessions.claim(user_response.run_id) as session, scheduling(lane="interactive", session=session.thread_id):
+            state = await graph.ainvoke(
+                Command(resume=user_response.query),
+                session.config(),
+                durability=GRAPH_DURABILITY,
+            )
         
         if '__interrupt__' in state:
             interrupt_data = state['__interrupt__']
@@ -77,47 +150,90 @@ def architect_conversation(user_response: UserRequest):
         else:
             raise Exception("No interrupt found in state.")
         
+    except SessionBusy as e:
+        raise HTTPException(status_code=409, detail=f"session {e} is still processing a request")
+    except CheckpointConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=404, detail=str(e))
     return {"agent_output": agent_output, "agent_instruction": agent_instruction, 'agent_node': agent_node}
 
 @app.post("/workflow/chat")
 async def workflow_status(user_response: UserRequest):
+    try:
+        sessions.touch(user_response.run_id)
+    except SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=f"unknown session {e}")
+
     async def event_generator():
-        config = {"configurable": {"thread_id": user_response.run_id}}
-        
+        # (event, data) pairs, sse_stream frames them and merges consecutive tokens
+        # model run id -> the architect output being streamed by it
+        structured = {}
         try:
-            # Use astream_events and version "v1"
-            async for event in graph.astream_events(
-                Command(resume=user_response.query),
-                config,
-                version="v1" 
-            ):
-                kind = event["event"]
+            with sessions.claim(user_response.run_id) as session, scheduling(lane="interactive", session=session.thread_id):
+                # version "v2" also carries the custom events the planner sends when it
+                # serves a speculative run
+                async for event in graph.astream_events(
+                    Command(resume=user_response.query),
+                    session.config(),
+                    version="v2",
+                    durability=GRAPH_DURABILITY,
+                ):
+                    kind = event["event"]
                 
-                # Event 1: For streaming agents (like your planner_agent)
-                if kind == "on_chat_model_stream":
-                    chunk_content = event["data"]["chunk"].content
-                    if chunk_content:
-                        # Yield the token as a JSON object
-                        yield json.dumps({"token": chunk_content}) + "\n"
+                    # Event 1: For streaming agents (like your planner_agent)
+                    # the sectioned planner's calls interleave, it sends its text in order itself;
+                    # history summaries are internal and never reach the client
+                    if kind == "on_chat_model_stream" and not HIDDEN_TAGS.intersection(event.get("tags", [])):
+                        chunk = event["data"]["chunk"]
+                        chunk_content = chunk.text
+                        # the architect answers in json mode, its goals and questions are
+                        # sent one by one as their json completes
+                        if event["metadata"].get("agent") == "architect":
+                            stream = structured.setdefault(event["run_id"], ArchitectOutputStream())
+                            for item in stream.feed(chunk_content):
+                                yield "item", item
+                        elif chunk_content:
+                            yield "token", {"token": chunk_content}
+
+                    # a plan pre-generated during the architect review, replayed by the planner
+                    elif kind == "on_custom_event" and event["name"] == "planner_token":
+                        yield "token", event["data"]
+
+                    # the replayed run failed half way, the client drops the text it got from it
+                    elif kind == "on_custom_event" and event["name"] == "planner_reset":
+                        yield "reset", event["data"]
+
+                    elif kind == "on_chat_model_end" and event["run_id"] in structured:
+                        trailer = structured.pop(event["run_id"]).finish()
+                        if trailer:
+                            yield "token", {"token": trailer}
                 
-                # Event 2: For interrupting agents (like your architect_agent)
-                elif kind == "on_interrupt":
-                    # This event is triggered by your 'architect_review_node'
-                    # The architect's full response is inside 'content_to_review'
-                    interrupt_data = event["data"]["output"][0].value
-                    content_to_review = interrupt_data.get("content_to_review")
+                    # Event 2: For interrupting agents (like your architect_agent)
+                    elif kind == "on_interrupt":
+                        # This event is triggered by your 'architect_review_node'
+                        # The architect's full response is inside 'content_to_review'
+                        interrupt_data = event["data"]["output"][0].value
+                        content_to_review = interrupt_data.get("content_to_review")
                     
-                    if content_to_review:
-                        # Yield the entire formatted response as a single "token"
-                        yield json.dumps({"token": content_to_review}) + "\n"
+                        if content_to_review:
+                            # Yield the entire formatted response as a single "token"
+                            yield "token", {"token": content_to_review}
+            yield "done", {}
 
+        except SessionBusy as e:
+            yield "error", {"error": f"session {e} is still processing a request"}
         except Exception as e:
             print(f"Error in stream: {e}")
-            yield json.dumps({"error": str(e)}) + "\n"
+            yield "error", {"error": str(e)}
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
+    return StreamingResponse(
+        sse.sse_stream(event_generator()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
     #     config = {"configurable": {"thread_id": user_response.run_id}}
     #     state = graph.invoke(
     #         Command(resume=user_response.query),
@@ -0,0 +1,18 @@
+from typing import Callable, Dict
+
+# name -> callable returning a json-serializable dict, collected by GET /metrics
+_sources: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, source: Callable[[], dict]):
+    '''
+    registers a metric source, a later registration under the same name replaces the earlier one
+    '''
+    _sources[name] = source
+
+
+def snapshot() -> dict:
+    '''
+    current values of every registered source
+    '''
+    return {name: source() for name, source in list(_sources.items())}
@@ -4,45 +4,15 @@ import os
 from typing import TypedDict, List, TYPE_CHECKING  # <-- Import List
 from dotenv import load_dotenv
 
-from langchain.agents import create_agent
 from langchain_core.messages import HumanMessage, BaseMessage  # <-- Import BaseMessage
 from langgraph.graph import StateGraph, END
 from langgraph.types import interrupt
-from langchain_google_genai import ChatGoogleGenerativeAI
-from pydantic import BaseModel, Field
+from agents.factory import get_agent
+# the orchestrator registers the "architect" agent with this schema, registering it again
+# here would replace the spec the graph runs on
+from graphs.orchestrator import ArchitectOutput, GraphState
 
-# Avoid circular import at runtime by importing GraphState only for type checking
-if TYPE_CHECKING:
-    from graphs.orchestrator import GraphState
-
-from prompts.architect import architect_backstory
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-os.environ["GOOGLE_API_KEY"] = GEMINI_API_KEY
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", # Using 1.5-flash as 2.5 is not yet public
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
-
-class ArchitectOutput(BaseModel):
-    """Structured output for the architect agent."""
-    project_goals: List[str] = Field(
-        description="A list of clear, rigid project goals derived from the user's request."
-    )
-    follow_up_questions: List[str] = Field(
-        description="A list of questions to ask the user to clarify any ambiguities or gather more information."
-    )
-
-architect_agent = create_agent(
-    model=llm,
-    system_prompt=architect_backstory(),
-    tools=[],
-    response_format= ArchitectOutput
-)
 
 def architect_node(state: GraphState):  # <-- Remove 'checkpointer'
     '''
@@ -52,19 +22,19 @@ def architect_node(state: GraphState):  # <-- Remove 'checkpointer'
 
     # === REMOVE ALL MANUAL LOADING ===
     # Get messages directly from state. Default to empty list if it's the first run.
-    messages = state.get('architect_messages', [])
+    history = state.get('architect_messages', [])
 
     # Add the new user message
-    messages.append(HumanMessage(content=user_response))
+    messages = history + [HumanMessage(content=user_response)]
 
-    response = architect_agent.invoke(
+    response = get_agent("architect").invoke(
         {
             "messages": messages
         }
     )
 
-    # Get the full, updated history from the agent's response
-    new_messages = response['messages']
+    # the agent echoes the history back, only the messages of this turn go into the state
+    new_messages = response['messages'][len(history):]
 
     structured_output: ArchitectOutput = response.get('structured_response')
 
@@ -4,34 +4,16 @@ import os
 from typing import TypedDict, List, TYPE_CHECKING  # <-- Import List
 from dotenv import load_dotenv
 
-from langchain.agents import create_agent
 from langchain_core.messages import HumanMessage, BaseMessage  # <-- Import BaseMessage
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.types import Command, interrupt
-from langchain_google_genai import ChatGoogleGenerativeAI
+from agents.factory import get_agent
+# the orchestrator registers the "planner" agent this node runs, registering it again
+# here would replace the spec the graph runs on
+from graphs.orchestrator import GraphState
 
-if TYPE_CHECKING:
-    from graphs.orchestrator import GraphState
-
-from prompts.planner import planner_backstory
 load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-os.environ["GOOGLE_API_KEY"] = GEMINI_API_KEY
-
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash", # Using 1.5-flash as 2.5 is not yet public
-    temperature=0,
-    max_tokens=None,
-    timeout=None,
-    max_retries=2,
-)
-
-planner_agent = create_agent(
-    model=llm,
-    system_prompt=planner_backstory(),
-    tools=[]
-)
 
 def planner_node(state: GraphState):  # <-- Remove 'checkpointer'
     '''
@@ -39,7 +21,7 @@ def planner_node(state: GraphState):  # <-- Remove 'checkpointer'
     '''
     # === REMOVE ALL MANUAL LOADING ===
     # Get messages directly from state.
-    messages = state.get('planner_messages', [])
+    history = state.get('planner_messages', [])
 
     # Add the new user message
     if state["agent_node"] == 'architect':
@@ -48,19 +30,20 @@ def planner_node(state: GraphState):  # <-- Remove 'checkpointer'
         input_msg += "\n\n the above are the user goals to be achieved, generate an end-to end plan to make the goals ton reality."
         # Start a new history for the planner
         messages = [HumanMessage(content=input_msg)]
+        history = []
     else:
         print("including user response for modifications")
         input_msg = state["user_response"]
-        messages.append(HumanMessage(content=input_msg))
+        messages = history + [HumanMessage(content=input_msg)]
     print("\n--- [Planner Node] DEBUG: Invoking agent... ---")
-    response = planner_agent.invoke(
+    response = get_agent("planner").invoke(
         {
             "messages": messages
         }
     )
     print("--- [Planner Node] DEBUG: Agent invocation complete. ---") # <-- ADD THIS
     # === REMOVE ALL MANUAL SAVING ===
-    new_messages = response['messages']
+    new_messages = response['messages'][len(history):]
     planner_response = response['messages'][-1].content
     
     # Return the new state. The checkpointer will automatically save this.
@@ -0,0 +1,227 @@
+import queue
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from persistence.retention import prune
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWriter(BaseCheckpointSaver[str]):
+    '''
+    moves checkpoint writes off the request path. put / put_writes queue the write and
+    return at once; a single writer thread drains the queue, groups the queued writes by
+    thread and commits each thread's writes in one transaction. reads of a thread wait
+    until its queued writes have landed, so a resume always sees the latest checkpoint.
+
+    a write that fails in the background (e.g. a CheckpointConflict) can no longer fail
+    the request that produced it. it is logged and kept for its thread, and the thread's
+    next get_tuple / put / put_writes raises it, so the next request of the session fails
+    instead of running on a checkpoint that never landed. the failed transaction rolls back
+    all of the thread's writes grouped with it; writes queued after it still run.
+    '''
+
+    def __init__(self, saver: BaseCheckpointSaver):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: dict = {}
+        # thread id -> the error of its last failed write, until the thread's next call raises it
+        self._failures: dict = {}
+        self._cond = threading.Condition()
+        self.batches = 0
+        self.writes = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    #------------------------------------------------------------------WRITER------------------------------------------------
+    def _enqueue(self, thread_id: str, op: tuple):
+        with self._cond:
+            self._pending[thread_id] = self._pending.get(thread_id, 0) + 1
+        self._queue.put((thread_id, op))
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(item is None for item in items):
+                items = [item for item in items if item is not None]
+                self._write(items)
+                return
+            self._write(items)
+
+    def _write(self, items: list):
+        by_thread: "OrderedDict[str, list]" = OrderedDict()
+        for thread_id, op in items:
+            by_thread.setdefault(thread_id, []).append(op)
+        transaction = getattr(self.saver, "transaction", nullcontext)
+        for thread_id, ops in by_thread.items():
+            try:
+                with transaction():
+                    for method, args in ops:
+                        getattr(self.saver, method)(*args)
+                self.batches += 1
+                self.writes += len(ops)
+            except Exception as error:
+                logger.exception("background checkpoint write failed for thread %s", thread_id)
+                with self._cond:
+                    self._failures[thread_id] = error
+                    self.failed += 1
+            finally:
+                with self._cond:
+                    self._pending[thread_id] -= len(ops)
+                    if not self._pending[thread_id]:
+                        del self._pending[thread_id]
+                    self._cond.notify_all()
+
+    def _raise_failure(self, thread_id: str):
+        with self._cond:
+            error = self._failures.pop(thread_id, None)
+        if error is not None:
+            raise error
+
+    def wait(self, thread_id: Optional[str] = None):
+        '''
+        blocks until the queued writes of one thread (or of every thread) have landed
+        '''
+        with self._cond:
+            self._cond.wait_for(lambda: not (self._pending.get(thread_id) if thread_id else self._pending))
+
+    def flush(self):
+        self.wait()
+        if hasattr(self.saver, "flush"):
+            self.saver.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self) -> dict:
+        stats = dict(self.saver.stats()) if hasattr(self.saver, "stats") else {}
+        with self._cond:
+            queued = sum(self._pending.values())
+        stats.update({"queued_writes": queued, "write_batches": self.batches, "coalesced_writes": self.writes, "failed_writes": self.failed})
+        return stats
+
+    #------------------------------------------------------------------SAVER API------------------------------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        self.wait(thread_id)
+        self._raise_failure(thread_id)
+        return self.saver.get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        self.wait(config["configurable"]["thread_id"] if config else None)
+        return self.saver.list(config, filter=filter, before=before, limit=limit)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        self._raise_failure(thread_id)
+        self._enqueue(thread_id, ("put", (config, checkpoint, metadata, new_versions)))
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": config["configurable"].get("checkpoint_ns", ""),
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        self._raise_failure(thread_id)
+        self._enqueue(thread_id, ("put_writes", (config, list(writes), task_id, task_path)))
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.wait(thread_id)
+        with self._cond:
+            self._failures.pop(thread_id, None)
+        self.saver.delete_thread(thread_id)
+
+    # compaction goes straight to the wrapped saver
+    def prune(self, policy, now: Optional[float] = None) -> int:
+        return prune(self.saver, policy, now)
+
+    def typed_values(self, type_: str) -> list:
+        self.wait()
+        return self.saver.typed_values(type_)
+
+    def vacuum(self, min_free_ratio: float = 0.2):
+        if hasattr(self.saver, "vacuum"):
+            self.saver.vacuum(min_free_ratio)
+
+    #------------------------------------------------------------------ASYNC------------------------------------------------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    # queueing never touches the disk, so the async writes need no worker thread
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return self.saver.get_next_version(current, channel)
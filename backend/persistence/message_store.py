@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import contextlib
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain_core.messages import BaseMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# serialized type tag of a message list that was swapped for content references
+REFS_TYPE = "msgrefs"
+# type tag of a message list stored as a chain of list nodes, the value is the digest of
+# its last node. a node holds the digest of the node before it and only the references of
+# the messages added since, so a checkpoint costs what its turn added, not the whole history
+LIST_TYPE = "msglist"
+# a digest that is re-used is re-touched at most this often, the sweeper only deletes
+# digests untouched for twice as long so it never races a checkpoint being written
+MESSAGE_TOUCH_INTERVAL = float(os.getenv("MESSAGE_TOUCH_INTERVAL", "600"))
+
+
+class MemoryMessageStore:
+    '''
+    content-addressed message bodies kept in process memory
+    '''
+
+    def __init__(self):
+        self._items: Dict[str, Tuple[str, bytes, float]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, digest: str, type_: str, data: bytes, now: float) -> bool:
+        with self._lock:
+            self._items[digest] = (type_, data, now)
+        return True
+
+    def get(self, digest: str) -> Tuple[str, bytes]:
+        type_, data, _ = self._items[digest]
+        return type_, data
+
+    def recent(self, type_: str, since: float) -> List[str]:
+        with self._lock:
+            return [d for d, (t, _, touched) in self._items.items() if t == type_ and touched >= since]
+
+    def sweep(self, referenced: Set[str], older_than: float) -> int:
+        with self._lock:
+            dead = [d for d, (_, _, touched) in self._items.items() if d not in referenced and touched < older_than]
+            for digest in dead:
+                del self._items[digest]
+        return len(dead)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class SqliteMessageStore:
+    '''
+    content-addressed message bodies in a table next to the checkpoints. given the
+    checkpointer's connection and lock it writes through them, so bodies stored while the
+    checkpointer holds a write transaction join it instead of waiting on its file lock.
+    put() tells whether the row is committed already or only part of that transaction.
+    '''
+
+    def __init__(self, path: str, conn: Optional[sqlite3.Connection] = None, lock=None):
+        self.lock = lock or threading.Lock()
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn = conn
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages (digest TEXT PRIMARY KEY, type TEXT NOT NULL, data BLOB, "
+            "touched_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        # the sweeper looks up recent list nodes by type
+        self.conn.execute("CREATE INDEX IF NOT EXISTS messages_type ON messages (type, touched_at)")
+
+    def put(self, digest: str, type_: str, data: bytes, now: float) -> bool:
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO messages VALUES (?, ?, ?, ?) ON CONFLICT(digest) DO UPDATE SET touched_at = excluded.touched_at",
+                (digest, type_, data, now),
+            )
+            return not self.conn.in_transaction
+
+    def get(self, digest: str) -> Tuple[str, bytes]:
+        with self.lock:
+            row = self.conn.execute("SELECT type, data FROM messages WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        return row
+
+    def recent(self, type_: str, since: float) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute("SELECT digest FROM messages WHERE type = ? AND touched_at >= ?", (type_, since)).fetchall()
+        return [digest for (digest,) in rows]
+
+    def sweep(self, referenced: Set[str], older_than: float) -> int:
+        with self.lock:
+            candidates = self.conn.execute("SELECT digest FROM messages WHERE touched_at < ?", (older_than,)).fetchall()
+            dead = [(digest,) for (digest,) in candidates if digest not in referenced]
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("DELETE FROM messages WHERE digest = ?", dead)
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return len(dead)
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+
+def _prefix_digest(previous: str, ref: list) -> str:
+    return hashlib.blake2b(f"{previous}\0{ref[0]}\0{ref[1]}".encode(), digest_size=16).hexdigest()
+
+
+class ContentAddressedSerializer(SerializerProtocol):
+    '''
+    checkpoint serializer that stores every message once. the message body, minus its id,
+    goes into the store keyed by its hash, so the same content shared by turns,
+    checkpoints and sessions is kept a single time. lists of messages (the
+    architect/planner histories and their pending writes) become a chain of list nodes in
+    the store, each named by the digest of the whole (digest, message id) list up to it:
+    a history that grew by one turn is written as one node with that turn's references on
+    top of the node written for the history before it. everything else is passed through
+    to the inner serializer.
+    '''
+
+    def __init__(self, store, serde: Optional[SerializerProtocol] = None):
+        self.store = store
+        self.serde = serde or JsonPlusSerializer()
+        # digest (message or list node) -> last time this process touched it in the store.
+        # touches made inside the checkpointer's write transaction wait in _pending until it
+        # commits, a rolled back row must be written again by the next put that needs it
+        self._touched: Dict[str, float] = {}
+        self._pending: Dict[str, float] = {}
+
+    def _touch(self, digest: str, type_: str, data: bytes, now: float):
+        if self.store.put(digest, type_, data, now):
+            self._touched[digest] = now
+        else:
+            self._pending[digest] = now
+
+    def end_transaction(self, committed: bool):
+        '''
+        called by the checkpointer once the write transaction the store joined is over
+        '''
+        pending, self._pending = self._pending, {}
+        if committed:
+            self._touched.update(pending)
+
+    def _put_message(self, message: BaseMessage, now: float) -> list:
+        type_, data = self.serde.dumps_typed(message.model_copy(update={"id": None}))
+        digest = hashlib.blake2b(type_.encode() + b"\0" + data, digest_size=16).hexdigest()
+        if now - self._touched.get(digest, float("-inf")) > MESSAGE_TOUCH_INTERVAL:
+            self._touch(digest, type_, data, now)
+        return [digest, message.id]
+
+    def _put_list(self, refs: list, now: float) -> str:
+        prefixes = []
+        previous = ""
+        for ref in refs:
+            previous = _prefix_digest(previous, ref)
+            prefixes.append(previous)
+        # the longest prefix this process stored recently enough that the sweeper keeps it,
+        # usually the same history one turn ago
+        base = 0
+        for position in range(len(prefixes), 0, -1):
+            if now - self._touched.get(prefixes[position - 1], float("-inf")) <= MESSAGE_TOUCH_INTERVAL:
+                base = position
+                break
+        head = prefixes[-1]
+        if base < len(refs):
+            node = [prefixes[base - 1] if base else None, refs[base:]]
+            self._touch(head, LIST_TYPE, json.dumps(node).encode(), now)
+        return head
+
+    def _load_list(self, head: str) -> list:
+        tails = []
+        digest = head
+        while digest is not None:
+            _, data = self.store.get(digest)
+            digest, tail = json.loads(data)
+            tails.append(tail)
+        return [ref for tail in reversed(tails) for ref in tail]
+
+    def walk(self, heads: Iterable[str]) -> Set[str]:
+        '''
+        every list node and message digest reachable from the list nodes `heads`
+        '''
+        reached: Set[str] = set()
+        for digest in heads:
+            while digest is not None and digest not in reached:
+                reached.add(digest)
+                try:
+                    _, data = self.store.get(digest)
+                except KeyError:
+                    break
+                digest, tail = json.loads(data)
+                reached.update(ref[0] for ref in tail)
+        return reached
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, list) and obj and all(isinstance(item, BaseMessage) for item in obj):
+            now = time.time()
+            refs = [self._put_message(message, now) for message in obj]
+            return LIST_TYPE, self._put_list(refs, now).encode()
+        return self.serde.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if type_ == LIST_TYPE:
+            refs = self._load_list(payload.decode())
+        elif type_ == REFS_TYPE:
+            # written before histories were chained
+            refs = json.loads(payload)
+        else:
+            return self.serde.loads_typed(data)
+        messages = []
+        for digest, message_id in refs:
+            message = self.serde.loads_typed(self.store.get(digest))
+            message.id = message_id
+            messages.append(message)
+        return messages
+
+    def sweep(self, referenced: Set[str]) -> int:
+        '''
+        deletes bodies no checkpoint references any more. list nodes too new to be deleted
+        may be the base of a checkpoint being written, so their chains are kept as well
+        '''
+        older_than = time.time() - 2 * MESSAGE_TOUCH_INTERVAL
+        referenced = referenced | self.walk(self.store.recent(LIST_TYPE, older_than))
+        removed = self.store.sweep(referenced, older_than)
+        self._touched = {d: t for d, t in self._touched.items() if d in referenced or t >= older_than}
+        return removed
+
+
+def _refs_in(values: Iterable[Tuple[str, bytes]]) -> Set[str]:
+    return {digest for type_, data in values if type_ == REFS_TYPE for digest, _ in json.loads(data)}
+
+
+def referenced_digests(checkpointer) -> Set[str]:
+    '''
+    collects every digest still referenced by the channel blobs and pending writes of a checkpointer
+    '''
+    if isinstance(checkpointer, InMemorySaver):
+        with getattr(checkpointer, "lock", None) or contextlib.nullcontext():
+            values = list(checkpointer.blobs.values())
+            values += [write[2] for writes in checkpointer.writes.values() for write in writes.values()]
+    else:
+        values = checkpointer.typed_values(REFS_TYPE) + checkpointer.typed_values(LIST_TYPE)
+    heads = {data.decode() for type_, data in values if type_ == LIST_TYPE}
+    return _refs_in(values) | checkpointer.serde.walk(heads)
+
+
+def sweep_message_store(checkpointer) -> int:
+    '''
+    garbage collects the message store behind a checkpointer, if it has one
+    '''
+    serde = checkpointer.serde
+    if not isinstance(serde, ContentAddressedSerializer):
+        return 0
+    return serde.sweep(referenced_digests(checkpointer))
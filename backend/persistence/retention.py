@@ -0,0 +1,178 @@
+import os
+import time
+import uuid
+import logging
+import threading
+import contextlib
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+from langgraph.checkpoint.memory import InMemorySaver
+from persistence.message_store import sweep_message_store
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+# 100-ns intervals between the uuid epoch (1582-10-15) and the unix epoch
+_UUID_EPOCH = 0x01B21DD213814000
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    '''
+    unix time a checkpoint was created at. langgraph's checkpoint ids are uuid6, time
+    first, so the age is read off the id without decoding the checkpoint
+    '''
+    value = uuid.UUID(checkpoint_id).int
+    timestamp = ((value >> 80) << 12) | ((value >> 64) & 0x0FFF)
+    return (timestamp - _UUID_EPOCH) / 1e7
+
+
+def checkpoint_id_at(seconds: float) -> str:
+    '''
+    the smallest checkpoint id langgraph hands out at `seconds`, ids compare as strings
+    '''
+    timestamp = int(seconds * 1e7) + _UUID_EPOCH
+    value = ((timestamp >> 12) & 0xFFFFFFFFFFFF) << 80 | (timestamp & 0x0FFF) << 64
+    # version 6 and the rfc 4122 variant, uuid.UUID only sets them for versions 1 to 5
+    value |= 6 << 76 | 0x8000 << 48
+    return str(uuid.UUID(int=value))
+
+
+@dataclass
+class RetentionPolicy:
+    '''
+    how many checkpoints a thread keeps. keep_last bounds the count per (thread, namespace),
+    max_age drops checkpoints older than that many seconds. the newest checkpoint of a
+    namespace is always kept, otherwise the thread could not be resumed.
+    '''
+    keep_last: Optional[int] = None
+    max_age: Optional[float] = None
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        keep_last = os.getenv("CHECKPOINT_KEEP_LAST", "20")
+        return cls(
+            keep_last=int(keep_last) if keep_last else None,
+            max_age=_env_float("CHECKPOINT_MAX_AGE"),
+        )
+
+    def select_expired(self, checkpoint_ids: Iterable[str], now: Optional[float] = None) -> List[str]:
+        '''
+        takes the checkpoint ids of one namespace and returns the ones to drop
+        '''
+        now = time.time() if now is None else now
+        # checkpoint ids are monotonic, newest first after sorting
+        ordered = sorted(checkpoint_ids, reverse=True)
+        expired = []
+        for position, checkpoint_id in enumerate(ordered):
+            if position == 0:
+                continue
+            if self.keep_last is not None and position >= max(self.keep_last, 1):
+                expired.append(checkpoint_id)
+            elif self.max_age is not None and now - checkpoint_time(checkpoint_id) > self.max_age:
+                expired.append(checkpoint_id)
+        return expired
+
+
+def orphan_blobs(kept: Iterable[dict], stored: Iterable[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    '''
+    returns the stored (channel, version) pairs that none of the kept checkpoints reference.
+    only versions older than the newest kept checkpoint count, a concurrent put may be
+    writing fresh versions for a checkpoint that is not stored yet.
+    '''
+    kept = list(kept)
+    if not kept:
+        return []
+    live = {
+        (channel, str(version))
+        for checkpoint in kept
+        for channel, version in checkpoint["channel_versions"].items()
+    }
+    newest = max(kept, key=lambda checkpoint: checkpoint["id"])["channel_versions"]
+    return [
+        (channel, version) for channel, version in stored
+        if (channel, str(version)) not in live and channel in newest and str(version) < str(newest[channel])
+    ]
+
+
+def prune_memory_saver(saver: InMemorySaver, policy: RetentionPolicy, now: Optional[float] = None) -> int:
+    '''
+    applies the policy to langgraph's in-memory saver, dropping expired checkpoints, their
+    pending writes and any channel blobs no remaining checkpoint points at. a saver with a
+    lock (persistence/memory_saver.py) is pruned holding it, the tiered saver holds its own
+    around its hot savers
+    '''
+    removed = 0
+    with getattr(saver, "lock", None) or contextlib.nullcontext():
+        for thread_id, namespaces in list(saver.storage.items()):
+            for checkpoint_ns, checkpoints in list(namespaces.items()):
+                expired = policy.select_expired(list(checkpoints), now)
+                if not expired:
+                    continue
+                for checkpoint_id in expired:
+                    checkpoints.pop(checkpoint_id, None)
+                    saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+                kept = [saver.serde.loads_typed(saved[0]) for saved in checkpoints.values()]
+                stored = [(k[2], k[3]) for k in saver.blobs if k[0] == thread_id and k[1] == checkpoint_ns]
+                for channel, version in orphan_blobs(kept, stored):
+                    saver.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+                removed += len(expired)
+    return removed
+
+
+def prune(checkpointer, policy: RetentionPolicy, now: Optional[float] = None) -> int:
+    '''
+    prunes any checkpointer this backend knows how to compact, returns the number of
+    checkpoints dropped
+    '''
+    if isinstance(checkpointer, InMemorySaver):
+        return prune_memory_saver(checkpointer, policy, now)
+    if hasattr(checkpointer, "prune"):
+        return checkpointer.prune(policy, now)
+    return 0
+
+
+class CheckpointCompactor:
+    '''
+    background thread that enforces the retention policy every `interval` seconds and
+    vacuums the storage afterwards
+    '''
+
+    def __init__(self, checkpointer, policy: Optional[RetentionPolicy] = None, interval: Optional[float] = None):
+        self.checkpointer = checkpointer
+        self.policy = policy or RetentionPolicy.from_env()
+        self.interval = interval if interval is not None else float(os.getenv("CHECKPOINT_COMPACT_INTERVAL", "300"))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> int:
+        removed = prune(self.checkpointer, self.policy)
+        sweep_message_store(self.checkpointer)
+        if hasattr(self.checkpointer, "vacuum"):
+            self.checkpointer.vacuum()
+        return removed
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                removed = self.run_once()
+                if removed:
+                    logger.info("checkpoint compaction dropped %d checkpoints", removed)
+            except Exception:
+                logger.exception("checkpoint compaction failed")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="checkpoint-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,109 @@
+import os
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # optional, zlib is used instead
+    zstandard = None
+
+try:
+    import lz4.block
+except ImportError:  # optional
+    lz4 = None
+
+# "auto" picks zstd when installed and zlib otherwise, "none" disables compression
+CHECKPOINT_COMPRESSION = os.getenv("CHECKPOINT_COMPRESSION", "auto")
+# values smaller than this are stored as is, compression frames cost more than they save
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "256"))
+
+
+def _zstd_codec(level: int) -> Tuple[Callable, Callable]:
+    # zstd (de)compressor objects are not thread safe, so one is built per call; the level
+    # 3 context is cheap next to the msgpack encoding of a state
+    def compress(data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    def decompress(data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    return compress, decompress
+
+
+def _lz4_codec(level: int) -> Tuple[Callable, Callable]:
+    # level 0 is lz4's fast mode, higher levels switch to its high compression mode
+    if level:
+        return (lambda data: lz4.block.compress(data, mode="high_compression", compression=level)), lz4.block.decompress
+    return lz4.block.compress, lz4.block.decompress
+
+
+def _zlib_codec(level: int) -> Tuple[Callable, Callable]:
+    return (lambda data: zlib.compress(data, level)), zlib.decompress
+
+
+CODECS: Dict[str, Tuple[Callable[[int], Tuple[Callable, Callable]], int, Any]] = {
+    # name -> (codec factory, default level, module that has to be importable)
+    "zstd": (_zstd_codec, 3, zstandard),
+    "lz4": (_lz4_codec, 0, lz4),
+    "zlib": (_zlib_codec, 6, zlib),
+}
+
+
+def resolve_codec(name: str) -> Optional[str]:
+    '''
+    maps a CHECKPOINT_COMPRESSION value onto an installed codec, None means no compression
+    '''
+    if name == "none":
+        return None
+    if name == "auto":
+        return "zstd" if zstandard is not None else "zlib"
+    if name not in CODECS:
+        raise ValueError(f"unknown checkpoint compression {name!r}, expected one of {sorted(CODECS)}")
+    if CODECS[name][2] is None:
+        raise ImportError(f"checkpoint compression {name!r} needs the {name} package installed")
+    return name
+
+
+class CompressedSerializer(SerializerProtocol):
+    '''
+    checkpoint serializer that block-compresses the msgpack output of langgraph's
+    serializer. compressed values carry the codec in their type tag ("msgpack+zstd"), so
+    checkpoints written with another codec, or without one, still load.
+    '''
+
+    def __init__(
+        self,
+        codec: str = CHECKPOINT_COMPRESSION,
+        level: Optional[int] = None,
+        min_size: int = COMPRESSION_MIN_SIZE,
+        serde: Optional[SerializerProtocol] = None,
+    ):
+        self.serde = serde or JsonPlusSerializer()
+        self.codec = resolve_codec(codec)
+        self.min_size = min_size
+        if self.codec is not None:
+            factory, default_level, _ = CODECS[self.codec]
+            self._compress, _ = factory(default_level if level is None else level)
+        self._decompressors: Dict[str, Callable] = {}
+
+    def _decompressor(self, codec: str) -> Callable:
+        if codec not in self._decompressors:
+            factory, default_level, _ = CODECS[resolve_codec(codec)]
+            self._decompressors[codec] = factory(default_level)[1]
+        return self._decompressors[codec]
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if self.codec is None or len(data) < self.min_size:
+            return type_, data
+        return f"{type_}+{self.codec}", self._compress(data)
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if "+" in type_:
+            type_, codec = type_.rsplit("+", 1)
+            payload = self._decompressor(codec)(payload)
+        return self.serde.loads_typed((type_, payload))
@@ -0,0 +1,494 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, AsyncIterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    SerializerProtocol,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from persistence.retention import checkpoint_id_at, orphan_blobs
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", "checkpoints.db")
+
+# the primary keys double as the (thread_id, checkpoint_ns, checkpoint_id) index, checkpoint ids
+# are monotonic so the latest checkpoint of a thread is a single index seek
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+) WITHOUT ROWID;
+-- the message store's sweeper collects the message lists of every thread by their type
+CREATE INDEX IF NOT EXISTS blobs_type ON blobs (type);
+CREATE INDEX IF NOT EXISTS writes_type ON writes (type);
+'''
+
+
+class CheckpointConflict(RuntimeError):
+    '''
+    raised when a checkpoint is written on top of a parent that another writer already moved past
+    '''
+
+
+class SqliteSaver(BaseCheckpointSaver[str]):
+    '''
+    file backed langgraph checkpointer so interrupted reviews survive a restart.
+
+    the database runs in WAL mode, so readers never block the writer, and every put /
+    put_writes call lands as one batched transaction.
+
+    it is safe to share between processes on one host (uvicorn --workers N): writers queue
+    on sqlite's file lock, and put() checks optimistically that its parent checkpoint is
+    still the newest one of the thread, so two workers resuming the same thread cannot
+    silently fork it.
+    '''
+
+    def __init__(self, path: str = CHECKPOINT_DB, *, serde: Optional[SerializerProtocol] = None, check_conflicts: bool = True):
+        super().__init__(serde=serde)
+        self.path = path
+        self.check_conflicts = check_conflicts
+        self.lock = threading.RLock()
+        self._depth = 0
+        # other processes hold the write lock for one short transaction, wait instead of failing
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode, only an OS crash can lose
+        # the last transactions
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    @contextmanager
+    def transaction(self):
+        '''
+        one write transaction, nested calls join the outer one so several puts can share a commit
+        '''
+        with self.lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            committed = False
+            try:
+                yield
+                self.conn.execute("COMMIT")
+                committed = True
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._depth = 0
+                # a message store writing through this connection only trusts its rows once committed
+                if hasattr(self.serde, "end_transaction"):
+                    self.serde.end_transaction(committed)
+
+    #------------------------------------------------------------------READS------------------------------------------------
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict:
+        if not versions:
+            return {}
+        channel_values = {}
+        pairs = [item for channel, version in versions.items() for item in (channel, str(version))]
+        rows = self.conn.execute(
+            "SELECT channel, type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? "
+            f"AND (channel, version) IN (VALUES {','.join(['(?, ?)'] * len(versions))})",
+            (thread_id, checkpoint_ns, *pairs),
+        ).fetchall()
+        for channel, type_, blob in rows:
+            if type_ != "empty":
+                channel_values[channel] = self.serde.loads_typed((type_, blob))
+        return channel_values
+
+    def _load_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        rows = self.conn.execute(
+            "SELECT task_id, channel, type, value FROM writes WHERE thread_id = ? AND checkpoint_ns = ? "
+            "AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return [(task_id, channel, self.serde.loads_typed((type_, value))) for task_id, channel, type_, value in rows]
+
+    def _row_to_tuple(self, row) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        checkpoint_: Checkpoint = self.serde.loads_typed((type_, checkpoint))
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **checkpoint_,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint_["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=self._load_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self.lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_tuple(row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_checkpoint_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_checkpoint_id)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.conn.execute(query, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            # metadata is stored serialized, so filtering happens after decoding
+            if filter:
+                metadata = self.serde.loads_typed((row[6], row[7]))
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            if limit is not None:
+                limit -= 1
+            with self.lock:
+                item = self._row_to_tuple(row)
+            yield item
+
+    #------------------------------------------------------------------WRITES------------------------------------------------
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        c = checkpoint.copy()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        values: dict = c.pop("channel_values")
+        blob_rows = []
+        for channel, version in new_versions.items():
+            type_, blob = self.serde.dumps_typed(values[channel]) if channel in values else ("empty", b"")
+            blob_rows.append((thread_id, checkpoint_ns, channel, str(version), type_, blob))
+        type_, serialized_checkpoint = self.serde.dumps_typed(c)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+        with self.transaction():
+            if self.check_conflicts and parent_checkpoint_id:
+                newer = self.conn.execute(
+                    "SELECT 1 FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id > ? "
+                    "AND checkpoint_id != ? LIMIT 1",
+                    (thread_id, checkpoint_ns, parent_checkpoint_id, checkpoint["id"]),
+                ).fetchone()
+                if newer:
+                    raise CheckpointConflict(
+                        f"thread {thread_id} moved past checkpoint {parent_checkpoint_id} in another worker"
+                    )
+            self.conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blob_rows)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    parent_checkpoint_id,
+                    type_,
+                    serialized_checkpoint,
+                    metadata_type,
+                    serialized_metadata,
+                ),
+            )
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # special writes (errors, interrupts...) replace earlier ones, regular writes are only written once
+        regular, special = [], []
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type_, blob, task_path)
+            (special if idx < 0 else regular).append(row)
+        with self.transaction():
+            self.conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+            self.conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.transaction():
+            for table in ("checkpoints", "blobs", "writes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def export_thread(self, thread_id: str) -> dict:
+        '''
+        returns the raw rows of one thread, table name -> rows in column order
+        '''
+        with self.lock:
+            return {
+                table: self.conn.execute(f"SELECT * FROM {table} WHERE thread_id = ?", (thread_id,)).fetchall()
+                for table in ("checkpoints", "blobs", "writes")
+            }
+
+    def replace_thread(self, thread_id: str, rows: dict) -> None:
+        '''
+        swaps the stored rows of one thread for `rows` (same shape as export_thread) in one transaction
+        '''
+        with self.transaction():
+            for table in ("checkpoints", "blobs", "writes"):
+                self.conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+                if rows.get(table):
+                    placeholders = ", ".join("?" * len(rows[table][0]))
+                    self.conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows[table])
+
+    #------------------------------------------------------------------COMPACTION------------------------------------------------
+    def prune(self, policy, now: Optional[float] = None) -> int:
+        '''
+        drops checkpoints expired under the retention policy together with their writes and
+        the channel blobs no remaining checkpoint references. returns the number dropped.
+        namespaces with too many or too old checkpoints are picked in sql off the primary
+        key, checkpoint ids sort by creation time, so only their kept checkpoints are decoded
+        '''
+        now = time.time() if now is None else now
+        conditions, params = [], []
+        if policy.keep_last is not None:
+            conditions.append("COUNT(*) > ?")
+            params.append(max(policy.keep_last, 1))
+        if policy.max_age is not None:
+            conditions.append("MIN(checkpoint_id) < ?")
+            params.append(checkpoint_id_at(now - policy.max_age))
+        if not conditions:
+            return 0
+        with self.lock:
+            # a single checkpoint is never dropped, it is the one the thread resumes from
+            namespaces = self.conn.execute(
+                "SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, checkpoint_ns "
+                f"HAVING COUNT(*) > 1 AND ({' OR '.join(conditions)})",
+                params,
+            ).fetchall()
+        removed = 0
+        for thread_id, checkpoint_ns in namespaces:
+            with self.lock:
+                ids = [
+                    checkpoint_id for (checkpoint_id,) in self.conn.execute(
+                        "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                        (thread_id, checkpoint_ns),
+                    )
+                ]
+                expired = policy.select_expired(ids, now)
+                if not expired:
+                    continue
+                rows = self.conn.execute(
+                    "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    f"AND checkpoint_id NOT IN ({','.join('?' * len(expired))})",
+                    (thread_id, checkpoint_ns, *expired),
+                ).fetchall()
+                kept = [self.serde.loads_typed((type_, blob)) for type_, blob in rows]
+                stored = self.conn.execute(
+                    "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                ).fetchall()
+                orphans = [
+                    (thread_id, checkpoint_ns, channel, version)
+                    for channel, version in orphan_blobs(kept, stored)
+                ]
+                with self.transaction():
+                    self.conn.executemany(
+                        "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in expired],
+                    )
+                    self.conn.executemany(
+                        "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                        [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in expired],
+                    )
+                    self.conn.executemany(
+                        "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                        orphans,
+                    )
+            removed += len(expired)
+        return removed
+
+    def typed_values(self, type_: str) -> list:
+        '''
+        returns every stored (type, bytes) value of one serialized type, across blobs and writes
+        '''
+        with self.lock:
+            return self.conn.execute(
+                "SELECT type, blob FROM blobs WHERE type = ? UNION ALL SELECT type, value FROM writes WHERE type = ?",
+                (type_, type_),
+            ).fetchall()
+
+    def vacuum(self, min_free_ratio: float = 0.2):
+        '''
+        folds the WAL back into the main file and rebuilds the database once enough pages are
+        free, VACUUM rewrites the whole file so it is skipped while the free list is small
+        '''
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            free_pages = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            total_pages = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            if total_pages and free_pages / total_pages >= min_free_ratio:
+                self.conn.execute("VACUUM")
+                self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    #------------------------------------------------------------------ASYNC------------------------------------------------
+    # sqlite calls are short and serialized by self.lock, running them in a worker thread
+    # keeps the event loop free while the disk syncs
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        # same version scheme as langgraph's MemorySaver so the two stay interchangeable
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        next_v = current_v + 1
+        next_h = random.random()
+        return f"{next_v:032}.{next_h:016}"
@@ -0,0 +1,291 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from persistence.retention import prune_memory_saver
+from persistence.sqlite_saver import SqliteSaver
+
+# hot sessions are kept in memory up to this many bytes of serialized state
+SESSION_CACHE_BYTES = int(os.getenv("SESSION_CACHE_BYTES", str(256 * 1024 * 1024)))
+# sessions idle for longer than this are spilled to disk even when under the byte cap
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "900"))
+
+
+def _thread_bytes(saver: InMemorySaver) -> int:
+    size = 0
+    for namespaces in saver.storage.values():
+        for checkpoints in namespaces.values():
+            for checkpoint, metadata, _ in checkpoints.values():
+                size += len(checkpoint[1]) + len(metadata[1])
+    size += sum(len(blob[1]) for blob in saver.blobs.values())
+    size += sum(len(write[2][1]) for writes in saver.writes.values() for write in writes.values())
+    return size
+
+
+class TieredSaver(BaseCheckpointSaver[str]):
+    '''
+    memory tier in front of the sqlite checkpointer. every hot thread lives in its own
+    InMemorySaver; when the tier grows past `max_bytes`, or a thread stays idle for `ttl`
+    seconds, the least recently used threads are written back to sqlite and dropped. the
+    next request for a spilled thread loads it back in one query.
+
+    writes only reach the disk on eviction or flush(), so a crash loses the hot sessions'
+    latest turns; run flush() on shutdown. the hot tier is private to one process, use the
+    plain sqlite backend when running several workers.
+    '''
+
+    def __init__(self, cold: SqliteSaver, max_bytes: int = SESSION_CACHE_BYTES, ttl: float = SESSION_CACHE_TTL):
+        super().__init__(serde=cold.serde)
+        self.cold = cold
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        # thread id -> saver, least recently used first
+        self.hot: "OrderedDict[str, InMemorySaver]" = OrderedDict()
+        self.sizes: dict = {}
+        self.last_used: dict = {}
+        self.dirty: set = set()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+
+    #------------------------------------------------------------------TIERING------------------------------------------------
+    def _load(self, thread_id: str) -> InMemorySaver:
+        saver = InMemorySaver(serde=self.serde)
+        rows = self.cold.export_thread(thread_id)
+        for thread, ns, cid, parent, type_, checkpoint, metadata_type, metadata in rows["checkpoints"]:
+            saver.storage[thread][ns][cid] = ((type_, checkpoint), (metadata_type, metadata), parent)
+        for thread, ns, channel, version, type_, blob in rows["blobs"]:
+            saver.blobs[(thread, ns, channel, version)] = (type_, blob)
+        for thread, ns, cid, task_id, idx, channel, type_, value, task_path in rows["writes"]:
+            saver.writes[(thread, ns, cid)][(task_id, idx)] = (task_id, channel, (type_, value), task_path)
+        return saver
+
+    def _dump(self, thread_id: str, saver: InMemorySaver) -> dict:
+        return {
+            "checkpoints": [
+                (thread_id, ns, cid, parent, checkpoint[0], checkpoint[1], metadata[0], metadata[1])
+                for ns, checkpoints in saver.storage.get(thread_id, {}).items()
+                for cid, (checkpoint, metadata, parent) in checkpoints.items()
+            ],
+            "blobs": [(thread, ns, channel, str(version), blob[0], blob[1]) for (thread, ns, channel, version), blob in saver.blobs.items()],
+            "writes": [
+                (thread, ns, cid, task_id, idx, channel, value[0], value[1], task_path)
+                for (thread, ns, cid), writes in saver.writes.items()
+                for (_, idx), (task_id, channel, value, task_path) in writes.items()
+            ],
+        }
+
+    def _saver(self, thread_id: str) -> InMemorySaver:
+        '''
+        returns the hot saver of a thread, loading it from disk on a miss
+        '''
+        saver = self.hot.get(thread_id)
+        if saver is not None:
+            self.hits += 1
+            self.hot.move_to_end(thread_id)
+        else:
+            saver = self._load(thread_id)
+            if saver.storage:
+                self.misses += 1
+            self.hot[thread_id] = saver
+            self.sizes[thread_id] = _thread_bytes(saver)
+            self.total_bytes += self.sizes[thread_id]
+        self.last_used[thread_id] = time.time()
+        return saver
+
+    def _resize(self, thread_id: str):
+        size = _thread_bytes(self.hot[thread_id])
+        self.total_bytes += size - self.sizes[thread_id]
+        self.sizes[thread_id] = size
+        self.dirty.add(thread_id)
+
+    def _evict(self, thread_id: str):
+        saver = self.hot.pop(thread_id)
+        if thread_id in self.dirty:
+            self.cold.replace_thread(thread_id, self._dump(thread_id, saver))
+            self.dirty.discard(thread_id)
+            self.spills += 1
+        self.total_bytes -= self.sizes.pop(thread_id)
+        self.last_used.pop(thread_id, None)
+        self.evictions += 1
+
+    def _enforce(self, keep: Optional[str] = None):
+        now = time.time()
+        for thread_id in list(self.hot):
+            over_cap = self.total_bytes > self.max_bytes
+            idle = now - self.last_used.get(thread_id, now) > self.ttl
+            if not over_cap and not idle:
+                break
+            # the thread being served stays hot even when it alone is over the cap
+            if thread_id != keep:
+                self._evict(thread_id)
+
+    def evict_idle(self):
+        with self.lock:
+            self._enforce()
+
+    def flush(self):
+        '''
+        writes every dirty hot thread back to disk, threads stay hot
+        '''
+        with self.lock:
+            for thread_id in list(self.dirty):
+                self.cold.replace_thread(thread_id, self._dump(thread_id, self.hot[thread_id]))
+            self.dirty.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hot_threads": len(self.hot),
+            "hot_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None,
+            "evictions": self.evictions,
+            "spills": self.spills,
+        }
+
+    #------------------------------------------------------------------SAVER API------------------------------------------------
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self.lock:
+            result = self._saver(thread_id).get_tuple(config)
+            self._enforce(keep=thread_id)
+            return result
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config is None:
+            # listing across threads reads the disk, so the hot tier is written back first
+            self.flush()
+            yield from self.cold.list(None, filter=filter, before=before, limit=limit)
+            return
+        with self.lock:
+            items = list(self._saver(config["configurable"]["thread_id"]).list(config, filter=filter, before=before, limit=limit))
+        yield from items
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        with self.lock:
+            result = self._saver(thread_id).put(config, checkpoint, metadata, new_versions)
+            self._resize(thread_id)
+            self._enforce(keep=thread_id)
+            return result
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self.lock:
+            self._saver(thread_id).put_writes(config, writes, task_id, task_path)
+            self._resize(thread_id)
+            self._enforce(keep=thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self.lock:
+            if thread_id in self.hot:
+                self.hot.pop(thread_id)
+                self.total_bytes -= self.sizes.pop(thread_id)
+                self.last_used.pop(thread_id, None)
+                self.dirty.discard(thread_id)
+            self.cold.delete_thread(thread_id)
+
+    #------------------------------------------------------------------COMPACTION------------------------------------------------
+    def prune(self, policy, now: Optional[float] = None) -> int:
+        removed = 0
+        with self.lock:
+            for thread_id, saver in list(self.hot.items()):
+                dropped = prune_memory_saver(saver, policy, now)
+                if dropped:
+                    removed += dropped
+                    self._resize(thread_id)
+            self._enforce()
+        # hot threads replace their disk rows wholesale on spill, so pruning their stale copies is harmless
+        return removed + self.cold.prune(policy, now)
+
+    def typed_values(self, type_: str) -> list:
+        with self.lock:
+            values = [
+                value
+                for saver in self.hot.values()
+                for value in list(saver.blobs.values()) + [w[2] for ws in saver.writes.values() for w in ws.values()]
+                if value[0] == type_
+            ]
+        return values + self.cold.typed_values(type_)
+
+    def vacuum(self, min_free_ratio: float = 0.2):
+        self.evict_idle()
+        self.cold.vacuum(min_free_ratio)
+
+    #------------------------------------------------------------------ASYNC------------------------------------------------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        return self.cold.get_next_version(current, channel)
@@ -1,3 +1,5 @@
+import re
+
 
 def planner_backstory():
     '''
@@ -76,4 +78,53 @@ def planner_backstory():
     - I need to the point crisp response for each section.
     
     '''
-    return prompt
\ No newline at end of file
+    return prompt
+
+def planner_sections():
+    '''
+    the numbered sections of the blueprint as (title, instructions), taken from the
+    mission in planner_backstory() so the sectioned planner asks for the same things
+    '''
+    mission = planner_backstory().split("Your Mission")[1].split("Output Format")[0]
+    sections = []
+    for line in mission.splitlines():
+        match = re.match(r"\s*(\d+)\. (.+)", line)
+        if match:
+            sections.append([match.group(2).strip(), []])
+        elif sections and line.strip():
+            sections[-1][1].append(line.strip())
+    return [(title, "\n".join(body)) for title, body in sections]
+
+
+def planner_outline_backstory():
+    '''
+    prompt for the short outline every section of a sectioned blueprint is written against
+    '''
+    prompt = '''
+    You are a Planner Agent preparing a technical blueprint together with other planners, each of whom will write one section of it in parallel.
+    Given a set of high-level goals, write only the shared outline they all have to follow:
+    - the overall architecture style and its main components
+    - the chosen languages, frameworks, databases and hosting/deployment targets
+    - the external APIs and services to be used
+    - the project phases
+    Keep it under 200 words of terse bullet points, with no explanations. Every decision you make here is binding for all sections, so be specific.
+    '''
+    return prompt
+
+
+def planner_section_backstory(number: int, title: str, instructions: str):
+    '''
+    prompt for one section of a sectioned blueprint
+    '''
+    prompt = f'''
+    You are a Planner Agent transforming high-level goals into a comprehensive technical blueprint for AI, Full Stack or Data Engineering systems.
+    The blueprint is written section by section by several planners in parallel, all following the same outline. You write only section {number}, "{title}":
+    {instructions}
+
+    Rules
+    - Stay strictly within this section, the other sections are covered by other planners.
+    - Follow the outline's architecture and technology choices, do not introduce alternatives.
+    - Do not repeat the section heading, start directly with its content.
+    - Use clear sub-headings, bullet points and tables; be exhaustive, implementation-ready and to the point.
+    '''
+    return prompt
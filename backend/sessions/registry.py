@@ -0,0 +1,208 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# sessions idle for longer than this are dropped by expire_idle()
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+# a claim older than this is treated as left behind by a crashed worker and can be taken over
+SESSION_CLAIM_TIMEOUT = float(os.getenv("SESSION_CLAIM_TIMEOUT", "900"))
+
+
+class SessionNotFound(KeyError):
+    '''
+    raised when a run_id does not belong to any active session
+    '''
+
+
+class SessionBusy(RuntimeError):
+    '''
+    raised when a request arrives for a session that is still serving a previous request
+    '''
+
+
+@dataclass
+class Session:
+    '''
+    book-keeping for one workflow run, thread_id doubles as the langgraph thread
+    '''
+    thread_id: str
+    created_at: float = field(default_factory=time.time)
+    last_touched: float = field(default_factory=time.time)
+    busy: bool = False
+
+    def config(self) -> dict:
+        return {"configurable": {"thread_id": self.thread_id}}
+
+
+class SessionRegistry:
+    '''
+    tracks active sessions so every user gets an isolated langgraph thread.
+    the registry lock is only held for dict access, never across a graph call,
+    so sessions never wait on each other.
+    '''
+
+    def __init__(self, idle_ttl: float = SESSION_IDLE_TTL):
+        self.idle_ttl = idle_ttl
+        self._sessions: Dict[str, Session] = {}
+        self._lock = threading.Lock()
+
+    def create(self) -> Session:
+        session = Session(thread_id=uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.thread_id] = session
+        return session
+
+    def get(self, thread_id: str) -> Session:
+        with self._lock:
+            session = self._sessions.get(thread_id)
+        if session is None:
+            raise SessionNotFound(thread_id)
+        return session
+
+    def touch(self, thread_id: str) -> Session:
+        session = self.get(thread_id)
+        session.last_touched = time.time()
+        return session
+
+    @contextmanager
+    def claim(self, thread_id: str):
+        '''
+        marks the session busy for the duration of one request. a second request on the
+        same thread is rejected instead of racing the first one on the checkpointer.
+        '''
+        with self._lock:
+            session = self._sessions.get(thread_id)
+            if session is None:
+                raise SessionNotFound(thread_id)
+            if session.busy:
+                raise SessionBusy(thread_id)
+            session.busy = True
+            session.last_touched = time.time()
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.busy = False
+                session.last_touched = time.time()
+
+    def close(self, thread_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._sessions.pop(thread_id, None)
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        '''
+        drops sessions that were not touched within idle_ttl, returns their thread ids
+        '''
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [
+                thread_id for thread_id, session in self._sessions.items()
+                if not session.busy and now - session.last_touched > self.idle_ttl
+            ]
+            for thread_id in expired:
+                del self._sessions[thread_id]
+        return expired
+
+    def active(self) -> List[Session]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+class SqliteSessionRegistry:
+    '''
+    same interface as SessionRegistry, backed by a sqlite table so every uvicorn worker on
+    the host sees the same sessions. claims are a single conditional UPDATE, so two
+    workers can never serve the same session at once.
+    '''
+
+    def __init__(self, path: str, idle_ttl: float = SESSION_IDLE_TTL, claim_timeout: float = SESSION_CLAIM_TIMEOUT):
+        self.idle_ttl = idle_ttl
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (thread_id TEXT PRIMARY KEY, created_at REAL NOT NULL, "
+            "last_touched REAL NOT NULL, claimed_at REAL)"
+        )
+
+    def _execute(self, query: str, params: tuple = ()):
+        with self._lock:
+            return self.conn.execute(query, params)
+
+    def create(self) -> Session:
+        session = Session(thread_id=uuid.uuid4().hex)
+        self._execute(
+            "INSERT INTO sessions VALUES (?, ?, ?, NULL)",
+            (session.thread_id, session.created_at, session.last_touched),
+        )
+        return session
+
+    def get(self, thread_id: str) -> Session:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT thread_id, created_at, last_touched, claimed_at FROM sessions WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        if row is None:
+            raise SessionNotFound(thread_id)
+        return Session(thread_id=row[0], created_at=row[1], last_touched=row[2], busy=row[3] is not None)
+
+    def touch(self, thread_id: str) -> Session:
+        now = time.time()
+        if self._execute("UPDATE sessions SET last_touched = ? WHERE thread_id = ?", (now, thread_id)).rowcount == 0:
+            raise SessionNotFound(thread_id)
+        return self.get(thread_id)
+
+    @contextmanager
+    def claim(self, thread_id: str):
+        now = time.time()
+        claimed = self._execute(
+            "UPDATE sessions SET claimed_at = ?, last_touched = ? WHERE thread_id = ? "
+            "AND (claimed_at IS NULL OR claimed_at < ?)",
+            (now, now, thread_id, now - self.claim_timeout),
+        ).rowcount
+        if not claimed:
+            self.get(thread_id)  # raises SessionNotFound for unknown ids
+            raise SessionBusy(thread_id)
+        try:
+            yield self.get(thread_id)
+        finally:
+            self._execute(
+                "UPDATE sessions SET claimed_at = NULL, last_touched = ? WHERE thread_id = ? AND claimed_at = ?",
+                (time.time(), thread_id, now),
+            )
+
+    def close(self, thread_id: str) -> Optional[Session]:
+        try:
+            session = self.get(thread_id)
+        except SessionNotFound:
+            return None
+        self._execute("DELETE FROM sessions WHERE thread_id = ?", (thread_id,))
+        return session
+
+    def expire_idle(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        with self._lock:
+            # RETURNING keeps the select and delete atomic when several workers expire at once
+            rows = self.conn.execute(
+                "DELETE FROM sessions WHERE claimed_at IS NULL AND last_touched < ? RETURNING thread_id",
+                (now - self.idle_ttl,),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def active(self) -> List[Session]:
+        with self._lock:
+            rows = self.conn.execute("SELECT thread_id, created_at, last_touched, claimed_at FROM sessions").fetchall()
+        return [Session(thread_id=r[0], created_at=r[1], last_touched=r[2], busy=r[3] is not None) for r in rows]
+
+    def __len__(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
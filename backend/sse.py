@@ -0,0 +1,114 @@
+import os
+import json
+import asyncio
+from typing import AsyncIterator, List, Tuple
+
+# consecutive tokens are sent as one frame once the oldest of them is this old, or earlier
+# when they reach SSE_FLUSH_BYTES; 0 sends every token as its own frame
+SSE_FLUSH_MS = float(os.getenv("SSE_FLUSH_MS", "50"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "4096"))
+
+_stats = {"streams": 0, "events": 0, "frames": 0, "bytes": 0}
+_END = object()
+_FLUSH = object()
+
+
+def frame(event_id: int, event: str, data: dict) -> str:
+    # json.dumps escapes newlines, so the payload always fits one data line
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def sse_stream(
+    events: AsyncIterator[Tuple[str, dict]],
+    flush_ms: float = SSE_FLUSH_MS,
+    flush_bytes: int = SSE_FLUSH_BYTES,
+) -> AsyncIterator[str]:
+    '''
+    turns (event, data) pairs into server-sent events frames with increasing ids. "token"
+    events are buffered and merged into one {"token": ...} frame, any other event first
+    flushes the buffer so the order of the text is kept.
+
+    the source runs as its own task feeding a queue: the flush timer must fire while it
+    waits on the model, and the source keeps one context for the contextvars it sets. the
+    timer is a loop callback posting to the same queue, so a buffered token costs no more
+    than a framed one.
+    '''
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            async for item in events:
+                queue.put_nowait(item)
+        finally:
+            queue.put_nowait(_END)
+
+    producer = asyncio.ensure_future(produce())
+    pending: List[str] = []
+    size = 0
+    # the armed flush timer, and the number that tells its queue entry from ones of
+    # timers cancelled after they fired
+    timer = None
+    generation = 0
+    next_id = 0
+    _stats["streams"] += 1
+
+    def emit(event: str, data: dict) -> str:
+        nonlocal next_id
+        next_id += 1
+        text = frame(next_id, event, data)
+        _stats["frames"] += 1
+        _stats["bytes"] += len(text)
+        return text
+
+    def flush() -> str:
+        nonlocal size, timer, generation
+        if timer is not None:
+            timer.cancel()
+            timer = None
+            generation += 1
+        text = "".join(pending)
+        pending.clear()
+        size = 0
+        return emit("token", {"token": text})
+
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                break
+            event, data = item
+            if event is _FLUSH:
+                if data == generation and pending:
+                    yield flush()
+                continue
+            _stats["events"] += 1
+            if event == "token":
+                pending.append(data["token"])
+                size += len(data["token"].encode())
+                if size >= flush_bytes or flush_ms <= 0:
+                    yield flush()
+                elif timer is None:
+                    timer = loop.call_later(flush_ms / 1000, queue.put_nowait, (_FLUSH, generation))
+                continue
+            if pending:
+                yield flush()
+            yield emit(event, data)
+        if pending:
+            yield flush()
+        # re-raises what ended the source
+        await producer
+    finally:
+        # the client went away, the graph run stops with the stream
+        producer.cancel()
+        if timer is not None:
+            timer.cancel()
+
+
+def stats() -> dict:
+    streams, frames = _stats["streams"], _stats["frames"]
+    return {
+        **_stats,
+        "events_per_frame": round(_stats["events"] / frames, 2) if frames else 0.0,
+        "frames_per_stream": round(frames / streams, 2) if streams else 0.0,
+    }
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+# settings are read on import, so they are set before any backend module is imported:
+# the fake model answers offline after FAKE_LLM_LATENCY, sessions and checkpoints stay in memory
+os.environ.update({
+    "LLM_PROVIDER": "fake",
+    "FAKE_LLM_LATENCY": os.getenv("FAKE_LLM_LATENCY", "0.2"),
+    "CHECKPOINT_BACKEND": "memory",
+    "SESSION_BACKEND": "memory",
+    "CHECKPOINT_DB": os.path.join(tempfile.mkdtemp(), "checkpoints.db"),
+    "LLM_CACHE": "false",
+    "QUERY_CACHE": "false",
+    "SPECULATIVE_PLANNER": "false",
+})
+# modules are imported the way uvicorn imports them with cwd=backend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from graphs import orchestrator
+
+
+class RecordingIndex:
+    def __init__(self):
+        self.lookups = []
+        self.added = []
+
+    def lookup(self, query):
+        self.lookups.append(query)
+        return None
+
+    def add(self, query, output):
+        self.added.append(query)
+
+
+def run_architect(state: dict, keep_turns: int) -> RecordingIndex:
+    index = RecordingIndex()
+    saved = orchestrator.QUERY_CACHE, orchestrator.get_query_index, orchestrator.history_manager.keep_turns
+    orchestrator.QUERY_CACHE, orchestrator.get_query_index = True, lambda: index
+    orchestrator.history_manager.keep_turns = keep_turns
+    try:
+        node = RunnableLambda(orchestrator.architect_node)
+        asyncio.run(node.ainvoke(state, {"configurable": {"thread_id": "thread"}}))
+    finally:
+        orchestrator.QUERY_CACHE, orchestrator.get_query_index, orchestrator.history_manager.keep_turns = saved
+    return index
+
+
+def test_opening_request_uses_the_query_cache():
+    index = run_architect({"user_response": "a task tracker with sync"}, keep_turns=4)
+    assert index.lookups == ["a task tracker with sync"]
+    assert index.added == ["a task tracker with sync"]
+
+
+def test_fully_compacted_history_is_not_a_first_turn():
+    # keep_turns=0 folds every stored turn into the summary before the agent runs
+    history = [HumanMessage("a task tracker", id="h1"), AIMessage("## goals\n- tasks", id="a1")]
+    index = run_architect({"user_response": "also support offline mode", "architect_messages": history}, keep_turns=0)
+    assert index.lookups == []
+    assert index.added == []
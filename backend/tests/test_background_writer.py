@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import pytest
+from langgraph.checkpoint.base import empty_checkpoint
+
+from persistence.sqlite_saver import SqliteSaver, CheckpointConflict
+from persistence.background_writer import BackgroundWriter
+
+
+def put(saver, parent_id, checkpoint_id):
+    checkpoint = {**empty_checkpoint(), "id": checkpoint_id}
+    config = {"configurable": {"thread_id": "thread", "checkpoint_ns": "", "checkpoint_id": parent_id}}
+    return saver.put(config, checkpoint, {}, {})
+
+
+def test_failed_write_is_raised_on_the_threads_next_call():
+    saver = SqliteSaver(os.path.join(tempfile.mkdtemp(), "checkpoints.db"))
+    writer = BackgroundWriter(saver)
+    put(writer, None, "1")
+    put(writer, "1", "3")
+    writer.wait("thread")
+    # written on top of 1 after another worker already moved the thread to 3
+    put(writer, "1", "2")
+    writer.wait("thread")
+    assert writer.stats()["failed_writes"] == 1
+
+    config = {"configurable": {"thread_id": "thread", "checkpoint_ns": ""}}
+    with pytest.raises(CheckpointConflict):
+        writer.get_tuple(config)
+    # reported once, the thread goes on from the checkpoint that did land
+    assert writer.get_tuple(config).checkpoint["id"] == "3"
+    writer.close()
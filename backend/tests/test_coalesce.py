@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+
+from langchain_core.messages import HumanMessage
+
+from agents import coalesce, deadlines
+from agents.fake import FakeChatModel, FakeProviderError
+from agents.coalesce import CoalescingChatModel
+from agents.scheduler import LLMScheduler, estimate_tokens
+
+
+def model(scheduler=None, **params) -> CoalescingChatModel:
+    inner = FakeChatModel(**{"latency": 0.05, "tokens_per_second": 400, "response_tokens": 40, **params})
+    return CoalescingChatModel(inner=inner, scheduler=scheduler)
+
+
+def test_follower_outlives_the_caller_that_started_the_stream():
+    llm = model()
+    messages = [HumanMessage("outline a task tracker")]
+
+    async def run():
+        async def read(limit=None):
+            text = ""
+            async for chunk in llm.astream(messages):
+                text += chunk.content
+                if limit is not None and len(text.split()) >= limit:
+                    # walks away mid-answer, like a client that disconnected
+                    break
+            return text
+
+        first = asyncio.ensure_future(read(limit=5))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(read())
+        return await first, await second
+
+    first, second = asyncio.run(run())
+    assert len(first.split()) < 40
+    assert second.startswith("Answer 1 ")
+    assert len(second.split()) == 40
+    assert coalesce.stats()["in_flight"] == 0
+
+
+def test_call_is_cancelled_once_every_caller_left():
+    llm = model(latency=5)
+    messages = [HumanMessage("outline a chat app")]
+
+    async def run():
+        callers = [asyncio.ensure_future(llm.ainvoke(messages)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert coalesce.stats()["in_flight"] == 1
+        for caller in callers[:2]:
+            caller.cancel()
+        await asyncio.sleep(0.05)
+        # one caller is still waiting, the call goes on
+        assert coalesce.stats()["in_flight"] == 1
+        callers[2].cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.05)
+        return coalesce.stats()["in_flight"]
+
+    assert asyncio.run(run()) == 0
+
+
+def test_failed_and_abandoned_calls_settle_their_tickets():
+    scheduler = LLMScheduler()
+    failing = model(scheduler, error_rate=1.0)
+    slow = model(scheduler, latency=5)
+
+    async def run():
+        with contextlib.suppress(FakeProviderError):
+            await failing.ainvoke([HumanMessage("outline a wiki")])
+        call = asyncio.ensure_future(slow.ainvoke([HumanMessage("outline a blog")]))
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["in_flight"] == 1
+        call.cancel()
+        await asyncio.gather(call, return_exceptions=True)
+        await asyncio.sleep(0.05)
+
+    with contextlib.suppress(FakeProviderError):
+        failing.invoke([HumanMessage("outline a forum")])
+    asyncio.run(run())
+    assert scheduler.granted["interactive"] == 3
+    assert scheduler.stats()["in_flight"] == 0
+
+
+class SlowFirstCall(FakeChatModel):
+    def _first_token_delay(self) -> float:
+        # the first request hangs, its hedged duplicate answers at once
+        return 5.0 if self._calls == 1 else 0.01
+
+
+class ChargeRecorder(LLMScheduler):
+    def release(self, tokens):
+        self.charged = getattr(self, "charged", 0) + (tokens or 0)
+        super().release(tokens)
+
+
+def test_hedged_call_charges_only_the_answer_used():
+    scheduler = ChargeRecorder()
+    llm = CoalescingChatModel(inner=SlowFirstCall(), scheduler=scheduler, hedge=True)
+    messages = [HumanMessage("outline a calendar")]
+    for _ in range(deadlines.LLM_HEDGE_MIN_SAMPLES):
+        deadlines.latencies.record(llm._latency_key(None, {}), 0.01)
+
+    answer = asyncio.run(llm.ainvoke(messages))
+
+    estimate = estimate_tokens(coalesce._prompt_text(messages))
+    assert scheduler.granted["interactive"] == 2
+    assert scheduler.stats()["in_flight"] == 0
+    # two estimates reserved, corrected down to the one answer that was used
+    assert 2 * estimate + scheduler.charged == answer.usage_metadata["total_tokens"]
@@ -0,0 +1,18 @@
+import asyncio
+from unittest import mock
+
+from agents import factory
+
+
+def test_model_configurations_share_one_async_client():
+    # a placeholder key, clients are built but nothing is sent
+    with mock.patch.object(factory, "LLM_PROVIDER", "google"), mock.patch.object(factory, "_models", {}), \
+            mock.patch.dict("os.environ", {"GOOGLE_API_KEY": "placeholder"}):
+        async def build():
+            models = [factory.get_llm(model) for model in ("gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.5-pro")]
+            models.append(factory.get_llm("gemini-2.5-flash", temperature=0.7))
+            return {id(model.client) for model in models}, {id(model.async_client) for model in models}
+
+        sync_clients, async_clients = asyncio.run(build())
+    assert len(sync_clients) == 1
+    assert len(async_clients) == 1
@@ -0,0 +1,48 @@
+import json
+import asyncio
+
+import httpx
+
+import main
+from agents import cache, factory
+from agents.cache import TieredLLMCache
+from graphs.orchestrator import graph_invoker
+
+main.graph = graph_invoker()
+
+
+def token_text(body: str) -> str:
+    text = ""
+    for block in body.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if lines.get("event") == "token":
+            text += json.loads(lines["data"])["token"]
+    return text
+
+
+async def planner_turn(http: httpx.AsyncClient) -> str:
+    response = await http.post("/workflow/start", json={"initial_query": "a task tracker with sync"})
+    thread_id = response.json()["thread_id"]
+    await http.post("/workflow/architect_review", json={"run_id": thread_id, "query": "also support offline mode"})
+    response = await http.post("/workflow/chat", json={"run_id": thread_id, "query": "approve"})
+    assert response.status_code == 200, response.text
+    return token_text(response.text)
+
+
+def test_repeated_chat_turn_streams_the_cached_answer():
+    saved = factory.LLM_CACHE, cache._cache
+    factory.LLM_CACHE, cache._cache = True, TieredLLMCache(path=None)
+    # the managed models and agents are rebuilt on the cache
+    factory._managed.clear(), factory._agents.clear()
+    try:
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test", timeout=60) as http:
+                return await planner_turn(http), await planner_turn(http)
+
+        first, second = asyncio.run(run())
+        assert cache._cache.stats()["memory_hits"] > 0
+    finally:
+        factory.LLM_CACHE, cache._cache = saved
+        factory._managed.clear(), factory._agents.clear()
+    assert first
+    assert second == first
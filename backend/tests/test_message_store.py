@@ -0,0 +1,60 @@
+import os
+import json
+import tempfile
+import contextlib
+from unittest import mock
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.memory import InMemorySaver
+
+from persistence import message_store
+from persistence.message_store import LIST_TYPE, ContentAddressedSerializer, MemoryMessageStore, SqliteMessageStore, sweep_message_store
+from persistence.sqlite_saver import CheckpointConflict, SqliteSaver
+
+
+def history(turns: int) -> list:
+    messages = []
+    for turn in range(turns):
+        messages += [HumanMessage(f"revision {turn}", id=f"h{turn}"), AIMessage(f"## goals\n- case {turn}", id=f"a{turn}")]
+    return messages
+
+
+def test_grown_history_stores_only_the_new_messages():
+    serde = ContentAddressedSerializer(MemoryMessageStore())
+    for turns in range(1, 30):
+        type_, head = serde.dumps_typed(history(turns))
+    _, node = serde.store.get(head.decode())
+    base, tail = json.loads(node)
+    # one node per turn, holding that turn's two messages on top of the previous history
+    assert type_ == LIST_TYPE
+    assert len(tail) == 2 and base is not None
+    loaded = serde.loads_typed((type_, head))
+    assert [(m.id, m.content) for m in loaded] == [(m.id, m.content) for m in history(29)]
+
+
+def test_sweep_keeps_the_chain_of_a_stored_history():
+    saver = InMemorySaver(serde=ContentAddressedSerializer(MemoryMessageStore()))
+    serde = saver.serde
+    for turns in range(1, 5):
+        serde.dumps_typed(history(turns))
+    kept = serde.dumps_typed(history(5))
+    # only the latest history is still stored, the lists written for the earlier ones share its chain
+    saver.blobs[("thread", "", "architect_messages", "1")] = kept
+    serde.dumps_typed([HumanMessage("abandoned", id="x")])
+    with mock.patch.object(message_store, "MESSAGE_TOUCH_INTERVAL", -1):
+        sweep_message_store(saver)
+    assert [m.content for m in serde.loads_typed(kept)] == [m.content for m in history(5)]
+    # the abandoned list and its message are gone, the history's nodes and ten messages are not
+    assert len(serde.store) == 5 + 10
+
+
+def test_rows_of_a_rolled_back_transaction_are_written_again():
+    path = os.path.join(tempfile.mkdtemp(), "checkpoints.db")
+    saver = SqliteSaver(path)
+    saver.serde = ContentAddressedSerializer(SqliteMessageStore(path, conn=saver.conn, lock=saver.lock))
+    # a background writer group that failed, e.g. on a CheckpointConflict
+    with contextlib.suppress(CheckpointConflict), saver.transaction():
+        saver.serde.dumps_typed(history(2))
+        raise CheckpointConflict("thread moved on in another worker")
+    stored = saver.serde.dumps_typed(history(2))
+    assert [m.content for m in saver.serde.loads_typed(stored)] == [m.content for m in history(2)]
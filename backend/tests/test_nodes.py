@@ -0,0 +1,12 @@
+from agents import factory
+from graphs import orchestrator
+
+
+def test_node_modules_keep_the_orchestrators_agents():
+    specs = {name: dict(factory._specs[name]) for name in ("architect", "planner")}
+    import nodes.architect  # noqa: F401
+    import nodes.planner  # noqa: F401
+
+    assert factory._specs["architect"]["response_format"].schema is orchestrator.ArchitectOutput
+    for name, spec in specs.items():
+        assert factory._specs[name] == spec
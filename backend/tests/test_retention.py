@@ -0,0 +1,77 @@
+import os
+import time
+import asyncio
+import tempfile
+import threading
+
+from langgraph.types import Command
+from langgraph.checkpoint.base.id import uuid6
+
+from graphs.orchestrator import graph_invoker
+from persistence.memory_saver import LockedMemorySaver
+from persistence.retention import RetentionPolicy, checkpoint_id_at, checkpoint_time, prune
+from persistence.sqlite_saver import SqliteSaver
+
+
+def review(checkpointer, thread_id: str, revisions: int):
+    graph = graph_invoker(checkpointer=checkpointer)
+    config = {"configurable": {"thread_id": thread_id}}
+
+    async def run():
+        await graph.ainvoke({"user_response": "a task tracker"}, config)
+        for revision in range(revisions):
+            await graph.ainvoke(Command(resume=f"revision {revision}"), config)
+
+    asyncio.run(run())
+    return graph, config
+
+
+class CountingSqliteSaver(SqliteSaver):
+    def __init__(self, path):
+        super().__init__(path)
+        self.decoded = 0
+        loads_typed = self.serde.loads_typed
+
+        def counting(data):
+            self.decoded += 1
+            return loads_typed(data)
+
+        self.serde.loads_typed = counting
+
+
+def test_checkpoint_ids_carry_their_creation_time():
+    before = time.time()
+    checkpoint_id = str(uuid6(clock_seq=1))
+    assert abs(checkpoint_time(checkpoint_id) - before) < 1
+    assert checkpoint_id_at(before - 1) < checkpoint_id < checkpoint_id_at(before + 1)
+
+
+def test_sqlite_prune_decodes_only_the_checkpoints_it_keeps():
+    saver = CountingSqliteSaver(os.path.join(tempfile.mkdtemp(), "checkpoints.db"))
+    graph, config = review(saver, "long", revisions=2)
+    review(saver, "short", revisions=0)
+    count = lambda thread_id: saver.conn.execute("SELECT COUNT(*) FROM checkpoints WHERE thread_id = ?", (thread_id,)).fetchone()[0]
+    assert count("short") <= 3 < count("long")
+
+    saver.decoded = 0
+    expired = count("long") - 3
+    assert prune(saver, RetentionPolicy(keep_last=3)) == expired
+    assert count("long") == 3 and count("short") <= 3
+    # the short thread was skipped in sql, of the long one only the kept checkpoints were read
+    assert saver.decoded == 3
+    assert asyncio.run(graph.aget_state(config)).values["architect_response"]
+
+
+def test_memory_prune_waits_for_the_savers_lock():
+    saver = LockedMemorySaver()
+    review(saver, "thread", revisions=1)
+    pruned = []
+    with saver.lock:
+        worker = threading.Thread(target=lambda: pruned.append(prune(saver, RetentionPolicy(keep_last=1))))
+        worker.start()
+        worker.join(0.1)
+        # the compactor thread must not touch the dicts while the graph is writing
+        assert worker.is_alive() and not pruned
+    worker.join()
+    assert pruned[0] > 0
+    assert len(saver.storage["thread"][""]) == 1
@@ -0,0 +1,17 @@
+import time
+
+from agents.deadlines import deadline
+from agents.router import ModelRouter
+
+
+def test_slow_tier_is_tried_again_once_its_samples_age_out():
+    router = ModelRouter(routes={"planner": "large"}, min_samples=3, sample_ttl=0.1)
+    for _ in range(3):
+        router.observe("planner", "large", 60.0)
+
+    with deadline(30):
+        assert router.pick("planner") == "standard"
+        # no call went to the large tier since, its stale p95 must not hold it out for good
+        time.sleep(0.15)
+        assert router.pick("planner") == "large"
+    assert router.stats()["planner"]["decisions"] == {"latency": 1, "configured": 1}
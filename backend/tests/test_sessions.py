@@ -0,0 +1,83 @@
+import json
+import time
+import asyncio
+
+import httpx
+
+import main
+from graphs.orchestrator import graph_invoker
+
+# the startup hook also renders the graph png, which needs the network
+main.graph = graph_invoker()
+
+
+def client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test", timeout=60)
+
+
+async def review_session(http: httpx.AsyncClient, index: int):
+    response = await http.post("/workflow/start", json={"initial_query": f"service {index}: a task tracker with sync"})
+    assert response.status_code == 200, response.text
+    thread_id = response.json()["thread_id"]
+    response = await http.post("/workflow/architect_review", json={"run_id": thread_id, "query": "also support offline mode"})
+    assert response.status_code == 200, response.text
+    return thread_id
+
+
+async def timed_sessions(count: int) -> float:
+    async with client() as http:
+        started = time.perf_counter()
+        thread_ids = await asyncio.gather(*(review_session(http, i) for i in range(count)))
+        elapsed = time.perf_counter() - started
+    assert len(set(thread_ids)) == count
+    return elapsed
+
+
+def test_throughput_grows_with_sessions():
+    asyncio.run(timed_sessions(1))
+    single = asyncio.run(timed_sessions(1))
+    parallel = asyncio.run(timed_sessions(16))
+    # 16 sessions one after another would take 16x as long, in parallel they overlap
+    assert parallel < 4 * single, (single, parallel)
+
+
+def test_busy_session_is_rejected():
+    async def run():
+        async with client() as http:
+            response = await http.post("/workflow/start", json={"initial_query": "a chat app"})
+            thread_id = response.json()["thread_id"]
+            first = asyncio.ensure_future(http.post("/workflow/architect_review", json={"run_id": thread_id, "query": "add search"}))
+            # the first review is still waiting on the model
+            await asyncio.sleep(0.05)
+            second = await http.post("/workflow/architect_review", json={"run_id": thread_id, "query": "add search"})
+            return (await first).status_code, second.status_code
+
+    first, second = asyncio.run(run())
+    assert first == 200
+    assert second == 409
+
+
+def frames(body: str) -> list:
+    parsed = []
+    for block in body.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in lines:
+            parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+def test_architect_turn_streams_its_items():
+    async def run():
+        async with client() as http:
+            response = await http.post("/workflow/start", json={"initial_query": "a task tracker"})
+            thread_id = response.json()["thread_id"]
+            response = await http.post("/workflow/chat", json={"run_id": thread_id, "query": "also support offline mode"})
+            state = await main.graph.aget_state({"configurable": {"thread_id": thread_id}})
+            return frames(response.text), state.values["architect_response"]
+
+    events, architect_response = asyncio.run(run())
+    items = [data for event, data in events if event == "item"]
+    assert [(item["field"], item["index"]) for item in items] == [("project_goals", i) for i in range(3)] + [("follow_up_questions", i) for i in range(3)]
+    # the items' markdown adds up to the rendered review, sent once
+    assert "".join(data["token"] for event, data in events if event in ("item", "token")) == architect_response
+    assert events[-1][0] == "done"
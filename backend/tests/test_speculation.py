@@ -0,0 +1,94 @@
+import os
+import asyncio
+import tempfile
+
+from langchain_core.runnables import RunnableLambda
+
+from graphs import orchestrator
+from graphs.speculation import Speculation, SpeculativePlanner, SqliteRunLedger
+
+
+def workers(count: int, **params):
+    # planners of separate uvicorn workers, sharing one sessions db
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    return [SpeculativePlanner(5, ledger=SqliteRunLedger(path), **params) for _ in range(count)]
+
+
+def test_run_released_by_another_worker_is_reaped():
+    first, second = workers(2)
+
+    async def run():
+        speculation = first.start("thread", "plan a task tracker")
+        # the feedback reaches the other worker, which has no run to cancel itself
+        assert not second.cancel("thread")
+        assert first.reap() == 1
+        await asyncio.gather(speculation.task, return_exceptions=True)
+        return speculation.task.cancelled()
+
+    assert asyncio.run(run())
+    assert first.stats()["orphaned"] == 1
+    assert first.stats()["running"] == 0
+
+
+def test_run_taken_over_by_another_worker_is_reaped():
+    first, second = workers(2)
+
+    async def run():
+        first.start("thread", "plan a task tracker")
+        second.start("thread", "plan a task tracker with sync")
+        # the run of the worker that served the latest architect turn stays
+        return first.reap(), second.reap()
+
+    assert asyncio.run(run()) == (1, 0)
+
+
+def test_untaken_run_expires():
+    (planner,) = workers(1, ttl=0)
+
+    async def run():
+        planner.start("thread", "plan a task tracker")
+        return planner.reap()
+
+    assert asyncio.run(run()) == 1
+
+
+def test_failed_replay_is_reset_before_the_planner_runs():
+    request = orchestrator.blueprint_request("## goals\n- a task tracker\n## questions\n")
+
+    async def run():
+        speculation = Speculation(request)
+
+        async def fail_half_way():
+            # what Speculation.run leaves behind when the model fails mid-answer
+            try:
+                await speculation._chunk("# Plan\n")
+                await asyncio.sleep(0.05)
+                await speculation._chunk("1. set up")
+                raise RuntimeError("speculative run failed")
+            except RuntimeError as e:
+                speculation.error = e
+                raise
+            finally:
+                speculation.finished = True
+                await speculation._notify()
+
+        speculation.task = asyncio.ensure_future(fail_half_way())
+        orchestrator.speculative_planner._runs["thread"] = speculation
+
+        node = RunnableLambda(orchestrator.planner_node)
+        state = {"agent_node": "architect", "architect_response": "## goals\n- a task tracker\n## questions\n"}
+        events = []
+        async for event in node.astream_events(state, {"configurable": {"thread_id": "thread"}}, version="v2"):
+            if event["event"] == "on_custom_event":
+                events.append((event["name"], event["data"]))
+        return events
+
+    enabled = orchestrator.SPECULATIVE_PLANNER
+    orchestrator.SPECULATIVE_PLANNER = True
+    try:
+        events = asyncio.run(run())
+    finally:
+        orchestrator.SPECULATIVE_PLANNER = enabled
+    replayed = [data["token"] for name, data in events[:2]]
+    assert replayed == ["# Plan\n", "1. set up"]
+    assert events[2] == ("planner_reset", {"discard": len("# Plan\n1. set up")})
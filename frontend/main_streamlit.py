@@ -16,16 +16,6 @@ if "thread_id" not in st.session_state:
 if "agent_node" not in st.session_state:
     st.session_state.agent_node = None
 
-if 'architect' not in st.session_state:
-    st.session_state.architect = None
-
-if 'planner' not in st.session_state:
-    st.session_state.planner = None
-
-if st.session_state.architect is None:
-    st.session_state.architect = True
-    st.session_state.planner = False
-
 st.title("Chatbot Application")
 
 # Display chat history
@@ -39,10 +29,6 @@ if prompt := st.chat_input("Type your message here..."):
     with st.chat_message("user"):
         st.markdown(prompt)
     
-    if prompt=="approve" and st.session_state.architect:
-        st.session_state.planner = True
-        st.session_state.architect = False
-
     # Add to history
     st.session_state.messages.append({"role": "user", "content": prompt})
     
@@ -72,29 +58,9 @@ if prompt := st.chat_input("Type your message here..."):
                 st.session_state.agent_node = agent_node
             except requests.exceptions.RequestException as e:
                 st.error(f"Error starting workflow: {str(e)}")
-    elif st.session_state.thread_id is not None and st.session_state.architect:
-        # Continue the architect review workflow
-        payload = {"run_id": st.session_state.thread_id, "query": prompt}
-        endpoint = f"{BACKEND_BASE}/workflow/architect_review"
-        with st.spinner("Continuing architect review..."):
-            try:
-                response = requests.post(endpoint, json=payload)
-                response.raise_for_status()
-                data = response.json()
-                agent_output = data.get("agent_output")
-                agent_instruction = data.get("agent_instruction")
-                agent_node = data.get("agent_node")
-                if agent_output:
-                    with st.chat_message("assistant"):
-                        st.markdown(agent_output)
-                    st.session_state.messages.append({"role": "assistant", "content": agent_output})
-                if agent_instruction:
-                    st.info(f"Agent instruction: {agent_instruction}")
-                st.session_state.agent_node = agent_node
-            except requests.exceptions.RequestException as e:
-                st.error(f"Error continuing architect review: {str(e)}")
     else:
-        # Continue an existing workflow (NOW WITH STREAMING)
+        # Continue an existing workflow (NOW WITH STREAMING). architect reviews stream too,
+        # their goals and questions arrive one by one as "item" frames
         payload = {"run_id": st.session_state.thread_id, "query": prompt}
         endpoint = f"{BACKEND_BASE}/workflow/chat"
         
@@ -108,28 +74,46 @@ if prompt := st.chat_input("Type your message here..."):
                 with requests.post(endpoint, json=payload, stream=True, timeout=600) as response:
                     response.raise_for_status()
                     
-                    # Iterate over the response line by line
+                    # Server-sent events: "event:" / "data:" lines, a blank line ends a frame.
+                    # Token frames carry several tokens at once, so we re-render once per frame
+                    event, data_lines = "message", []
                     for line in response.iter_lines():
+                        line = line.decode('utf-8')
                         if line:
-                            try:
-                                # Decode the line and parse the JSON
-                                data_str = line.decode('utf-8')
-                                data = json.loads(data_str)
-                                
-                                if "error" in data:
-                                    st.error(f"Backend error: {data['error']}")
-                                    full_response = f"Backend error: {data['error']}"
-                                    break
-                                
-                                token = data.get("token")
-                                if token:
-                                    full_response += token
-                                    # Update the placeholder with the accumulating response
-                                    placeholder.markdown(full_response + "▌") # ▌ adds a cursor
-                                    
-                            except json.JSONDecodeError:
-                                # Skip lines that aren't valid JSON
-                                pass
+                            field, _, value = line.partition(":")
+                            if field == "event":
+                                event = value.strip()
+                            elif field == "data":
+                                data_lines.append(value[1:] if value.startswith(" ") else value)
+                            continue
+                        if not data_lines:
+                            continue
+                        kind, data_str = event, "\n".join(data_lines)
+                        event, data_lines = "message", []
+                        try:
+                            data = json.loads(data_str)
+                        except json.JSONDecodeError:
+                            # Skip frames that aren't valid JSON
+                            continue
+
+                        if kind == "error":
+                            st.error(f"Backend error: {data['error']}")
+                            full_response = f"Backend error: {data['error']}"
+                            break
+                        if kind == "done":
+                            break
+                        if kind == "reset":
+                            # a pre-generated plan failed half way, its text is replaced by the planner's own
+                            full_response = full_response[:len(full_response) - data["discard"]]
+                            placeholder.markdown(full_response + "▌")
+                            continue
+
+                        # "item" frames (the architect's goals and questions) carry their markdown as a token too
+                        token = data.get("token")
+                        if token:
+                            full_response += token
+                            # Update the placeholder with the accumulating response
+                            placeholder.markdown(full_response + "▌") # ▌ adds a cursor
                                 
             except requests.exceptions.RequestException as e:
                 st.error(f"Error continuing workflow: {str(e)}")